@@ -9,6 +9,10 @@ from __future__ import (absolute_import, division, print_function)
 
 from .ugrid import UGrid
 from .data_set import DataSet 
+from .read_netcdf import inspect_ncfile
+from .write_netcdf import TimeSeriesWriter
+from .ucube import UCube
+from .ensemble import Ensemble
 
 
 # pyugrid version PEP-0440
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+
+"""
+code to read and write the ASCII mesh formats of a few models:
+
+ * SELFE / SCHISM .gr3 (e.g. hgrid.gr3) and ADCIRC fort.14 files,
+   which share a format
+ * SMS .2dm files
+
+The node coordinates and element connectivity are parsed in bulk
+(np.fromstring on whole blocks of lines, or regular expressions over the
+whole file), not line by line, and the 1-based indexes are converted to
+0-based in place.
+
+The depth (the value on each node) becomes a node DataSet.
+
+This code is called by the UGrid class (UGrid.from_gr3, UGrid.save_as_gr3, etc.)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import itertools
+import re
+
+import numpy as np
+
+from .data_set import DataSet
+
+DEPTH_ATTRIBUTES = {'units': 'm',
+                    'positive': 'down',
+                    'standard_name': 'sea_floor_depth_below_geoid',
+                    }
+
+
+def _parse_block(block, num_rows, num_cols, dtype, what):
+    """
+    parse a block of whitespace-separated numbers into a (num_rows, num_cols) array
+    """
+    values = np.fromstring(block, dtype=dtype, sep=' ') if block.strip() else np.zeros((0,), dtype)
+    if values.size != num_rows * num_cols:
+        raise ValueError("Expected %i %s lines of %i values -- could not parse them" %
+                         (num_rows, what, num_cols))
+    return values.reshape(num_rows, num_cols)
+
+
+def _renumber_nodes(ids, connectivity):
+    """
+    convert 1-based node ids in connectivity to 0-based indexes into the
+    nodes, in place. -1 (padding) is left alone.
+
+    :param ids: the id of each node, in the order they are stored
+    """
+    num_nodes = len(ids)
+    if np.array_equal(ids, np.arange(1, num_nodes + 1)):
+        np.subtract(connectivity, 1, out=connectivity, where=connectivity > 0)
+        return connectivity
+    # ids aren't 1..N in order -- look them up
+    sorter = np.argsort(ids)
+    valid = connectivity > 0
+    pos = np.searchsorted(ids, connectivity[valid], sorter=sorter)
+    pos[pos == num_nodes] = 0
+    found = sorter[pos]
+    if not np.array_equal(ids[found], connectivity[valid]):
+        raise ValueError("The elements refer to nodes that are not in the file")
+    connectivity[valid] = found
+    return connectivity
+
+
+def _format_rows(outfile, fmt, columns, drop_zeros=False, chunk_size=2**16):
+    """
+    write rows of numbers, formatting a chunk of rows at a time
+
+    :param fmt: format for one row, e.g. "%d %.17g\\n"
+
+    :param columns: sequence of 1-d arrays, one per column
+
+    :param drop_zeros=False: remove zeros from the ends of the lines
+                             (for padding in rows of different lengths)
+    """
+    table = np.column_stack(columns)
+    for start in range(0, len(table), chunk_size):
+        block = table[start:start + chunk_size]
+        text = (fmt * len(block)) % tuple(block.ravel().tolist())
+        if drop_zeros:
+            while ' 0\n' in text:
+                text = text.replace(' 0\n', '\n')
+        outfile.write(text)
+
+
+def _float_format(dtype):
+    # enough digits to read back exactly
+    return '%.9g' if np.dtype(dtype).itemsize <= 4 else '%.17g'
+
+
+def load_grid_from_gr3(filename, grid, data_name='depth'):
+    """
+    loads a SELFE/SCHISM .gr3 or ADCIRC fort.14 file into the passed-in grid
+
+    :param filename: the file to read
+
+    :param grid: the grid object to put the mesh and data into.
+    :type grid: UGrid object.
+
+    :param data_name='depth': name of the DataSet for the values on the
+                              nodes. (.gr3 files hold other things, too,
+                              e.g. drag.gr3)
+
+    The title (first line) goes in the DataSet's long_name attribute.
+    Any boundary information after the elements is not read.
+    """
+    with open(filename) as infile:
+        title = infile.readline().strip()
+        try:
+            num_elements, num_nodes = [int(n) for n in infile.readline().split()[:2]]
+        except ValueError:
+            raise ValueError("%s doesn't look like a gr3 / fort.14 file" % filename)
+
+        nodes = _parse_block(''.join(itertools.islice(infile, num_nodes)),
+                             num_nodes, 4, np.float64, 'node')
+        lines = list(itertools.islice(infile, num_elements))
+
+    block = ''.join(lines)
+    values = np.fromstring(block, dtype=np.int64, sep=' ') if lines else np.zeros((0,), np.int64)
+    if num_elements == 0:
+        elements = np.zeros((0, 5), dtype=np.int64)
+    elif values.size in (num_elements * 5, num_elements * 6):
+        # all the same shape: id, num_vertices, vertices...
+        elements = values.reshape(num_elements, -1)
+        if not np.all(elements[:, 1] == elements.shape[1] - 2):
+            elements = None
+    else:
+        elements = None
+    if elements is None:
+        # mixed triangles and quads: find where each line starts
+        counts = np.fromiter((len(line.split()) for line in lines), dtype=np.int64,
+                             count=len(lines))
+        if len(lines) != num_elements or counts.sum() != values.size or np.any(counts < 5):
+            raise ValueError("Expected %i element lines -- could not parse them" % num_elements)
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        num_vertices = values[starts + 1]
+        if not np.array_equal(num_vertices, counts - 2):
+            raise ValueError("The number of vertices doesn't match the element lines")
+        faces = np.full((num_elements, num_vertices.max()), -1, dtype=np.int64)
+        for n in np.unique(num_vertices):
+            rows = np.flatnonzero(num_vertices == n)
+            faces[rows, :n] = values[starts[rows, None] + 2 + np.arange(n)]
+    else:
+        faces = elements[:, 2:]
+
+    grid.nodes = nodes[:, 1:3]
+    grid.faces = _renumber_nodes(nodes[:, 0].astype(np.int64), faces)
+    attributes = dict(DEPTH_ATTRIBUTES) if data_name == 'depth' else {}
+    if title:
+        attributes['long_name'] = title
+    grid.add_data(DataSet(data_name, location='node', data=nodes[:, 3],
+                          attributes=attributes))
+
+
+def save_gr3(grid, filename, data_name='depth', title=None):
+    """
+    save a grid as a SELFE/SCHISM .gr3 or ADCIRC fort.14 file
+
+    :param grid: the grid to save
+    :type grid: UGrid object.
+
+    :param filename: the file to write
+
+    :param data_name='depth': the node DataSet to write as the depth.
+                              If the grid doesn't have it, zeros are written.
+
+    :param title=None: the title line -- defaults to the DataSet's long_name
+
+    the boundary section is written with no boundaries
+    """
+    nodes = grid.nodes
+    faces = grid.faces if grid.faces is not None else np.zeros((0, 3), dtype=np.int64)
+    dataset = grid.data.get(data_name)
+    if dataset is None:
+        depth = np.zeros((len(nodes),))
+    else:
+        if dataset.location != 'node':
+            raise ValueError("%s is not on the nodes" % data_name)
+        depth = np.asarray(dataset.data)
+    if title is None:
+        title = dataset.attributes.get('long_name', data_name) if dataset is not None else data_name
+
+    float_fmt = _float_format(nodes.dtype)
+    with open(filename, 'w') as outfile:
+        outfile.write("%s\n" % title)
+        outfile.write("%i %i\n" % (len(faces), len(nodes)))
+        _format_rows(outfile, "%%d %s %s %s\n" % (float_fmt, float_fmt, _float_format(depth.dtype)),
+                     [np.arange(1, len(nodes) + 1), nodes[:, 0], nodes[:, 1], depth])
+
+        valid = faces >= 0
+        ## in mixed meshes, the padding (-1) is written as 0, and dropped
+        vertices = [np.where(valid[:, i], faces[:, i] + 1, 0) for i in range(faces.shape[1])]
+        _format_rows(outfile, "%d %d" + " %d" * faces.shape[1] + "\n",
+                     [np.arange(1, len(faces) + 1), valid.sum(axis=1)] + vertices,
+                     drop_zeros=not valid.all())
+
+        outfile.write("0 = Number of open boundaries\n"
+                      "0 = Total number of open boundary nodes\n"
+                      "0 = Number of land boundaries\n"
+                      "0 = Total number of land boundary nodes\n")
+
+
+_2DM_CARD = r'^%s[ \t]+(.*)$'
+
+
+def _find_cards(text, card):
+    """
+    the rest of the line after each line starting with the card, as one block
+    """
+    return '\n'.join(re.findall(_2DM_CARD % card, text, flags=re.M))
+
+
+def load_grid_from_2dm(filename, grid, data_name='depth'):
+    """
+    loads an SMS .2dm mesh file into the passed-in grid
+
+    :param filename: the file to read
+
+    :param grid: the grid object to put the mesh and data into.
+    :type grid: UGrid object.
+
+    :param data_name='depth': name of the DataSet for the z values of the nodes
+
+    Triangles (E3T) and quadrilaterals (E4Q) are read -- in a mesh with
+    both, the triangles are padded with -1. The material ids go in a
+    'material' face DataSet. Node strings, and other cards, are not read.
+    """
+    with open(filename) as infile:
+        text = infile.read()
+    if not text.lstrip().startswith('MESH2D'):
+        raise ValueError("%s doesn't look like a 2dm file" % filename)
+    if re.search(r'^E(6T|8Q|9Q)\b', text, flags=re.M):
+        raise ValueError("Only linear elements (E3T, E4Q) can be read")
+
+    block = _find_cards(text, 'ND')
+    nodes = _parse_block(block, block.count('\n') + 1 if block else 0, 4, np.float64, 'ND')
+
+    elements = []
+    for card, n in (('E3T', 3), ('E4Q', 4)):
+        block = _find_cards(text, card)
+        if block:
+            rows = _parse_block(block, block.count('\n') + 1, n + 2, np.int64, card)
+            elements.append((rows, n))
+    num_vertices = max([n for rows, n in elements] or [3])
+    num_elements = sum(len(rows) for rows, n in elements)
+    ids = np.empty((num_elements,), dtype=np.int64)
+    faces = np.full((num_elements, num_vertices), -1, dtype=np.int64)
+    material = np.empty((num_elements,), dtype=np.int64)
+    start = 0
+    for rows, n in elements:
+        stop = start + len(rows)
+        ids[start:stop] = rows[:, 0]
+        faces[start:stop, :n] = rows[:, 1:n + 1]
+        material[start:stop] = rows[:, n + 1]
+        start = stop
+    # in the order of the element ids
+    order = np.argsort(ids, kind='stable')
+    if not np.array_equal(order, np.arange(num_elements)):
+        faces = faces[order]
+        material = material[order]
+
+    match = re.search(r'^MESHNAME\s+"?([^"\n]*)"?', text, flags=re.M)
+    if match:
+        grid.mesh_name = match.group(1).strip() or grid.mesh_name
+
+    grid.nodes = nodes[:, 1:3]
+    grid.faces = _renumber_nodes(nodes[:, 0].astype(np.int64), faces)
+    grid.add_data(DataSet(data_name, location='node', data=nodes[:, 3],
+                          attributes=dict(DEPTH_ATTRIBUTES) if data_name == 'depth' else {}))
+    grid.add_data(DataSet('material', location='face', data=material))
+
+
+def save_2dm(grid, filename, data_name='depth'):
+    """
+    save a grid as an SMS .2dm mesh file
+
+    :param grid: the grid to save
+    :type grid: UGrid object.
+
+    :param filename: the file to write
+
+    :param data_name='depth': the node DataSet to write as the z values.
+                              If the grid doesn't have it, zeros are written.
+
+    The material ids come from the 'material' face DataSet, if there is one.
+    Faces with 3 vertices are written as E3T, and with 4 as E4Q.
+    """
+    nodes = grid.nodes
+    faces = grid.faces if grid.faces is not None else np.zeros((0, 3), dtype=np.int64)
+    dataset = grid.data.get(data_name)
+    depth = np.zeros((len(nodes),)) if dataset is None else np.asarray(dataset.data)
+    material = grid.data.get('material')
+    material = np.ones((len(faces),), dtype=np.int64) if material is None else np.asarray(material.data)
+
+    num_vertices = (faces >= 0).sum(axis=1)
+    if np.any((num_vertices != 3) & (num_vertices != 4)):
+        raise ValueError("Only triangles and quadrilaterals can be saved to a 2dm file")
+
+    float_fmt = _float_format(nodes.dtype)
+    with open(filename, 'w') as outfile:
+        outfile.write("MESH2D\n")
+        outfile.write('MESHNAME "%s"\n' % grid.mesh_name)
+        ids = np.arange(1, len(faces) + 1)
+        if np.all(num_vertices == num_vertices[:1]):
+            runs = [np.arange(len(faces))]
+        else:
+            # keep the element ids in order: split into runs of the same shape
+            runs = np.split(np.arange(len(faces)), np.flatnonzero(np.diff(num_vertices)) + 1)
+        for rows in runs:
+            if not len(rows):
+                continue
+            n = num_vertices[rows[0]]
+            card = 'E3T' if n == 3 else 'E4Q'
+            _format_rows(outfile, card + " %d" + " %d" * n + " %d\n",
+                         [ids[rows]] + [faces[rows, i] + 1 for i in range(n)] + [material[rows]])
+        _format_rows(outfile, "ND %%d %s %s %s\n" % (float_fmt, float_fmt, _float_format(depth.dtype)),
+                     [np.arange(1, len(nodes) + 1), nodes[:, 0], nodes[:, 1], depth])
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+code to write many grids to netcdf files at once, on a pool of processes
+
+The grids are not pickled to get them to the worker processes: where
+processes are forked, the workers inherit them, and otherwise they are
+spilled to disk in the native format (see native.py), which the workers
+memory-map.
+
+A job can also be a function that builds the grid -- e.g. reads and converts
+a model output file -- which is then called in the worker process.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import traceback
+
+from .ugrid import UGrid
+
+# the jobs of the current export -- inherited by forked worker processes
+_JOBS = None
+
+
+class ExportResult(object):
+    """
+    The result of one export job
+
+    filepath: the file that was written (or not)
+
+    error: None if the job succeeded, otherwise the formatted traceback
+           of the exception it raised
+
+    seconds: how long the job took
+    """
+    def __init__(self, filepath, error=None, seconds=0.0):
+        self.filepath = filepath
+        self.error = error
+        self.seconds = seconds
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        status = "ok" if self.ok else "failed"
+        return "ExportResult(%r, %s, %.2fs)" % (self.filepath, status, self.seconds)
+
+
+def _fork_context():
+    """
+    the multiprocessing context that forks workers, or None if
+    this platform can't fork
+    """
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+
+
+def _run_job(task):
+    """
+    run one job in a worker process
+
+    task is (index, how, source, filepath, save_kwargs)
+    """
+    index, how, source, filepath, save_kwargs = task
+    start = time.time()
+    try:
+        if how == 'fork':
+            grid = _JOBS[index][0]
+        elif how == 'spill':
+            grid = UGrid.from_native(source)
+        else:
+            grid = source()
+        grid.save_as_netcdf(filepath, **save_kwargs)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    return index, ExportResult(filepath, error, time.time() - start)
+
+
+def _normalize_job(job, encoding):
+    """
+    returns (source, filepath, save_kwargs) for a job
+    """
+    if len(job) == 2:
+        source, filepath = job
+        save_kwargs = {}
+    elif len(job) == 3:
+        source, filepath, save_kwargs = job
+        save_kwargs = dict(save_kwargs or {})
+    else:
+        raise ValueError("a job is (grid, filepath) or (grid, filepath, save_kwargs), not %r" % (job,))
+    if encoding is not None:
+        save_kwargs.setdefault('encoding', encoding)
+    if not (isinstance(source, UGrid) or callable(source)):
+        raise ValueError("a job's grid must be a UGrid, or a function that returns one")
+    return source, filepath, save_kwargs
+
+
+def export(jobs, workers=None, encoding=None, share='auto', spill_dir=None):
+    """
+    save a number of grids as netcdf files, on a pool of processes
+
+    :param jobs: the grids to save, each one a (grid, filepath) or
+                 (grid, filepath, save_kwargs) tuple. grid can be a UGrid,
+                 or a function that takes no arguments and returns one
+                 (it must be picklable -- e.g. a module level function
+                 or a functools.partial of one), which is called in the
+                 worker process. save_kwargs are passed to save_as_netcdf.
+
+    :param workers=None: the number of processes. Defaults to the number of cores.
+
+    :param encoding=None: storage options for every file -- see
+                          UGrid.save_as_netcdf. Overridden by a job's save_kwargs.
+
+    :param share='auto': how grids get to the worker processes:
+                         'fork': the forked workers inherit them,
+                         'memmap': they are saved in the native format, which
+                         the workers memory-map. 'auto' forks if it can.
+
+    :param spill_dir=None: directory to save the grids in (they are
+                           removed when done). Defaults to a temporary directory.
+
+    returns a list of ExportResult, one for each job, in order.
+    A job that fails doesn't stop the others: its error is in its result.
+    """
+    global _JOBS
+
+    jobs = [_normalize_job(job, encoding) for job in jobs]
+    if share not in ('auto', 'fork', 'memmap'):
+        raise ValueError("share must be 'auto', 'fork' or 'memmap', not %r" % (share,))
+    context = _fork_context() if share != 'memmap' else None
+    if share == 'fork' and context is None:
+        raise ValueError("processes can't be forked on this platform")
+    if context is None:
+        context = multiprocessing
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+    workers = max(1, min(workers, len(jobs)))
+
+    results = [None] * len(jobs)
+    tasks = []
+    spill = None
+    try:
+        for index, (source, filepath, save_kwargs) in enumerate(jobs):
+            if not isinstance(source, UGrid):
+                tasks.append((index, 'call', source, filepath, save_kwargs))
+            elif share != 'memmap' and context is not multiprocessing:
+                tasks.append((index, 'fork', None, filepath, save_kwargs))
+            else:
+                if spill is None:
+                    spill = tempfile.mkdtemp(prefix='pyugrid_batch_', dir=spill_dir)
+                dirname = os.path.join(spill, str(index))
+                os.mkdir(dirname)
+                try:
+                    source.save_native(dirname)
+                except Exception:
+                    results[index] = ExportResult(filepath, traceback.format_exc())
+                    continue
+                tasks.append((index, 'spill', dirname, filepath, save_kwargs))
+
+        if tasks:
+            ## the workers are forked with the jobs in place
+            _JOBS = jobs
+            pool = context.Pool(workers)
+            try:
+                for index, result in pool.imap_unordered(_run_job, tasks):
+                    results[index] = result
+            finally:
+                pool.terminate()
+                pool.join()
+    finally:
+        _JOBS = None
+        if spill is not None:
+            shutil.rmtree(spill, ignore_errors=True)
+    return results
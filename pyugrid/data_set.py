@@ -6,17 +6,42 @@ DataSet object, used to hold data associated with a ugrid
 
 from __future__ import (absolute_import, division, print_function)
 
+import copy
+
 import numpy as np
 
-class DataSet(object):
+from .lazy_array import LazyArray, expand_key
+from .expressions import Operators
+
+class DataSet(Operators):
     """
     A class to hold the data associated with nodes, edges, etc.
 
     It holds an array of the data, as well as the attributes associated
      with that data (attributes get stored in the netcdf file)
 
+    Time-varying data has time as the first axis of the data array,
+    and the times in the time attribute. The last axis is always
+    the grid location (node, face, etc).
+
+    DataSets are slotted, so many small ones are cheap -- from_block()
+    makes a DataSet for each row of one array, without copying the data.
+
+    Arithmetic on DataSets (and numpy ufuncs like np.sqrt) is lazy: it
+    makes an expressions.Expr, which is evaluated a block at a time.
+
+    Values can be flagged as missing (e.g. dry cells) with a validity
+    mask, which is kept bit-packed along the location axis: one bit per
+    value, for each time step. The data array itself is left alone, so
+    there is none of the memory or the per-operation cost of numpy.ma.
+    A masked array given as the data is split into the two.
+
     """
-    def __init__(self, name, location='node', data=None, attributes=None):
+    __slots__ = ('name', 'location', '_data', '_valid_bits', 'attributes', 'time',
+                 '_data_dirty', '_clean_attributes', '__weakref__')
+
+    def __init__(self, name, location='node', data=None, attributes=None, time=None,
+                 valid=None):
         """
         create a data_set object
         :param name: the name of the data (depth, u_velocity, etc.)
@@ -26,6 +51,15 @@ class DataSet(object):
 
         :param data: the data
         :type data: 1-d numpy array, or somthing compatible (list, etc.)        
+                    A LazyArray will be kept as is, and only read when indexed.
+
+        :param time=None: the times of the first axis of the data, or None
+                          if the data doesn't vary in time.
+        :type time: 1-d numpy array
+
+        :param valid=None: boolean array, True where the data are valid --
+                           see set_valid(). None if they all are (or the
+                           mask of a masked array data).
 
         """
         self.name = name
@@ -36,22 +70,286 @@ class DataSet(object):
 
         if data is None:
             self._data = np.zeros((0,), dtype=np.float64) # could be any data type
+            self._valid_bits = None
         else:
-            self._data = np.asarray(data)
+            self._set_data(data)
+        if valid is not None:
+            self.set_valid(valid)
 
         self.attributes = {} if attributes is None else attributes
 
+        self.time = None if time is None else np.asarray(time)
+
+        # a new DataSet hasn't been saved anywhere
+        self._data_dirty = True
+        self._clean_attributes = None
+
+    @classmethod
+    def from_block(klass, names, block, location='node', attributes=None, time=None,
+                   valid=None):
+        """
+        create a DataSet for each row of a single array
+
+        :param names: the names of the DataSets, one per row of block
+
+        :param block: array with one row per DataSet, e.g. (member, node)
+                      or (variable, time, face). Each DataSet's data is a
+                      view of its row, so the block is shared, not copied.
+
+        :param location='node': the grid location of all the DataSets
+
+        :param attributes=None: a sequence of attribute dicts, one per
+                                DataSet, or None.
+
+        :param time=None: the times of the rows' first axis, shared by all
+                          the DataSets, or None.
+
+        :param valid=None: boolean array shaped like block, True where the
+                           data are valid, or None if they all are. It is
+                           bit-packed once, and each DataSet's mask is a
+                           view of its row.
+
+        returns a list of DataSets, in the order of the rows
+        """
+        names = list(names)
+        block = np.asarray(block)
+        if block.ndim < 2:
+            raise ValueError("block must have a row for each DataSet -- it is %i-d" %
+                             block.ndim)
+        if block.shape[0] != len(names):
+            raise ValueError("block has %i rows for %i names" % (block.shape[0], len(names)))
+        if attributes is None:
+            attributes = [None] * len(names)
+        elif len(attributes) != len(names):
+            raise ValueError("there must be one attributes dict for each name")
+        if time is not None:
+            time = np.asarray(time)
+        datasets = [klass(name, location, block[i], attrs, time)
+                    for i, (name, attrs) in enumerate(zip(names, attributes))]
+        if valid is not None:
+            valid = np.broadcast_to(np.asarray(valid, dtype=bool), block.shape)
+            bits = np.packbits(valid, axis=-1)
+            for i, ds in enumerate(datasets):
+                if not valid[i].all():
+                    ds.valid_bits = bits[i]
+        return datasets
+
+    @staticmethod
+    def _as_data(data):
+        ## arrays (and views of them) are kept as they are -- only
+        ## other sequences (and ndarray subclasses) are converted
+        if isinstance(data, LazyArray) or type(data) is np.ndarray:
+            return data
+        return np.asarray(data)
+
+    def _set_data(self, data):
+        """
+        set the data, and the mask from it: that of a masked array, or none
+        """
+        valid = None
+        if isinstance(data, np.ma.MaskedArray):
+            mask = np.ma.getmask(data)
+            if mask is not np.ma.nomask and mask.any():
+                valid = ~mask
+            data = np.ma.getdata(data)
+        self._data = self._as_data(data)
+        self._valid_bits = None
+        if valid is not None:
+            self.set_valid(valid)
+
     @property
     def data(self):
         return self._data
     @data.setter
     def data(self, data):
-        self._data = np.asarray(data)
+        ## in-place operators (ds.data *= 2) set the same array -- keep its mask
+        if data is not self._data:
+            self._set_data(data)
+        self._data_dirty = True
     @data.deleter
     def data(self):
-        self._data = self._data = np.zeros((0,), dtype=np.float64)
+        self._data = np.zeros((0,), dtype=np.float64)
+        self._valid_bits = None
+        self._data_dirty = True
+
+    @property
+    def valid_bits(self):
+        """
+        the validity mask, bit-packed along the location (last) axis -- as
+        np.packbits makes it -- or None if all the values are valid
+        """
+        return self._valid_bits
+    @valid_bits.setter
+    def valid_bits(self, bits):
+        ## e.g. a mask saved with the data -- it is kept as it is (not copied)
+        if bits is not None:
+            bits = np.asarray(bits)
+            shape = tuple(self._data.shape)
+            packed = shape[:-1] + ((shape[-1] + 7) // 8,)
+            if bits.dtype != np.uint8 or bits.shape != packed:
+                raise ValueError("valid_bits must be a uint8 array of shape %s, not %s %s" %
+                                 (packed, bits.dtype, bits.shape))
+        self._valid_bits = bits
+        self._data_dirty = True
+
+    def set_valid(self, valid, index=None):
+        """
+        set which values are valid (e.g. wet), and which are missing
+
+        :param valid: boolean array, True for valid values -- anything that
+                      broadcasts to the shape of the data (or data[index]),
+                      e.g. a (location,) mask for all the time steps. None
+                      to make all the values valid.
+
+        :param index=None: index into the leading axes of the data to set
+                           the mask of part of it, e.g. a time step:
+                           ds.set_valid(wet, index=step)
+        """
+        shape = tuple(self._data.shape)
+        if index is None:
+            if valid is None:
+                self._valid_bits = None
+            else:
+                valid = np.broadcast_to(np.asarray(valid, dtype=bool), shape)
+                self._valid_bits = None if valid.all() else np.packbits(valid, axis=-1)
+        else:
+            if self._valid_bits is None:
+                if valid is None:
+                    return
+                self._valid_bits = np.full(shape[:-1] + ((shape[-1] + 7) // 8,), 0xFF,
+                                           dtype=np.uint8)
+            rows = self._valid_bits[index]
+            if valid is None:
+                valid = True
+            valid = np.broadcast_to(np.asarray(valid, dtype=bool), rows.shape[:-1] + shape[-1:])
+            self._valid_bits[index] = np.packbits(valid, axis=-1)
+        self._data_dirty = True
+
+    def valid_mask(self, index=None):
+        """
+        the validity mask as a boolean array -- None if all the values are valid
+
+        :param index=None: index into the leading axes of the data, e.g. a
+                           time step or a slice of them: only that part of
+                           the mask is unpacked.
+        """
+        if self._valid_bits is None:
+            return None
+        bits = self._valid_bits if index is None else self._valid_bits[index]
+        return np.unpackbits(bits, axis=-1, count=self._data.shape[-1]).view(bool)
+
+    def valid_for_key(self, key):
+        """
+        the validity mask of data[key] -- None if all the values are valid
+
+        :param key: an index into all the axes of the data, location
+                    included -- as a LazyArray is indexed. Only the rows
+                    of the mask that are needed are unpacked.
+        """
+        if self._valid_bits is None:
+            return None
+        key = expand_key(key, self._data.ndim)
+        count = self._data.shape[-1]
+        ## a slice (or nothing) on the leading axes can be taken from the
+        ## packed rows -- more than one index array has to be done as numpy does
+        if sum(not isinstance(k, slice) for k in key) > 1 and any(np.ndim(k) for k in key):
+            return np.unpackbits(self._valid_bits, axis=-1, count=count).view(bool)[key]
+        rows = self._valid_bits[key[:-1] + (slice(None),)]
+        return np.unpackbits(rows, axis=-1, count=count).view(bool)[..., key[-1]]
+
+    def filled(self, fill_value=np.nan, index=None):
+        """
+        the data (or data[index]) as a numpy array, with fill_value where it
+        isn't valid. Not a copy, if all the values are valid.
+
+        :param fill_value=np.nan: the value for the missing values
+
+        :param index=None: index into the leading axes of the data, e.g. a time step
+        """
+        data = np.asarray(self._data if index is None else self._data[index])
+        valid = self.valid_mask(index)
+        if valid is None:
+            return data
+        return np.where(valid, data, fill_value)
+
+    def masked(self, index=None):
+        """
+        the data (or data[index]) as a numpy array -- a masked array, masked
+        where it isn't valid (or where a masked read, e.g. of a netCDF
+        variable, is masked), if any of it isn't
+
+        :param index=None: index into the leading axes of the data, e.g. a time step
+        """
+        data = self._data if index is None else self._data[index]
+        valid = self.valid_mask(index)
+        if valid is None or valid.all():
+            return data if isinstance(data, np.ma.MaskedArray) else np.asarray(data)
+        return np.ma.masked_array(np.ma.getdata(data), mask=~valid | np.ma.getmaskarray(data))
+
+    @property
+    def data_dirty(self):
+        """
+        True if the data has been set since the DataSet was loaded or saved
+
+        Changes made to the data array in place can't be seen --
+        call mark_dirty() after making them.
+        """
+        return self._data_dirty
+
+    @property
+    def attributes_dirty(self):
+        """
+        True if the attributes have changed since the DataSet was loaded or saved
+        """
+        return not _attributes_equal(self.attributes, self._clean_attributes)
+
+    @property
+    def dirty(self):
+        """
+        True if the data or the attributes need to be saved
+        """
+        return self.data_dirty or self.attributes_dirty
+
+    def mark_dirty(self):
+        """
+        flag the data as modified -- e.g. after changing it in place
+        """
+        self._data_dirty = True
+
+    def mark_clean(self):
+        """
+        flag the DataSet as matching what is in the file
+
+        called when it is loaded from, or saved to, a file
+        """
+        self._data_dirty = False
+        self._clean_attributes = copy.deepcopy(self.attributes)
+
+    def reduce_time(self, stats=('mean',), **kwargs):
+        """
+        reduce time-varying data over time, a block of time steps at a
+        time -- so lazy data is never all read into memory at once
+
+        returns a dict of DataSets -- see reductions.reduce_time for the options
+        """
+        from .reductions import reduce_time
+        return reduce_time(self, stats, **kwargs)
 
     def __str__(self):
         return "DataSet object: {0:s}, on the {1:s}s, and {2:d} data points\nAttributes: {3}".format(self.name, self.location, len(self.data), self.attributes)
 
 
+def _attributes_equal(attributes, other):
+    """
+    compare two dicts of attributes -- the values may be numpy arrays
+    """
+    if other is None or set(attributes) != set(other):
+        return False
+    for name, value in attributes.items():
+        try:
+            if not np.array_equal(value, other[name]):
+                return False
+        except TypeError:
+            if value != other[name]:
+                return False
+    return True
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+
+"""
+Ensemble class: the members of a model ensemble on one grid
+
+The mesh is held once, in a UGrid whose arrays are read-only, and each
+variable is a single array with the members as the first axis:
+(member, location), or (member, time, location), etc. So there is one
+copy of the topology however many members there are, and the statistics
+over the members (mean, spread, probability of exceedance) are each
+computed in one pass over one array.
+
+Each member can still be looked at as a UGrid of its own -- its DataSets
+are views of its row of the variables, so nothing is copied.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+from .ugrid import UGrid
+from .data_set import DataSet
+from .reductions import Accumulator
+from .write_netcdf import location_size
+
+## the topology arrays the Ensemble shares (and makes read-only)
+TOPOLOGY = ('nodes', 'faces', 'edges', 'boundaries',
+            'face_face_connectivity', 'face_edge_connectivity',
+            'edge_coordinates', 'face_coordinates', 'boundary_coordinates')
+
+# the member statistics, and their CF cell_methods
+STATS = {'mean': 'realization: mean',
+         'spread': 'realization: standard_deviation',
+         'min': 'realization: minimum',
+         'max': 'realization: maximum',
+         }
+
+
+def _read_only(array):
+    """
+    a read-only view of an array -- None stays None
+    """
+    if array is None:
+        return None
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def _add_valid(valid, i, member_valid, shape):
+    """
+    put a member's validity mask (None if it's all valid) into the
+    ensemble's -- which is only made once a member has missing values
+    """
+    if member_valid is None or member_valid.all():
+        return valid
+    if valid is None:
+        valid = np.ones(shape, dtype=bool)
+    valid[i] = member_valid
+    return valid
+
+
+class Ensemble(object):
+    """
+    the members of an ensemble: one shared topology, and the data of
+    each variable as a (member, ..., location) array
+    """
+
+    def __init__(self, grid, members):
+        """
+        create an Ensemble with no variables yet
+
+        :param grid: a UGrid with the mesh of all the members. Its arrays are
+                     shared (as read-only views), not copied. Its DataSets are
+                     not used -- see from_grids() for that.
+
+        :param members: the names (or numbers) of the members
+        """
+        self.members = list(members)
+        if not self.members:
+            raise ValueError("an Ensemble needs at least one member")
+        arrays = {name: _read_only(getattr(grid, name)) for name in TOPOLOGY}
+        self.grid = UGrid(mesh_name=grid.mesh_name,
+                          index_dtype=grid.index_dtype,
+                          node_dtype=grid.node_dtype,
+                          **arrays)
+        self._variables = {}
+
+    @classmethod
+    def from_grids(klass, grids, members=None, names=None):
+        """
+        create an Ensemble from a UGrid for each member, which must all
+        have the same mesh.
+
+        :param grids: the UGrids, one per member
+
+        :param members=None: the names of the members. Defaults to 0, 1, 2...
+
+        :param names=None: the DataSets to take. Defaults to all the ones
+                           in the first grid.
+
+        Each variable is copied once, into its (member, ...) array -- the
+        grids can be dropped afterward.
+        """
+        grids = list(grids)
+        if not grids:
+            raise ValueError("an Ensemble needs at least one member")
+        first = grids[0]
+        for i, grid in enumerate(grids[1:], 1):
+            for name in ('nodes', 'faces'):
+                mine, theirs = getattr(first, name), getattr(grid, name)
+                if mine is theirs:
+                    continue
+                if (mine is None) != (theirs is None) or (mine is not None and
+                                                          not np.array_equal(mine, theirs)):
+                    raise ValueError("the %s of member %i don't match the first member's" %
+                                     (name, i))
+        ensemble = klass(first, range(len(grids)) if members is None else members)
+        if len(ensemble.members) != len(grids):
+            raise ValueError("there are %i member names for %i grids" %
+                             (len(ensemble.members), len(grids)))
+        for name in (first.data if names is None else names):
+            template = first.data[name]
+            data = template.data
+            block = np.empty((len(grids),) + tuple(data.shape), dtype=data.dtype)
+            valid = None
+            for i, grid in enumerate(grids):
+                try:
+                    member = grid.data[name]
+                except KeyError:
+                    raise ValueError("member %i has no %s" % (i, name))
+                block[i] = member.data
+                valid = _add_valid(valid, i, member.valid_mask(), block.shape)
+            ensemble.add_variable(name, block, template.location,
+                                  dict(template.attributes), template.time, valid)
+        return ensemble
+
+    @classmethod
+    def from_ncfiles(klass, filenames, members=None, names=None, mesh_name=None):
+        """
+        create an Ensemble from a netcdf file for each member. The mesh is
+        only read from the first one.
+
+        :param filenames: the files (or urls), one per member
+
+        :param members=None: the names of the members. Defaults to the filenames.
+
+        :param names=None: the data variables to read. Defaults to all the
+                           ones on the mesh in the first file.
+
+        :param mesh_name=None: the mesh to use, if there is more than one
+
+        Each variable is read straight into its row of the (member, ...) array.
+        """
+        import netCDF4
+        from . import read_netcdf
+
+        filenames = list(filenames)
+        if not filenames:
+            raise ValueError("an Ensemble needs at least one member")
+        grid = UGrid.from_ncfile(filenames[0], mesh_name=mesh_name, load_data=False)
+        ensemble = klass(grid, filenames if members is None else members)
+        if len(ensemble.members) != len(filenames):
+            raise ValueError("there are %i member names for %i files" %
+                             (len(ensemble.members), len(filenames)))
+        blocks = {}
+        with read_netcdf.NETCDF_LOCK:
+            for i, filename in enumerate(filenames):
+                nc = netCDF4.Dataset(filename)
+                try:
+                    ncvars = nc.variables
+                    time_dim = read_netcdf.find_time_dim(nc)
+                    found = {}
+                    for name, var, location, attributes in read_netcdf.find_data_vars(nc, grid.mesh_name):
+                        if names is None or name in names:
+                            found[name] = (var, location, attributes)
+                    if names is None:
+                        ## all the ones in the first file
+                        names = sorted(found)
+                    for name in names:
+                        if name not in found:
+                            raise ValueError("%s has no %s" % (filename, name))
+                        var, location, attributes = found[name]
+                        if i == 0:
+                            time = None
+                            if var.ndim > 1 and var.dimensions[0] == time_dim and time_dim in ncvars:
+                                time = ncvars[time_dim][:]
+                            blocks[name] = [np.empty((len(filenames),) + var.shape, dtype=var.dtype),
+                                            location, attributes, time, None]
+                        block = blocks[name][0]
+                        if var.shape != block.shape[1:]:
+                            raise ValueError("%s in %s is %s -- the first member's is %s" %
+                                             (name, filename, var.shape, block.shape[1:]))
+                        values = var[:]
+                        block[i] = np.ma.getdata(values)
+                        ## the missing (_FillValue) values
+                        mask = np.ma.getmask(values)
+                        blocks[name][4] = _add_valid(blocks[name][4], i,
+                                                     None if mask is np.ma.nomask else ~mask,
+                                                     block.shape)
+                finally:
+                    nc.close()
+        for name, (block, location, attributes, time, valid) in blocks.items():
+            ensemble.add_variable(name, block, location, attributes, time, valid)
+        return ensemble
+
+    @property
+    def num_members(self):
+        return len(self.members)
+
+    @property
+    def variables(self):
+        """
+        the names of the variables
+        """
+        return list(self._variables)
+
+    def add_variable(self, name, data, location='node', attributes=None, time=None,
+                     valid=None):
+        """
+        add a variable: an array with the members as the first axis, and
+        the grid location as the last -- it is kept as is, not copied.
+
+        :param name: the name of the variable
+
+        :param data: the (member, ..., location) array
+
+        :param location='node': the grid location of the data
+
+        :param attributes=None: dict of the variable's attributes
+
+        :param time=None: the times of the second axis, if the data vary in time
+
+        :param valid=None: boolean array, True where the data are valid -- see
+                           DataSet.set_valid(). A masked array's mask is used, too.
+        """
+        if location not in ('node', 'edge', 'face', 'boundary'):
+            raise ValueError("location must be one of: 'node', 'edge', 'face', 'boundary'")
+        if type(data) is not np.ndarray and not isinstance(data, np.ma.MaskedArray):
+            data = np.asarray(data)
+        if data.ndim < 2 or len(data) != self.num_members:
+            raise ValueError("%s must be (member, ..., %s) -- with %i members, not %s" %
+                             (name, location, self.num_members, data.shape))
+        if data.shape[-1] != location_size(self.grid, location):
+            raise ValueError("the last axis of %s must match the number of %ss" % (name, location))
+        if time is not None:
+            time = np.asarray(time)
+            if data.ndim < 3 or len(time) != data.shape[1]:
+                raise ValueError("there must be a time for each step of %s" % name)
+        self._variables[name] = DataSet(name, location, data,
+                                        {} if attributes is None else attributes, time, valid)
+
+    def variable(self, name):
+        """
+        a variable as a DataSet: its data is the (member, ..., location) array
+        """
+        return self._variables[name]
+
+    def __getitem__(self, name):
+        """
+        the (member, ..., location) array of a variable
+        """
+        return self._variables[name].data
+
+    def _member_index(self, member):
+        try:
+            return self.members.index(member)
+        except ValueError:
+            raise ValueError("there is no member %r" % (member,))
+
+    def member_data(self, name):
+        """
+        a DataSet for each member of a variable -- views of its rows
+        """
+        variable = self._variables[name]
+        names = ["%s_%s" % (name, member) for member in self.members]
+        return DataSet.from_block(names, variable.data, variable.location,
+                                  [dict(variable.attributes) for member in self.members],
+                                  variable.time, variable.valid_mask())
+
+    def member(self, member):
+        """
+        one member as a UGrid: it shares the Ensemble's mesh, and its
+        DataSets are views of the member's rows of the variables
+
+        :param member: the name of the member (one of Ensemble.members)
+        """
+        i = self._member_index(member)
+        grid = UGrid(mesh_name=self.grid.mesh_name,
+                     index_dtype=self.grid.index_dtype,
+                     node_dtype=self.grid.node_dtype,
+                     **{name: getattr(self.grid, name) for name in TOPOLOGY})
+        for name, variable in self._variables.items():
+            grid.add_data(DataSet(name, variable.location, variable.data[i],
+                                  dict(variable.attributes), variable.time,
+                                  valid=variable.valid_mask(i)))
+        return grid
+
+    def statistics(self, name, stats=('mean', 'spread'), thresholds=(), ddof=0):
+        """
+        statistics over the members of a variable, all from one pass
+        through its data
+
+        :param name: the name of the variable
+
+        :param stats=('mean', 'spread'): any of 'mean', 'spread' (the standard
+                                         deviation), 'min' and 'max'
+
+        :param thresholds=(): compute the probability of exceedance -- the
+                              fraction of the members above each threshold
+
+        :param ddof=0: delta degrees of freedom for the spread
+
+        NaN values (and those flagged by the variable's validity mask) are
+        left out: those members don't count towards the probabilities there.
+
+        returns a dict of DataSets, keyed by statistic ('mean', 'spread',
+        'min', 'max' and 'prob_gt_<threshold>'), named <name>_<key>
+        """
+        for stat in stats:
+            if stat not in STATS:
+                raise ValueError("unknown statistic: %r -- use one of %s" % (stat, ", ".join(STATS)))
+        variable = self._variables[name]
+        acc = Accumulator.from_block(variable.data, thresholds, variable.valid_mask())
+
+        results = {}
+        for stat in stats:
+            results[stat] = acc.result('std' if stat == 'spread' else stat, ddof)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i, threshold in enumerate(thresholds):
+                results["prob_gt_%g" % threshold] = np.where(acc.count > 0,
+                                                             acc.exceed[i] / acc.count, np.nan)
+
+        datasets = {}
+        for key, values in results.items():
+            datasets[key] = DataSet("%s_%s" % (name, key), variable.location, values,
+                                    _attributes(variable, key), variable.time)
+        return datasets
+
+    def mean(self, name):
+        """
+        the mean over the members of a variable
+        """
+        return self.statistics(name, ('mean',))['mean'].data
+
+    def spread(self, name, ddof=0):
+        """
+        the spread (standard deviation) over the members of a variable
+        """
+        return self.statistics(name, ('spread',), ddof=ddof)['spread'].data
+
+    def exceedance(self, name, threshold):
+        """
+        the probability of exceedance: the fraction of the members of a
+        variable that are above the threshold
+        """
+        return self.statistics(name, (), (threshold,))['prob_gt_%g' % threshold].data
+
+
+def _attributes(variable, key):
+    """
+    the attributes of a member statistic of a variable
+    """
+    units = variable.attributes.get('units')
+    attributes = {}
+    if key in STATS:
+        attributes['cell_methods'] = STATS[key]
+        attributes['long_name'] = "ensemble %s of %s" % ({'min': 'minimum',
+                                                          'max': 'maximum'}.get(key, key),
+                                                         variable.name)
+        if units is not None:
+            attributes['units'] = units
+        if 'standard_name' in variable.attributes:
+            attributes['standard_name'] = variable.attributes['standard_name']
+    else:
+        attributes['long_name'] = "probability of %s > %s" % (variable.name, key[len('prob_gt_'):])
+        attributes['units'] = '1'
+    return attributes
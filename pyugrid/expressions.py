@@ -0,0 +1,525 @@
+#!/usr/bin/env python
+
+"""
+lazy arithmetic on DataSets, UCubes and arrays
+
+Arithmetic on DataSets and UCubes (and numpy ufuncs like np.sqrt) doesn't
+compute anything: it builds an Expr, e.g.:
+
+    speed = np.sqrt(u ** 2 + v ** 2)
+
+An Expr is a LazyArray: indexing it reads just that part of each operand
+and evaluates the whole expression on it at once -- with numexpr if it is
+installed, otherwise with numpy, reusing the temporaries where it can. So
+a derived field over a long time series is computed a block of time steps
+at a time, and the intermediate results are never the full size:
+
+    speed.to_dataset('speed')           # a new DataSet
+    speed.to_netcdf('speed.nc', grid)   # straight to a file
+    DataSet('speed', data=speed, ...)   # not evaluated until it is used
+
+Values that are missing in any operand -- flagged by a DataSet's validity
+mask, or masked in a UCube or a masked array -- are masked in the result.
+
+This code is used by the DataSet and UCube classes (their arithmetic operators)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+from .lazy_array import LazyArray, expand_key
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+## the operations an Expr can hold: numpy ufunc name -> numexpr template.
+## None means numexpr can't do it the way numpy does, so an expression
+## with it is evaluated with numpy.
+OPS = {'add': '({0} + {1})',
+       'subtract': '({0} - {1})',
+       'multiply': '({0} * {1})',
+       'divide': '({0} / {1})',
+       'true_divide': '({0} / {1})',
+       'power': '({0} ** {1})',
+       'remainder': '({0} % {1})',
+       'negative': '(-{0})',
+       'positive': '{0}',
+       'absolute': 'abs({0})',
+       'sqrt': 'sqrt({0})',
+       'exp': 'exp({0})',
+       'log': 'log({0})',
+       'log10': 'log10({0})',
+       'sin': 'sin({0})',
+       'cos': 'cos({0})',
+       'tan': 'tan({0})',
+       'arcsin': 'arcsin({0})',
+       'arccos': 'arccos({0})',
+       'arctan': 'arctan({0})',
+       'arctan2': 'arctan2({0}, {1})',
+       'sinh': 'sinh({0})',
+       'cosh': 'cosh({0})',
+       'tanh': 'tanh({0})',
+       'maximum': None,
+       'minimum': None,
+       }
+
+## the array dtypes handed to numexpr -- anything else is done with numpy
+NUMEXPR_DTYPES = (np.dtype(np.float32), np.dtype(np.float64))
+
+
+class Operators(object):
+    """
+    arithmetic operators (and numpy ufuncs) that build an Expr
+
+    mixed in to DataSet, UCube and Expr
+    """
+    __slots__ = ()
+
+    def __add__(self, other):
+        return Expr('add', (self, other))
+
+    def __radd__(self, other):
+        return Expr('add', (other, self))
+
+    def __sub__(self, other):
+        return Expr('subtract', (self, other))
+
+    def __rsub__(self, other):
+        return Expr('subtract', (other, self))
+
+    def __mul__(self, other):
+        return Expr('multiply', (self, other))
+
+    def __rmul__(self, other):
+        return Expr('multiply', (other, self))
+
+    def __truediv__(self, other):
+        return Expr('true_divide', (self, other))
+
+    def __rtruediv__(self, other):
+        return Expr('true_divide', (other, self))
+
+    __div__ = __truediv__
+    __rdiv__ = __rtruediv__
+
+    def __pow__(self, other):
+        return Expr('power', (self, other))
+
+    def __rpow__(self, other):
+        return Expr('power', (other, self))
+
+    def __mod__(self, other):
+        return Expr('remainder', (self, other))
+
+    def __rmod__(self, other):
+        return Expr('remainder', (other, self))
+
+    def __neg__(self):
+        return Expr('negative', (self,))
+
+    def __pos__(self):
+        return Expr('positive', (self,))
+
+    def __abs__(self):
+        return Expr('absolute', (self,))
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method == '__call__' and not kwargs and ufunc.__name__ in OPS:
+            return Expr(ufunc.__name__, inputs)
+        ## anything else is done right away, on all the data
+        inputs = [_value(x) for x in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+
+def _value(obj):
+    """
+    the data of an operand, as a numpy array
+    """
+    from .data_set import DataSet
+    if isinstance(obj, DataSet):
+        obj = obj.data
+    if isinstance(obj, LazyArray):
+        return np.asarray(obj)
+    return obj
+
+
+def _is_constant(obj):
+    return isinstance(obj, (bool, int, float, complex, np.number, np.bool_))
+
+
+def _leaf_key(key, leaf_shape, shape):
+    """
+    the part of a leaf to read for a key into the (broadcast) expression
+
+    The leaf's axes are the last ones of the expression's, and an axis
+    of length one is broadcast -- it's all read, whatever the key.
+    """
+    key = key[len(key) - len(leaf_shape):] if leaf_shape else ()
+    shape = shape[len(shape) - len(leaf_shape):]
+    leaf_key = []
+    for k, n, size in zip(key, leaf_shape, shape):
+        if n == 1 and size != 1:
+            if isinstance(k, slice):
+                k = slice(None)
+            elif np.ndim(k) == 0:
+                k = 0
+            else:
+                k = np.zeros(np.shape(k), dtype=np.intp)
+        leaf_key.append(k)
+    return tuple(leaf_key)
+
+
+class Expr(Operators, LazyArray):
+    """
+    a lazy arithmetic expression of arrays, DataSets and UCubes
+
+    Build one with arithmetic operators and numpy ufuncs, e.g.
+    np.sqrt(u ** 2 + v ** 2). The operands are broadcast together the
+    numpy way: e.g. a (node,) depth plus a (time, node) elevation.
+
+    location, time and name come from the DataSet and UCube operands --
+    the name only if they all have the same one.
+    """
+
+    def __init__(self, op, args):
+        """
+        :param op: the numpy ufunc name of the operation (a key of OPS),
+                   or None for a leaf that holds an array-like
+
+        :param args: the operands: Exprs, DataSets, UCubes, arrays or
+                     numbers -- or for a leaf, (array,)
+        """
+        from .data_set import DataSet
+
+        self.op = op
+        self.location = None
+        self.time = None
+        self.name = None
+        self.dataset = None
+        if op is None:
+            array, = args
+            if isinstance(array, DataSet):
+                self.location, self.time, self.name = array.location, array.time, array.name
+                ## for its validity mask
+                self.dataset = array
+                array = array.data
+            elif hasattr(array, 'dims') and hasattr(array, 'location'): # a UCube
+                self.location, self.time, self.name = array.location, array.time, array.name
+            elif not hasattr(array, 'shape') or not hasattr(array, 'dtype'):
+                array = np.asarray(array)
+            self.args = (array,)
+            self._shape = tuple(array.shape)
+            self._dtype = np.dtype(array.dtype)
+            return
+
+        if op not in OPS:
+            raise ValueError("%s is not an operation Expr can do" % op)
+        self.args = tuple(arg if isinstance(arg, Expr) or _is_constant(arg) else Expr(None, (arg,))
+                          for arg in args)
+        operands = [arg for arg in self.args if isinstance(arg, Expr)]
+        try:
+            ## zero-stride stand-ins, so nothing the size of the data is made
+            self._shape = tuple(np.broadcast(*[np.broadcast_to(np.empty(()), arg.shape)
+                                               for arg in operands]).shape)
+        except ValueError:
+            raise ValueError("operands could not be broadcast together with shapes %s" %
+                             " ".join(str(arg.shape) for arg in operands))
+        for arg in operands:
+            if arg.location is not None:
+                if self.location is not None and arg.location != self.location:
+                    raise ValueError("can't combine data on the %ss with data on the %ss" %
+                                     (self.location, arg.location))
+                self.location = arg.location
+            if self.time is None:
+                self.time = arg.time
+        ## the name of the only named operand, if there's just one
+        names = set(arg.name for arg in operands if arg.name is not None)
+        if len(names) == 1:
+            self.name = names.pop()
+        ## the dtype the operation gives for these operand dtypes
+        samples = [np.ones((1,), dtype=arg.dtype) if isinstance(arg, Expr) else arg
+                   for arg in self.args]
+        with np.errstate(all='ignore'):
+            self._dtype = getattr(np, op)(*samples).dtype
+
+    @property
+    def shape(self):
+        return self._shape
+
+    @property
+    def dtype(self):
+        return self._dtype
+
+    @property
+    def _leaf_id(self):
+        """
+        what identifies a leaf: its array, and the DataSet it is from --
+        DataSets can share an array but not their validity masks
+        """
+        return id(self.args[0]), id(self.dataset)
+
+    def _leaves(self, leaves=None):
+        """
+        the leaves of the tree, by _leaf_id -- an array used twice is read once
+        """
+        if leaves is None:
+            leaves = {}
+        if self.op is None:
+            leaves.setdefault(self._leaf_id, self)
+        else:
+            for arg in self.args:
+                if isinstance(arg, Expr):
+                    arg._leaves(leaves)
+        return leaves
+
+    def _numexpr(self, names):
+        """
+        the numexpr string of the expression, with the leaves' names
+        """
+        if self.op is None:
+            return names[self._leaf_id]
+        args = []
+        for arg in self.args:
+            if isinstance(arg, Expr):
+                args.append(arg._numexpr(names))
+            else:
+                args.append(repr(arg.item() if hasattr(arg, 'item') else arg))
+        template = OPS[self.op]
+        if template is None: # not for numexpr, but it describes the expression
+            return "%s(%s)" % (self.op, ", ".join(args))
+        return template.format(*args)
+
+    def _can_numexpr(self):
+        if self.op is None:
+            return self.dtype in NUMEXPR_DTYPES
+        if OPS[self.op] is None:
+            return False
+        for arg in self.args:
+            if isinstance(arg, Expr):
+                if not arg._can_numexpr():
+                    return False
+            elif isinstance(arg, (complex, np.complexfloating)):
+                return False
+        return True
+
+    def _numpy(self, values):
+        """
+        evaluate with numpy: returns (array, temporary) -- temporary if it
+        was made here, so the next operation can write over it
+        """
+        if self.op is None:
+            return values[self._leaf_id], False
+        arrays = []
+        temporaries = []
+        for arg in self.args:
+            if isinstance(arg, Expr):
+                array, temporary = arg._numpy(values)
+                if temporary:
+                    temporaries.append(array)
+                arrays.append(array)
+            else:
+                arrays.append(arg)
+        shape = np.broadcast(*arrays).shape
+        ufunc = getattr(np, self.op)
+        for array in temporaries:
+            if array.shape == shape and array.dtype == self.dtype:
+                return ufunc(*arrays, out=array), True
+        return ufunc(*arrays), True
+
+    def _read_leaf(self, key):
+        """
+        read a leaf for a key (into the leaf): returns (values, valid) --
+        valid is None if all the values are valid
+        """
+        values = self.args[0][key]
+        valid = None
+        if isinstance(values, np.ma.MaskedArray):
+            mask = np.ma.getmask(values)
+            if mask is not np.ma.nomask and mask.any():
+                valid = ~mask
+            values = np.ma.getdata(values)
+        if self.dataset is not None:
+            ds_valid = self.dataset.valid_for_key(key)
+            if ds_valid is not None:
+                valid = ds_valid if valid is None else valid & ds_valid
+        return np.asarray(values), valid
+
+    def __getitem__(self, key):
+        """
+        evaluate the expression for part of it -- only that part of each
+        operand is read
+
+        returns a masked array if any of the operands' values are missing
+        """
+        key = expand_key(key, len(self.shape))
+        leaves = self._leaves()
+        values = {}
+        valid = None
+        for leaf_id, leaf in leaves.items():
+            values[leaf_id], leaf_valid = leaf._read_leaf(_leaf_key(key, leaf.shape, self.shape))
+            if leaf_valid is not None:
+                valid = leaf_valid if valid is None else valid & leaf_valid
+        if self.op is None:
+            result = values[self._leaf_id]
+        else:
+            result = self._evaluate(values)
+        if valid is not None and not valid.all():
+            ## the values are still computed, but masked
+            return np.ma.masked_array(result, mask=~np.broadcast_to(valid, result.shape))
+        return result
+
+    def _evaluate(self, values):
+        """
+        evaluate the expression on the values read for each leaf
+        """
+        with np.errstate(all='ignore'):
+            if numexpr is not None and self._can_numexpr():
+                names = dict((leaf_id, "x%i" % i) for i, leaf_id in enumerate(values))
+                result = numexpr.evaluate(self._numexpr(names),
+                                          local_dict=dict((names[leaf_id], value)
+                                                          for leaf_id, value in values.items()))
+            else:
+                result, temporary = self._numpy(values)
+        return np.asarray(result).astype(self.dtype, copy=False)
+
+    def __str__(self):
+        names = {}
+        for i, (leaf_id, leaf) in enumerate(self._leaves().items()):
+            names[leaf_id] = leaf.name if leaf.name is not None else "array%i" % i
+        return self._numexpr(names)
+
+    def block_steps(self, chunk=None):
+        """
+        the number of time steps (the first axis) to evaluate at once:
+        chunk, if it's given, or as many as make about BLOCK_SIZE values
+        """
+        from .ucube import default_block_steps
+        if chunk is None:
+            chunk = default_block_steps(self.shape)
+        if chunk < 1:
+            raise ValueError("chunk must be at least one time step")
+        return chunk
+
+    def iter_blocks(self, chunk=None):
+        """
+        evaluate the expression a block of the first axis at a time
+
+        yields (start, stop, block) for each block
+        """
+        if not self.shape:
+            yield 0, 1, self[()]
+            return
+        chunk = self.block_steps(chunk)
+        num = self.shape[0]
+        for start in range(0, num, chunk):
+            stop = min(start + chunk, num)
+            yield start, stop, self[start:stop]
+
+    def evaluate(self, out=None, chunk=None):
+        """
+        evaluate the whole expression, a block at a time
+
+        :param out=None: where to put the result: anything the blocks of the
+                         first axis can be assigned to (a numpy array or
+                         memmap, a netCDF variable). Defaults to a new array.
+
+        :param chunk=None: the number of steps of the first axis to
+                           evaluate at once -- see block_steps()
+
+        returns out. Missing values are masked in a new array, and written
+        to a netCDF variable as its fill value -- a numpy out can't hold
+        the mask (use to_dataset() to keep it).
+        """
+        new = out is None
+        if new:
+            out = np.empty(self.shape, dtype=self.dtype)
+        elif tuple(out.shape) != self.shape:
+            raise ValueError("out is shaped %s, the expression is %s" %
+                             (tuple(out.shape), self.shape))
+        if not self.shape:
+            out[()] = self[()]
+            return out
+        invalid = None # only made if some values are missing
+        for start, stop, block in self.iter_blocks(chunk):
+            out[start:stop] = block
+            if new and isinstance(block, np.ma.MaskedArray):
+                if invalid is None:
+                    invalid = np.zeros(self.shape, dtype=bool)
+                invalid[start:stop] = np.ma.getmaskarray(block)
+        if invalid is not None:
+            return np.ma.masked_array(out, mask=invalid)
+        return out
+
+    def to_dataset(self, name=None, attributes=None, chunk=None):
+        """
+        evaluate the expression into a new DataSet
+
+        :param name=None: the name of the DataSet -- defaults to the name
+                          of the operand if there is just one with a name
+
+        :param attributes=None: the DataSet's attributes
+
+        :param chunk=None: the number of time steps to evaluate at once
+
+        (A DataSet can also hold the Expr itself as its data, unevaluated.)
+        """
+        from .data_set import DataSet
+
+        if name is None:
+            name = self.name
+        if name is None:
+            raise ValueError("the DataSet needs a name")
+        return DataSet(name,
+                       location='node' if self.location is None else self.location,
+                       data=self.evaluate(chunk=chunk),
+                       attributes=attributes,
+                       time=self.time)
+
+    def to_netcdf(self, filepath, grid, name=None, attributes=None, chunk=None, **kwargs):
+        """
+        evaluate a time-varying expression straight into a new netcdf file,
+        a block of time steps at a time
+
+        :param filepath: the file to write -- an existing one is clobbered
+
+        :param grid: the grid the data is on. Its mesh and data that doesn't
+                     vary in time are written to the file too.
+
+        :param name=None: the name of the variable -- see to_dataset()
+
+        :param attributes=None: the variable's attributes
+
+        :param chunk=None: the number of time steps to evaluate at once
+
+        Other keyword arguments (time_units, encoding...) are passed on to
+        the TimeSeriesWriter.
+
+        returns the number of time steps written
+        """
+        from .data_set import DataSet
+        from .write_netcdf import TimeSeriesWriter
+
+        if self.time is None:
+            raise ValueError("the expression doesn't vary in time -- use to_dataset(), "
+                             "and save the grid")
+        if name is None:
+            name = self.name
+        if name is None:
+            raise ValueError("the variable needs a name")
+        location = 'node' if self.location is None else self.location
+        ## the shape and type of a time step, without allocating one
+        template = DataSet(name, location,
+                           np.broadcast_to(np.zeros((), dtype=self.dtype), self.shape[1:]),
+                           attributes)
+        times = np.asarray(self.time)
+        with TimeSeriesWriter(filepath, grid, [template], **kwargs) as writer:
+            for start, stop, block in self.iter_blocks(chunk):
+                for i in range(stop - start):
+                    writer.append(times[start + i], {name: block[i]})
+            return writer.num_times
+
+    def __repr__(self):
+        return "<Expr: shape {0}, dtype {1}>".format(self.shape, self.dtype)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+
+"""
+LazyArray base class
+
+Array-like objects that only read their data when they are indexed.
+
+A DataSet will hold one of these as its data without reading it all in,
+so that very large (e.g. time series) data can be worked with a slice at
+a time.
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+
+
+class LazyArray(object):
+    """
+    Base class for array-like objects that read their data on demand.
+
+    Subclasses need to set the shape and dtype attributes, and provide
+    a __getitem__ that returns numpy arrays.
+    """
+    shape = ()
+    dtype = None
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        if not self.shape:
+            raise TypeError("len() of unsized object")
+        return self.shape[0]
+
+    def read(self):
+        """
+        read all the data -- this could be huge!
+        """
+        return self[(slice(None),) * self.ndim]
+
+    def __array__(self, dtype=None, copy=None):
+        data = np.asarray(self.read())
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+    def __repr__(self):
+        return "<{0}: shape {1}, dtype {2}>".format(self.__class__.__name__,
+                                                    self.shape,
+                                                    self.dtype)
+
+
+def expand_key(key, ndim):
+    """
+    normalize an index key to a tuple with one entry for each dimension
+
+    :param key: anything that can be used to index a numpy array with
+                ndim dimensions (but no np.newaxis)
+
+    :param ndim: number of dimensions of the array being indexed
+    """
+    if not isinstance(key, tuple):
+        key = (key,)
+    if any(k is Ellipsis for k in key):
+        i = [k is Ellipsis for k in key].index(True)
+        fill = (slice(None),) * (ndim - len(key) + 1)
+        key = key[:i] + fill + key[i + 1:]
+    if len(key) > ndim:
+        raise IndexError("too many indices for array")
+    return key + (slice(None),) * (ndim - len(key))
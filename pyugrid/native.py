@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""
+code to save and load grids in pyugrid's native format:
+
+a directory with each array of the grid in a .npy file, and a JSON
+manifest (manifest.json) with the mesh name, and the names, locations
+and attributes of the data. The data's times and (bit-packed) validity
+masks are .npy files of their own.
+
+Loading memory-maps the arrays (np.load(mmap_mode='r')), so opening
+even a very large grid doesn't read it, and the pages are shared by
+every process on the machine that opens the same grid.
+
+This code is called by the UGrid class (UGrid.save_native, UGrid.from_native)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import json
+import os
+
+import numpy as np
+
+from .data_set import DataSet
+
+MANIFEST = 'manifest.json'
+FORMAT = 'pyugrid-native'
+VERSION = 1
+
+# the arrays of a UGrid that are saved, if it has them
+GRID_ARRAYS = ('nodes',
+               'faces',
+               'edges',
+               'boundaries',
+               'face_face_connectivity',
+               'face_edge_connectivity',
+               'edge_coordinates',
+               'face_coordinates',
+               'boundary_coordinates',
+               )
+
+
+def _encode_value(value):
+    """
+    turn an attribute value into something JSON can hold, without
+    losing its type -- numpy values keep their dtype
+    """
+    if isinstance(value, (np.ndarray, np.generic)):
+        value = np.asarray(value)
+        return {'dtype': value.dtype.str, 'shape': list(value.shape),
+                'value': value.ravel().tolist()}
+    if isinstance(value, bytes):
+        return {'dtype': 'bytes', 'value': value.decode('latin-1')}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if value['dtype'] == 'bytes':
+            return value['value'].encode('latin-1')
+        array = np.array(value['value'], dtype=value['dtype']).reshape(value['shape'])
+        return array[()] if array.ndim == 0 else array
+    return value
+
+
+def _save_array(dirname, filename, array):
+    """
+    save an array -- returns the manifest entry for it
+    """
+    np.save(os.path.join(dirname, filename), np.asarray(array))
+    return {'file': filename}
+
+
+def _load_array(dirname, entry, mmap_mode):
+    return np.load(os.path.join(dirname, entry['file']), mmap_mode=mmap_mode)
+
+
+def save_native(grid, dirname):
+    """
+    save a grid in the native format
+
+    :param grid: the grid to save
+    :type grid: UGrid object.
+
+    :param dirname: the directory to save it in. It is created if it
+                    doesn't exist. A grid already saved there is replaced.
+
+    The manifest is written last, so a directory that was only partly
+    written can't be loaded.
+    """
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    manifest_path = os.path.join(dirname, MANIFEST)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    arrays = {}
+    for attr in GRID_ARRAYS:
+        value = getattr(grid, attr)
+        if value is not None:
+            arrays[attr] = _save_array(dirname, attr + '.npy', value)
+
+    datasets = []
+    for i, ds in enumerate(grid.data.values()):
+        entry = {'name': ds.name,
+                 'location': ds.location,
+                 'attributes': dict((name, _encode_value(value))
+                                    for name, value in ds.attributes.items()),
+                 'data': _save_array(dirname, 'data_%i.npy' % i, ds.data),
+                 }
+        if ds.time is not None:
+            entry['time'] = _save_array(dirname, 'time_%i.npy' % i, ds.time)
+        if ds.valid_bits is not None:
+            entry['valid_bits'] = _save_array(dirname, 'valid_%i.npy' % i, ds.valid_bits)
+        datasets.append(entry)
+
+    manifest = {'format': FORMAT,
+                'version': VERSION,
+                'mesh_name': grid.mesh_name,
+                'index_dtype': grid.index_dtype.str,
+                'node_dtype': grid.node_dtype.str,
+                'arrays': arrays,
+                'data': datasets,
+                }
+    with open(manifest_path, 'w') as outfile:
+        json.dump(manifest, outfile, indent=1)
+
+
+def read_manifest(dirname):
+    """
+    read and check the manifest of a grid saved in the native format
+    """
+    try:
+        with open(os.path.join(dirname, MANIFEST)) as infile:
+            manifest = json.load(infile)
+    except IOError:
+        raise ValueError("%s is not a pyugrid native grid: it has no %s" % (dirname, MANIFEST))
+    if manifest.get('format') != FORMAT:
+        raise ValueError("%s is not a pyugrid native grid" % dirname)
+    if manifest.get('version', 0) > VERSION:
+        raise ValueError("%s is version %s of the native format -- this pyugrid can read up to %s" %
+                         (dirname, manifest.get('version'), VERSION))
+    return manifest
+
+
+def load_native(dirname, grid, mmap_mode='r'):
+    """
+    loads a grid saved in the native format into the passed-in grid object
+
+    :param dirname: the directory it was saved in
+
+    :param grid: the grid object to put the mesh and data into.
+    :type grid: UGrid object.
+
+    :param mmap_mode='r': passed to np.load: 'r' memory-maps the arrays
+                          read only, 'c' copy-on-write, None reads them
+                          all into memory.
+    """
+    manifest = read_manifest(dirname)
+    grid.mesh_name = manifest['mesh_name']
+    arrays = manifest['arrays']
+    # in this order, as setting the faces resets the connectivity
+    for attr in GRID_ARRAYS:
+        if attr in arrays:
+            setattr(grid, attr, _load_array(dirname, arrays[attr], mmap_mode))
+    for entry in manifest['data']:
+        time = _load_array(dirname, entry['time'], mmap_mode) if 'time' in entry else None
+        ds = DataSet(entry['name'],
+                     location=entry['location'],
+                     data=_load_array(dirname, entry['data'], mmap_mode),
+                     attributes=dict((name, _decode_value(value))
+                                     for name, value in entry['attributes'].items()),
+                     time=time)
+        if 'valid_bits' in entry:
+            ds.valid_bits = _load_array(dirname, entry['valid_bits'], mmap_mode)
+        grid.add_data(ds)
+    ## it all matches what was saved
+    grid.mark_clean()
@@ -0,0 +1,322 @@
+#!/usr/bin/env python
+
+"""
+code to read a series of netcdf files that share a mesh as a single
+time series, e.g. one file per forecast hour.
+
+The mesh is loaded (once) from the first file, and each time-varying data
+variable becomes a DataSet whose data is an MFVariable: a lazy array
+that spans all the files. Reads that span files are done by a pool of
+threads, each reading from its own open netCDF file.
+
+This code is called by the UGrid class (UGrid.from_ncfiles)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import glob
+import threading
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import netCDF4
+
+from .data_set import DataSet
+from .lazy_array import LazyArray, expand_key
+from . import read_netcdf
+
+
+def expand_filenames(filenames):
+    """
+    turn a glob pattern or a sequence of filenames into a list of filenames
+
+    :param filenames: a glob pattern (e.g. "forecast_*.nc") or a sequence of
+                      filenames or OpenDAP urls. A pattern is expanded in
+                      sorted order -- a sequence is kept in the order given.
+    """
+    if isinstance(filenames, str):
+        names = sorted(glob.glob(filenames))
+        if not names:
+            raise ValueError("No files match: %s" % filenames)
+        return names
+    names = list(filenames)
+    if not names:
+        raise ValueError("No files given")
+    return names
+
+
+class MultiFileSource(object):
+    """
+    A set of open netCDF files, all with the same mesh and variables,
+    to be read as a single time series.
+
+    Use as a context manager, or call close() when done, to close the files.
+    """
+
+    def __init__(self, filenames, time_dim=None, max_workers=4, lock=None):
+        """
+        open the files
+
+        :param filenames: a glob pattern, or a sequence of filenames or urls
+
+        :param time_dim=None: the name of the dimension to join the files on.
+                              Defaults to the unlimited dimension (or 'time').
+
+        :param max_workers=4: number of threads used to read from the files.
+
+        :param lock=None: the lock held around each read. By default each
+                          file has its own lock, so reads from different
+                          files run at once. Pass True to hold
+                          read_netcdf.NETCDF_LOCK around every read instead,
+                          for builds of the netCDF-C and HDF5 libraries that
+                          are not thread safe -- or pass a lock of your own.
+        """
+        self.filenames = expand_filenames(filenames)
+        self.datasets = []
+        try:
+            for filename in self.filenames:
+                self.datasets.append(netCDF4.Dataset(filename, 'r'))
+        except Exception:
+            self.close()
+            raise
+        # netCDF handles are not safe to share between threads
+        if lock is None or lock is False:
+            self._locks = [threading.Lock() for nc in self.datasets]
+        else:
+            self._locks = [read_netcdf.NETCDF_LOCK if lock is True else lock] * len(self.datasets)
+
+        if time_dim is None:
+            time_dim = read_netcdf.find_time_dim(self.datasets[0])
+            if time_dim is None:
+                self.close()
+                raise ValueError("Can't find a time dimension in %s" % self.filenames[0])
+        self.time_dim = time_dim
+
+        sizes = []
+        for filename, nc in zip(self.filenames, self.datasets):
+            try:
+                sizes.append(len(nc.dimensions[time_dim]))
+            except KeyError:
+                self.close()
+                raise ValueError("%s has no %s dimension" % (filename, time_dim))
+        # offsets[i] is the index of the first time step in file i
+        self.offsets = np.concatenate(([0], np.cumsum(sizes))).astype(np.int64)
+
+        self._pool = ThreadPool(max_workers)
+
+    @property
+    def num_times(self):
+        return int(self.offsets[-1])
+
+    @property
+    def times(self):
+        """
+        the times of all the files joined together
+
+        if there is no time coordinate variable, this is just the time step number
+        """
+        if self.time_dim not in self.datasets[0].variables:
+            return np.arange(self.num_times)
+        times = []
+        for filename, nc in zip(self.filenames, self.datasets):
+            try:
+                times.append(nc.variables[self.time_dim][:])
+            except KeyError:
+                raise ValueError("%s has no %s variable" % (filename, self.time_dim))
+        return np.concatenate(times)
+
+    def variable(self, name):
+        """
+        returns an MFVariable for the named variable
+        """
+        return MFVariable(self, name)
+
+    def read(self, file_num, var_name, key):
+        """
+        read from a single file -- safe to call from any thread
+
+        :param file_num: the index of the file in the list of files
+
+        :param var_name: the name of the variable to read
+
+        :param key: the index to read, in that file's index space
+        """
+        with self._locks[file_num]:
+            return self.datasets[file_num].variables[var_name][key]
+
+    def map(self, func, args):
+        """
+        call func(*arg) for each arg in args, on the thread pool
+
+        returns a list of the results
+        """
+        if len(args) == 1:
+            return [func(*args[0])]
+        return self._pool.map(lambda arg: func(*arg), args)
+
+    def close(self):
+        pool = getattr(self, '_pool', None)
+        if pool is not None:
+            pool.close()
+            pool.join()
+            self._pool = None
+        self._close_files()
+
+    def _close_files(self):
+        # closing while another thread reads can crash the netCDF library
+        datasets = getattr(self, 'datasets', [])
+        locks = getattr(self, '_locks', None) or [read_netcdf.NETCDF_LOCK] * len(datasets)
+        for nc, lock in zip(datasets, locks):
+            with lock:
+                if nc.isopen():
+                    nc.close()
+
+    def __del__(self):
+        # may be called on one of the pool's threads, so can't join it
+        pool = getattr(self, '_pool', None)
+        if pool is not None:
+            pool.close()
+        self._close_files()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class MFVariable(LazyArray):
+    """
+    A lazy array that joins the same variable from a set of files along
+    the time axis (the first axis).
+
+    Indexing reads only what is asked for, from only the files
+    that are needed -- in parallel if more than one file is needed.
+    """
+
+    def __init__(self, source, name):
+        """
+        :param source: the open files
+        :type source: MultiFileSource
+
+        :param name: name of the variable in the files
+        """
+        self.source = source
+        self.name = name
+        try:
+            var = source.datasets[0].variables[name]
+        except KeyError:
+            raise ValueError("%s is not a variable in %s" % (name, source.filenames[0]))
+        if not var.dimensions or var.dimensions[0] != source.time_dim:
+            raise ValueError("%s does not vary along %s" % (name, source.time_dim))
+        for filename, nc in zip(source.filenames[1:], source.datasets[1:]):
+            try:
+                other = nc.variables[name]
+            except KeyError:
+                raise ValueError("%s is not a variable in %s" % (name, filename))
+            if other.shape[1:] != var.shape[1:]:
+                raise ValueError("%s has shape %s in %s, but %s in %s" %
+                                 (name, other.shape, filename, var.shape, source.filenames[0]))
+        self.shape = (source.num_times,) + var.shape[1:]
+        self.dtype = var.dtype
+
+    def _file_of(self, indexes):
+        return np.searchsorted(self.source.offsets, indexes, side='right') - 1
+
+    def __getitem__(self, key):
+        key = expand_key(key, self.ndim)
+        time_key, rest = key[0], key[1:]
+        offsets = self.source.offsets
+        num_times = self.shape[0]
+
+        if isinstance(time_key, (int, np.integer)):
+            index = int(time_key)
+            if index < 0:
+                index += num_times
+            if not 0 <= index < num_times:
+                raise IndexError("index %i is out of bounds for axis 0 with size %i" %
+                                 (time_key, num_times))
+            file_num = self._file_of(index)
+            return self.source.read(file_num, self.name,
+                                    (index - offsets[file_num],) + rest)
+
+        indexes = np.arange(num_times)[time_key]
+        if len(indexes) == 0:
+            return self.source.read(0, self.name, (slice(0, 0),) + rest)
+
+        # one read per run of indexes in the same file
+        file_nums = self._file_of(indexes)
+        breaks = np.flatnonzero(np.diff(file_nums)) + 1
+        reads = []
+        orders = []
+        for run in np.split(indexes, breaks):
+            file_num = int(self._file_of(run[0]))
+            local = run - offsets[file_num]
+            steps = np.diff(local)
+            order = None
+            if len(local) > 1 and not np.all(steps > 0):
+                # netCDF4 is given increasing indexes -- the values read
+                # are put back in the order asked for
+                local, order = np.unique(local, return_inverse=True)
+                steps = np.diff(local)
+            orders.append(order)
+            if len(local) == 1:
+                local = slice(local[0], local[0] + 1)
+            elif steps[0] > 0 and np.all(steps == steps[0]):
+                local = slice(local[0], local[-1] + 1, steps[0])
+            reads.append((file_num, self.name, (local,) + rest))
+
+        pieces = self.source.map(self.source.read, reads)
+        pieces = [piece if order is None else piece[order]
+                  for piece, order in zip(pieces, orders)]
+        if len(pieces) == 1:
+            return pieces[0]
+        if any(isinstance(piece, np.ma.MaskedArray) for piece in pieces):
+            return np.ma.concatenate(pieces)
+        return np.concatenate(pieces)
+
+
+def load_grid_from_ncfiles(filenames, grid, mesh_name=None, time_dim=None, max_workers=4,
+                           lock=None):
+    """
+    loads UGrid object from a series of netcdf files that all have
+    the same mesh, adding the data to the passed-in grid object.
+
+    The mesh is read from the first file. Every data variable that varies
+    in time becomes a DataSet with an MFVariable as its data, joined across
+    all the files. Data that doesn't vary in time is read from the first file.
+
+    :param filenames: a glob pattern, or a sequence of filenames or urls
+
+    :param grid: the grid object to put the mesh and data into.
+    :type grid: UGrid object.
+
+    :param mesh_name=None: name of the mesh to load
+    :type mesh_name: string
+
+    :param time_dim=None: the name of the dimension to join the files on.
+                          Defaults to the unlimited dimension (or 'time').
+
+    :param max_workers=4: number of threads used to read from the files.
+
+    :param lock=None: the lock held around each read -- see MultiFileSource
+
+    returns the MultiFileSource, which can be used to close the files.
+    """
+    source = MultiFileSource(filenames, time_dim, max_workers, lock)
+    try:
+        nc = source.datasets[0]
+        read_netcdf.load_grid_from_nc_dataset(nc, grid, mesh_name, load_data=False)
+        times = source.times
+        for name, var, location, attributes in read_netcdf.find_data_vars(nc, grid.mesh_name):
+            if var.dimensions and var.dimensions[0] == source.time_dim:
+                ds = DataSet(name, data=source.variable(var.name), location=location,
+                             attributes=attributes, time=times)
+            else:
+                ds = DataSet(name, data=var[:], location=location, attributes=attributes)
+            grid.add_data(ds)
+        grid.mark_clean()
+    except Exception:
+        source.close()
+        raise
+    return source
@@ -11,11 +11,51 @@ This code is called by the UGrid class to load inot a UGRID object.
 
 from __future__ import (absolute_import, division, print_function)
 
+import threading
+
 import numpy as np
 import netCDF4
 
 from .data_set import DataSet
 
+# Most builds of the netCDF-C and HDF5 libraries are not thread safe,
+# so netCDF calls made from more than one thread hold this lock.
+NETCDF_LOCK = threading.RLock()
+
+class _AttributeCache(object):
+    """
+    caches the attributes of the variables in a netCDF4 Dataset
+
+    Each variable's list of attribute names is read once, and only the
+    attributes actually asked for are read from the file.
+    """
+    def __init__(self, nc):
+        self.nc = nc
+        self._names = {}
+        self._values = {}
+
+    def get(self, varname, attname, default=None):
+        try:
+            return self._values[varname, attname]
+        except KeyError:
+            pass
+        try:
+            names = self._names[varname]
+        except KeyError:
+            names = self._names[varname] = set(self.nc.variables[varname].ncattrs())
+        value = self.nc.variables[varname].getncattr(attname) if attname in names else default
+        self._values[varname, attname] = value
+        return value
+
+def _is_mesh(attrs, varname):
+    cf_role = attrs.get(varname, 'cf_role')
+    if not hasattr(cf_role, 'strip') or cf_role.strip() != 'mesh_topology':
+        return False
+    try:
+        return int(attrs.get(varname, 'topology_dimension')) == 2
+    except (TypeError, ValueError):
+        return False
+
 def find_mesh_names( nc ):
     """
     find all the meshes in an open netcCDF4.DataSet
@@ -24,11 +64,8 @@ def find_mesh_names( nc ):
 
     NOTE: checks for 2-d topology_dimension
     """
-    mesh_names = []
-    for varname in nc.variables.keys():
-        if is_valid_mesh(nc, varname):
-                    mesh_names.append(varname)
-    return mesh_names            
+    attrs = _AttributeCache(nc)
+    return [varname for varname in nc.variables if _is_mesh(attrs, varname)]
 
 def is_valid_mesh(nc, varname):
     """
@@ -39,36 +76,39 @@ def is_valid_mesh(nc, varname):
     :param varname: name of the candidate mesh variable
     
     """
-    try:
-        mesh_var = nc.variables[varname]
-    except KeyError:
-        return False
-    try:
-        if  ( mesh_var.cf_role.strip() == 'mesh_topology'  and
-              int( mesh_var.topology_dimension ) == 2
-              ):
-            return True
-    except AttributeError:
-            # not a valid mesh variable
+    if varname not in nc.variables:
         return False
+    return _is_mesh(_AttributeCache(nc), varname)
 
 ## defining properties of various connectivity arrays
 ##   so that the same code can load all of them.
 grid_defs = [{'grid_attr':'faces', # attribute name in UGrid object
               'role': 'face_node_connectivity', # attribute name in mesh variable
               'num_ind': 3, # number of indexes expect (3 for faces, 2 for segments)
+              'location': 'face', # the elements there is one row for
+              'indexes': 'node', # the elements the values are indexes of
+              'flagged': False, # may have -1 for "no element"
               },
              {'grid_attr':'face_face_connectivity', # attribute name in UGrid object
               'role': 'face_face_connectivity', # attribute name in mesh variable
               'num_ind': 3, # number of indexes expect (3 for faces, 2 for segments)
+              'location': 'face',
+              'indexes': 'face',
+              'flagged': True,
               },
              {'grid_attr':'boundaries', # attribute name in UGrid object
               'role': 'boundary_node_connectivity', # attribute name in mesh variable
               'num_ind': 2, # number of indexes expect (3 for faces, 2 for segments)
+              'location': 'boundary',
+              'indexes': 'node',
+              'flagged': False,
               },
              {'grid_attr':'edges', # attribute name in UGrid object
               'role': 'edge_node_connectivity', # attribute name in mesh variable
               'num_ind': 2, # number of indexes expect (3 for faces, 2 for segments)
+              'location': 'edge',
+              'indexes': 'node',
+              'flagged': False,
               },
 
              ]
@@ -76,22 +116,434 @@ grid_defs = [{'grid_attr':'faces', # attribute name in UGrid object
 coord_defs = [ {'grid_attr':'nodes', # attribute name in UGrid object
                 'role': 'node_coordinates', # attribute name in mesh variable
                 'required': True, # is this required?
+                'location': 'node', # the elements there is one coordinate for
                },
                {'grid_attr':'face_coordinates', # attribute name in UGrid object
                 'role': 'face_coordinates', # attribute name in mesh variable
                 'required': False, # is this required?
+                'location': 'face',
                },
                {'grid_attr':'edge_coordinates', # attribute name in UGrid object
                 'role': 'edge_coordinates', # attribute name in mesh variable
                 'required': False, # is this required?
+                'location': 'edge',
                },
                {'grid_attr':'boundary_coordinates', # attribute name in UGrid object
                 'role': 'boundary_coordinates', # attribute name in mesh variable
                 'required': False, # is this required?
+                'location': 'boundary',
                }
              ]
 
-def load_grid_from_nc_dataset(nc, grid, mesh_name=None, load_data=True):
+def _read_unmasked(var, scale=True, key=slice(None)):
+    """
+    read a netCDF4 Variable without building a masked array
+
+    :param var: the variable to read
+    :type var: netCDF4.Variable
+
+    :param scale=True: whether to apply scale_factor and add_offset
+
+    :param key=slice(None): what part of the variable to read -- default is all
+
+    The auto mask (and scale) state of the variable is restored afterward,
+    so that this is safe to use on a Dataset passed in by the user.
+    """
+    mask = getattr(var, 'mask', True)
+    do_scale = getattr(var, 'scale', True)
+    var.set_auto_mask(False)
+    if not scale:
+        var.set_auto_scale(False)
+    try:
+        return var[key]
+    finally:
+        var.set_auto_mask(mask)
+        var.set_auto_scale(do_scale)
+
+
+def read_connectivity(var, num_ind, dtype=None, elements=slice(None)):
+    """
+    read a connectivity array into a C-contiguous, zero-indexed index array
+
+    :param var: the connectivity variable
+    :type var: netCDF4.Variable
+
+    :param num_ind: number of indexes per element (3 for faces, 2 for segments)
+
+    :param dtype=None: the integer dtype of the result -- defaults to
+                       ugrid.IND_DT. It is read straight into this dtype.
+                       A ValueError is raised if the indexes don't fit in
+                       it (or are flagged, and it is unsigned).
+
+    :param elements=slice(None): slice of the elements (rows) to read
+
+    Masking and scaling are turned off for the read, and the start_index
+    shift and the flag values are handled in a single pass into the result
+    buffer -- if the file is already in the right order and dtype, that is
+    done in place, with no copies at all.
+
+    Any entry that is one of the flag_values (or the _FillValue) is set
+    to -1, which is the "no element" flag used throughout pyugrid.
+    """
+    if dtype is None:
+        from .ugrid import IND_DT as dtype
+    dtype = np.dtype(dtype)
+
+    # fortran order, instead of C order, transpose the array
+    # logic below will fail for 3 node or two edge grids
+    if var.shape[0] == num_ind:
+        raw = _read_unmasked(var, scale=False, key=(slice(None), elements)).T
+    else:
+        raw = _read_unmasked(var, scale=False, key=elements)
+
+    try:
+        start_index = int(var.start_index)
+    except AttributeError:
+        start_index = 0
+
+    flags = []
+    for att in ('flag_values', '_FillValue'):
+        try:
+            flags.extend(np.atleast_1d(var.getncattr(att)).tolist())
+        except AttributeError:
+            pass
+    flagged = np.isin(raw, flags) if flags else None
+    if flagged is not None and not flagged.any():
+        flagged = None
+
+    if flagged is not None and dtype.kind == 'u':
+        raise ValueError("%s has flagged entries, which can't be -1 in an unsigned %s array" %
+                         (var.name, dtype))
+    if raw.size and not np.can_cast(raw.dtype, dtype):
+        # make sure a narrowing cast doesn't wrap around
+        values = raw if flagged is None else raw[~flagged]
+        if values.size:
+            info = np.iinfo(dtype)
+            if (int(values.min()) - start_index < info.min or
+                int(values.max()) - start_index > info.max):
+                raise ValueError("the indexes in %s don't fit in %s" % (var.name, dtype))
+
+    if raw.dtype == dtype and raw.flags.c_contiguous and raw.flags.writeable:
+        array = raw  # can work in place
+    else:
+        array = np.empty(raw.shape, dtype=dtype)
+    if start_index != 0:
+        np.subtract(raw, start_index, out=array, casting='unsafe')
+    elif array is not raw:
+        array[...] = raw
+    if flagged is not None:
+        np.putmask(array, flagged, -1)
+    return array
+
+def _num_elements(var, num_ind):
+    """
+    number of elements (rows) in a connectivity variable, in either order
+    """
+    return var.shape[1] if var.shape[0] == num_ind else var.shape[0]
+
+def _contiguous_runs(indexes, max_gap=4096):
+    """
+    split a sorted array of indexes into runs with no gaps bigger than max_gap
+    """
+    breaks = np.flatnonzero(np.diff(indexes) > max_gap) + 1
+    return np.split(indexes, breaks)
+
+def _read_selected(read, indexes, axis=0):
+    """
+    read the selected indexes along one axis, using hyperslab reads
+
+    :param read: function that takes a slice and returns that slice along axis
+
+    :param indexes: sorted array of the indexes to read
+
+    :param axis=0: the axis the indexes are along
+
+    each run of close-together indexes is read as one contiguous block
+    """
+    pieces = [np.take(read(slice(run[0], run[-1] + 1)), run - run[0], axis=axis)
+              for run in _contiguous_runs(indexes) if len(run)]
+    if not pieces:
+        return read(slice(0, 0))
+    if len(pieces) == 1:
+        return pieces[0]
+    if any(isinstance(piece, np.ma.MaskedArray) for piece in pieces):
+        return np.ma.concatenate(pieces, axis=axis)
+    return np.concatenate(pieces, axis=axis)
+
+def _renumber(array, indexes):
+    """
+    renumber an array of indexes into the indexes of a subset
+
+    :param array: array of indexes into the full set of elements
+                  (-1 for no element)
+
+    :param indexes: sorted array of the indexes of the elements in the subset
+
+    anything that is not in the subset is set to -1
+    """
+    if len(indexes) == 0:
+        return np.full_like(array, -1)
+    pos = np.searchsorted(indexes, array)
+    pos[pos == len(indexes)] = 0
+    return np.where((array >= 0) & (indexes[pos] == array), pos, -1)
+
+def _select_bbox(nc, mesh_var, nodes, bbox, block_size=2**20):
+    """
+    find the elements of the mesh that touch a bounding box
+
+    :param nc: the netCDF4 Dataset object
+
+    :param mesh_var: the mesh variable
+
+    :param nodes: the (full) node coordinates
+
+    :param bbox: (min_x, min_y, max_x, max_y) to select
+
+    :param block_size=2**20: number of elements to read at a time
+
+    returns a dict of sorted index arrays of the elements to keep,
+    with 'node', 'face', 'edge', 'boundary' keys (if the mesh has them)
+
+    A face is kept if its bounding box overlaps bbox, and the nodes kept
+    are the ones inside bbox or on a kept face. Edges and boundaries are
+    kept if all their nodes are kept. Only the connectivity arrays are
+    read (in blocks), not the data.
+    """
+    min_x, min_y, max_x, max_y = bbox
+    x, y = nodes[:, 0], nodes[:, 1]
+    keep_nodes = np.flatnonzero((x >= min_x) & (x <= max_x) &
+                                (y >= min_y) & (y <= max_y))
+    selection = {}
+
+    def scan(var, num_ind, test):
+        found = []
+        for start in range(0, _num_elements(var, num_ind), block_size):
+            rows = read_connectivity(var, num_ind, dtype=np.intp,
+                                     elements=slice(start, start + block_size))
+            found.append(np.flatnonzero(test(rows)) + start)
+        return np.concatenate(found) if found else np.zeros((0,), dtype=np.intp)
+
+    def touches_bbox(faces):
+        fx, fy = x[faces], y[faces]
+        return ((fx.max(axis=1) >= min_x) & (fx.min(axis=1) <= max_x) &
+                (fy.max(axis=1) >= min_y) & (fy.min(axis=1) <= max_y))
+
+    try:
+        var = nc.variables[mesh_var.getncattr('face_node_connectivity')]
+    except (AttributeError, KeyError):
+        pass
+    else:
+        keep_faces = scan(var, 3, touches_bbox)
+        faces = _read_selected(lambda sl: read_connectivity(var, 3, dtype=np.intp, elements=sl),
+                               keep_faces)
+        selection['face'] = keep_faces
+        keep_nodes = np.union1d(keep_nodes, faces.ravel())
+
+    selection['node'] = keep_nodes
+    is_kept = np.zeros((len(nodes),), dtype=bool)
+    is_kept[keep_nodes] = True
+    for role, location in (('edge_node_connectivity', 'edge'),
+                           ('boundary_node_connectivity', 'boundary')):
+        try:
+            var = nc.variables[mesh_var.getncattr(role)]
+        except (AttributeError, KeyError):
+            continue
+        selection[location] = scan(var, 2, lambda rows: is_kept[rows].all(axis=1))
+    return selection
+
+def _read_coordinates(nc, mesh_var, defs, indexes=None, dtype=np.float64):
+    """
+    read the coordinates defined by one of the coord_defs
+
+    :param nc: the netCDF4 Dataset object
+
+    :param mesh_var: the mesh variable
+
+    :param defs: the coord_defs entry for these coordinates
+
+    :param indexes=None: sorted indexes of the elements to read -- all if None
+
+    :param dtype=np.float64: the dtype of the result
+
+    returns an (N, 2) array of (longitude, latitude), or None if
+    the coordinates are not in the file (and not required).
+    """
+    try:
+        coord_names = mesh_var.getncattr(defs['role']).strip().split()
+        coord_vars = [nc.variables[name] for name in coord_names]
+    except AttributeError:
+        if defs['required']:
+            raise ValueError("Mesh variable must include %s attribute"%defs['role'])
+        return None
+    except KeyError:
+        raise ValueError("file must include %s variables for %s named in mesh variable"%(coord_names, defs['role']))
+
+    num_node = len(coord_vars[0]) if indexes is None else len(indexes)
+    nodes = np.empty((num_node, 2), dtype=dtype)
+    for var in coord_vars:
+        try:
+            standard_name = var.standard_name
+        except AttributeError:
+            # CF does not require a standard name, so look in units, instead
+            try:
+                units = var.units
+            except AttributeError:
+                raise ValueError("%s variable doesn't contain units attribute: required by CF"%var)
+            if units in ('degrees_east', 'degree_east', 'degree_E', 'degrees_E', 'degreeE', 'degreesE'): # CF accepted units attributes for longitude
+                    standard_name = 'longitude'
+            elif units in ('degrees_north', 'degree_north', 'degree_N', 'degrees_N', 'degreeN', 'degreesN'): # CF accepted units attributes for longitude
+                    standard_name = 'latitude'
+            else:
+                raise ValueError("%s variable's units value (%s) doesn't look like latitude or longitude"%(var, units))
+        if indexes is None:
+            values = _read_unmasked(var)
+        else:
+            values = _read_selected(lambda sl: _read_unmasked(var, key=sl), indexes)
+        if standard_name == 'latitude':
+            nodes[:,1] = values
+        elif standard_name == 'longitude':
+            nodes[:,0] = values
+        else:
+            raise ValueError('Node coordinates standard_name is neither "longitude" nor "latitude" ')
+    return nodes
+
+def inspect_ncfile(filename):
+    """
+    summarize the meshes and data in a netcdf file, without reading any data
+
+    :param filename: filename or OpenDAP url of dataset.
+
+    returns a dict, as from inspect_nc_dataset()
+    """
+    with netCDF4.Dataset(filename, 'r') as nc:
+        return inspect_nc_dataset(nc)
+
+def inspect_nc_dataset(nc):
+    """
+    summarize the meshes and data in an open netCDF4.Dataset
+
+    :param nc: the netCDF4 Dataset object to look in
+
+    Only the attributes needed are read, and no array data at all, so this
+    is fast, even for big files with many variables. Returns a dict:
+
+    ::
+
+      {'filename': the file path,
+       'data_model': e.g. 'NETCDF4',
+       'dimensions': {dimension name: size},
+       'meshes': {mesh name: {'sizes': {'node': num, 'face': num, ...},
+                              'num_vertices': vertices per face (or None),
+                              'variables': {role: variable name},
+                              'data': {location: [data variable names]},
+                              }
+                  },
+       'variables': {data variable name: {'mesh', 'location',
+                                          'dimensions', 'shape', 'dtype',
+                                          'chunking', 'filters'}
+                     },
+       }
+    """
+    attrs = _AttributeCache(nc)
+    ncvars = nc.variables
+
+    summary = {'filename': nc.filepath(),
+               'data_model': nc.data_model,
+               'dimensions': {name: len(dim) for name, dim in nc.dimensions.items()},
+               'meshes': {},
+               'variables': {},
+               }
+
+    for varname in ncvars:
+        if not _is_mesh(attrs, varname):
+            continue
+        mesh = {'sizes': {}, 'num_vertices': None, 'variables': {}, 'data': {}}
+        for defs in coord_defs:
+            names = attrs.get(varname, defs['role'])
+            if names is None:
+                continue
+            mesh['variables'][defs['role']] = names.strip()
+            first = names.split()[0]
+            if first in ncvars:
+                mesh['sizes'][defs['location']] = ncvars[first].shape[0]
+        for defs in grid_defs:
+            name = attrs.get(varname, defs['role'])
+            if name is None:
+                continue
+            name = name.strip()
+            mesh['variables'][defs['role']] = name
+            if name in ncvars:
+                var = ncvars[name]
+                mesh['sizes'][defs['location']] = _num_elements(var, defs['num_ind'])
+                if defs['role'] == 'face_node_connectivity':
+                    mesh['num_vertices'] = (var.shape[0] if var.shape[0] == defs['num_ind']
+                                            else var.shape[1])
+        summary['meshes'][varname] = mesh
+
+    for varname, var in ncvars.items():
+        location = attrs.get(varname, 'location')
+        mesh_name = attrs.get(varname, 'mesh')
+        if location is None or mesh_name not in summary['meshes']:
+            continue
+        summary['meshes'][mesh_name]['data'].setdefault(location, []).append(varname)
+        summary['variables'][varname] = {'mesh': mesh_name,
+                                         'location': location,
+                                         'dimensions': var.dimensions,
+                                         'shape': var.shape,
+                                         'dtype': var.dtype,
+                                         'chunking': var.chunking(),
+                                         'filters': var.filters(),
+                                         }
+    return summary
+
+def find_time_dim(nc):
+    """
+    find the time dimension of an open netCDF4.Dataset
+
+    :param nc: the netCDF4 Dataset object to look in
+
+    returns the name of the unlimited dimension if there is one,
+    otherwise 'time' if there is a dimension of that name, otherwise None.
+    """
+    for name, dim in nc.dimensions.items():
+        if dim.isunlimited():
+            return name
+    if 'time' in nc.dimensions:
+        return 'time'
+    return None
+
+def find_data_vars(nc, mesh_name):
+    """
+    find all the data variables associated with the given mesh
+
+    :param nc: the netCDF4 Dataset object to look in
+
+    :param mesh_name: name of the mesh the data should be on
+
+    yields (name, variable, location, attributes) for each one,
+    where name is the name the DataSet should get, and attributes
+    are the extra attributes of the variable.
+    """
+    attrs = _AttributeCache(nc)
+    ## look for data arrays -- they should have a "location" attribute
+    for name, var in nc.variables.items():
+
+        #Data Arrays should have "location" and "mesh" attributes
+        location = attrs.get(name, 'location')
+        # the mesh attribute should match the mesh we're loading:
+        if location is None or attrs.get(name, 'mesh') != mesh_name:
+            continue
+
+        #get the attributes
+        ## fixme: is there a way to get the attributes a dict directly?
+        attributes = { n: var.getncattr(n) for n in var.ncattrs() if n not in ('location', 'coordinates', 'mesh')}
+
+        # trick with the name: fixme: is this a good idea?
+        if name.startswith(mesh_name + '_'):
+            name = name[len(mesh_name) + 1:]
+        yield name, var, location, attributes
+
+def load_grid_from_nc_dataset(nc, grid, mesh_name=None, load_data=True, bbox=None):
     """
     loads UGrid object from a netCDF4.DataSet object, adding the data
     to the passed-in grid object.
@@ -113,6 +565,11 @@ def load_grid_from_nc_dataset(nc, grid, mesh_name=None, load_data=True):
                             associated with the mesh will be loaded. This could be huge!
     :type load_data: boolean
 
+    :param bbox=None: (min_x, min_y, max_x, max_y) bounding box to subset the
+                      mesh to. If given, only the parts of the mesh (and data)
+                      that touch the box are read, and the result is a small,
+                      renumbered grid.
+
     NOTE: passing the UGrid object in to avoid circular references,
     while keeping the netcdf reading code in its own file.
     """
@@ -136,44 +593,23 @@ def load_grid_from_nc_dataset(nc, grid, mesh_name=None, load_data=True):
     mesh_var = ncvars[mesh_name]
 
 
+    ## subset to a bounding box
+    selection = {} # location: indexes of the elements to load -- all if not there
+    nodes = None
+    if bbox is not None:
+        nodes = _read_coordinates(nc, mesh_var, coord_defs[0], dtype=grid.node_dtype)
+        selection = _select_bbox(nc, mesh_var, nodes, bbox)
+        nodes = nodes[selection['node']]
+
     ## Load the coordinate variables
     for defs in coord_defs:
-        try:
-            coord_names = mesh_var.getncattr(defs['role']).strip().split()
-            coord_vars = [nc.variables[name] for name in coord_names]
-        except AttributeError:
-            if defs['required']:
-                raise ValueError("Mesh variable must include %s attribute"%defs['role'])
-            continue
-        except KeyError:
-            raise ValueError("file must include %s variables for %s named in mesh variable"%(coord_names, defs['role']))
-
-        coord_vars = [nc.variables[name] for name in coord_names]
-        num_node = len(coord_vars[0])
-        nodes = np.empty((num_node, 2), dtype=np.float64)
-        for var in coord_vars:
-            try:
-                standard_name = var.standard_name
-            except AttributeError:
-                # CF does not require a standard name, so look in units, instead
-                try:
-                    units = var.units
-                except AttributeError:
-                    raise ValueError("%s variable doesn't contain units attribute: required by CF"%var)
-                if units in ('degrees_east', 'degree_east', 'degree_E', 'degrees_E', 'degreeE', 'degreesE'): # CF accepted units attributes for longitude
-                        standard_name = 'longitude'
-                elif units in ('degrees_north', 'degree_north', 'degree_N', 'degrees_N', 'degreeN', 'degreesN'): # CF accepted units attributes for longitude
-                        standard_name = 'latitude'
-                else:
-                    raise ValueError("%s variable's units value (%s) doesn't look like latitude or longitude"%(var, units))
-            if standard_name == 'latitude':
-                nodes[:,1] = var[:]
-            elif standard_name == 'longitude':
-                nodes[:,0] = var[:]
-            else:
-                raise ValueError('Node coordinates standard_name is neither "longitude" nor "latitude" ') 
-        
-        setattr(grid, defs['grid_attr'], nodes)
+        if defs['location'] == 'node' and nodes is not None:
+            coords = nodes # already read for the subset
+        else:
+            coords = _read_coordinates(nc, mesh_var, defs, selection.get(defs['location']),
+                                       dtype=grid.node_dtype)
+        if coords is not None:
+            setattr(grid, defs['grid_attr'], coords)
 
 
     ## Load assorted connectivity arrays
@@ -183,24 +619,15 @@ def load_grid_from_nc_dataset(nc, grid, mesh_name=None, load_data=True):
                 var = nc.variables[mesh_var.getncattr(defs['role'])]
             except AttributeError: # this connectivity array isn't there
                 continue
-            array = var[:,:]
-            # fortran order, instead of C order, transpose the array
-            # logic below will fail for 3 node or two edge grids
-            if array.shape[0] == defs['num_ind']:
-                array = array.T
-            try:
-                start_index = var.start_index
-            except AttributeError:
-                start_index = 0
-            if start_index  >= 1:
-                array -= start_index
-                # check for flag value
-                try:
-                    ## fixme: this won't work for more than one flag value
-                    flag_value = var.flag_values
-                    array[array==flag_value-start_index] = flag_value
-                except AttributeError:
-                    pass
+            # read straight into the grid's dtype
+            dtype = grid.flag_dtype if defs['flagged'] else grid.index_dtype
+            indexes = selection.get(defs['location'])
+            if indexes is None:
+                array = read_connectivity(var, defs['num_ind'], dtype)
+            else:
+                array = _read_selected(lambda sl: read_connectivity(var, defs['num_ind'], dtype, elements=sl),
+                                       indexes)
+                array = _renumber(array, selection[defs['indexes']]).astype(dtype)
             setattr(grid, defs['grid_attr'], array)
         except KeyError:
             pass ## OK not to have this...
@@ -208,29 +635,25 @@ def load_grid_from_nc_dataset(nc, grid, mesh_name=None, load_data=True):
     ## Load the associated data:
 
     if load_data:
-        ## look for data arrays -- they should have a "location" attribute
-        for name, var in nc.variables.items():
-
-            #Data Arrays should have "location" and "mesh" attributes
-            try:
-                location = var.location
-                # the mesh attribute should match the mesh we're loading:
-                if var.mesh != mesh_name:
-                    continue
-            except AttributeError:
-                continue
-
-            #get the attributes
-            ## fixme: is there a way to get the attributes a dict directly?
-            attributes = { n: var.getncattr(n) for n in var.ncattrs() if n not in ('location', 'coordinates', 'mesh')}
-
-            # trick with the name: fixme: is this a good idea?
-            name = name.lstrip(mesh_name).lstrip('_')
-            ds = DataSet(name, data=var[:], location=location, attributes=attributes)
+        time_dim = find_time_dim(nc)
+        for name, var, location, attributes in find_data_vars(nc, mesh_name):
+            time = None
+            if var.ndim > 1 and var.dimensions[0] == time_dim and time_dim in ncvars:
+                time = ncvars[time_dim][:]
+            indexes = selection.get(location)
+            if indexes is None:
+                data = var[:]
+            else:
+                # the location is always the last dimension
+                data = _read_selected(lambda sl: var[..., sl], indexes, axis=-1)
+            ds = DataSet(name, data=data, location=location, attributes=attributes, time=time)
 
             grid.add_data(ds)
 
-def load_grid_from_ncfilename(filename, grid, mesh_name=None, load_data=True):
+    ## it all matches the file, now
+    grid.mark_clean()
+
+def load_grid_from_ncfilename(filename, grid, mesh_name=None, load_data=True, bbox=None):
     """
     loads UGrid object from a netcdf file, adding the data
     to the passed-in grid object.
@@ -252,10 +675,15 @@ def load_grid_from_ncfilename(filename, grid, mesh_name=None, load_data=True):
                             associated with the mesh will be loaded. This could be huge!
     :type load_data: boolean
 
+    :param bbox=None: (min_x, min_y, max_x, max_y) bounding box to subset the
+                      mesh to. If given, only the parts of the mesh (and data)
+                      that touch the box are read, and the result is a small,
+                      renumbered grid.
+
     NOTE: passing the UGrid object in to avoid circular references,
     while keeping the netcdf reading code in its own file.
     """
 
     with netCDF4.Dataset(filename, 'r') as nc:
-        load_grid_from_nc_dataset(nc, grid, mesh_name, load_data)
+        load_grid_from_nc_dataset(nc, grid, mesh_name, load_data, bbox)
 
@@ -0,0 +1,377 @@
+#!/usr/bin/env python
+
+"""
+code to reduce time-varying data over time: means, standard deviations,
+minima, maxima, counts of exceedances of thresholds, and percentiles --
+over the whole time series, or over periods of it (days, months...).
+
+The data is read a block of time steps at a time, and each block is
+reduced to running statistics (Welford / Chan et al. accumulators),
+which are merged. So memory use depends on the block size, not the
+length of the time series, and the blocks are read and reduced in
+parallel on a pool of threads.
+
+Percentiles are approximate: they are found from a histogram of each
+location's values between its minimum and maximum, which takes a
+second pass through the data.
+
+NaN values (and masked values, and those a DataSet's or UCube's
+validity mask flags as missing) are left out.
+
+This code is called by the UCube and DataSet classes (reduce_time)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import threading
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+
+from .data_set import DataSet
+
+# the statistics reduce_time() can compute, and their CF cell_methods
+STATS = {'mean': 'time: mean',
+         'std': 'time: standard_deviation',
+         'min': 'time: minimum',
+         'max': 'time: maximum',
+         'count': None,
+         }
+
+
+def _as_float(block, valid=None):
+    """
+    a block of data as float64, with masked (and not valid) values NaN
+    """
+    if isinstance(block, np.ma.MaskedArray):
+        block = np.ma.filled(block.astype(np.float64), np.nan)
+    if valid is not None:
+        return np.where(valid, block, np.nan)
+    return np.asarray(block, dtype=np.float64)
+
+
+class Accumulator(object):
+    """
+    running statistics over time (the first axis) of blocks of data
+
+    count, mean, m2 (the sum of squared differences from the mean),
+    min, max and exceed (the count above each threshold) for each
+    location. Accumulators of different blocks are combined with merge().
+    """
+
+    def __init__(self, shape, thresholds=()):
+        self.thresholds = tuple(thresholds)
+        self.count = np.zeros(shape, dtype=np.int64)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+        self.min = np.full(shape, np.nan)
+        self.max = np.full(shape, np.nan)
+        self.exceed = np.zeros((len(self.thresholds),) + tuple(shape), dtype=np.int64)
+
+    @classmethod
+    def from_block(klass, block, thresholds=(), valid=None):
+        """
+        the statistics of a block of time steps
+
+        :param valid=None: boolean array, False for values to leave out
+        """
+        block = _as_float(block, valid)
+        acc = klass.__new__(klass)
+        acc.thresholds = tuple(thresholds)
+        invalid = np.isnan(block)
+        if not invalid.any():
+            ## the usual case -- no need to leave anything out
+            acc.count = np.full(block.shape[1:], len(block), dtype=np.int64)
+            acc.mean = block.mean(axis=0) if len(block) else np.zeros(block.shape[1:])
+            deviations = block - acc.mean
+            acc.min = block.min(axis=0) if len(block) else np.full(block.shape[1:], np.nan)
+            acc.max = block.max(axis=0) if len(block) else np.full(block.shape[1:], np.nan)
+        else:
+            acc.count = len(block) - invalid.sum(axis=0, dtype=np.int64)
+            total = np.where(invalid, 0.0, block).sum(axis=0)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                acc.mean = np.where(acc.count > 0, total / acc.count, 0.0)
+            deviations = np.where(invalid, 0.0, block - acc.mean)
+            acc.min = np.fmin.reduce(block, axis=0)
+            acc.max = np.fmax.reduce(block, axis=0)
+        acc.m2 = np.einsum('i...,i...->...', deviations, deviations)
+        acc.exceed = np.zeros((len(acc.thresholds),) + acc.count.shape, dtype=np.int64)
+        with np.errstate(invalid='ignore'):
+            for i, threshold in enumerate(acc.thresholds):
+                acc.exceed[i] = (block > threshold).sum(axis=0)
+        return acc
+
+    def merge(self, other):
+        """
+        add the statistics of another block (in place)
+        """
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(count > 0, other.count / np.maximum(count, 1), 0.0)
+        self.mean = self.mean + delta * fraction
+        self.m2 = self.m2 + other.m2 + delta * delta * self.count * fraction
+        self.count = count
+        self.min = np.fmin(self.min, other.min)
+        self.max = np.fmax(self.max, other.max)
+        self.exceed = self.exceed + other.exceed
+        return self
+
+    def result(self, stat, ddof=0):
+        """
+        the statistic: 'mean', 'std', 'min', 'max' or 'count' -- NaN
+        where there was no data
+        """
+        empty = self.count == 0
+        if stat == 'count':
+            return self.count
+        if stat == 'mean':
+            return np.where(empty, np.nan, self.mean)
+        if stat == 'std':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return np.sqrt(np.where(self.count > ddof, self.m2 / (self.count - ddof), np.nan))
+        if stat == 'min':
+            return self.min
+        if stat == 'max':
+            return self.max
+        raise ValueError("unknown statistic: %r" % (stat,))
+
+
+class Histogram(object):
+    """
+    a histogram of each location's values over time, between a
+    low and a high value for each location -- for approximate percentiles
+    """
+
+    def __init__(self, low, high, bins=64):
+        self.low = low
+        self.bins = bins
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.scale = np.where(high > low, bins / (high - low), 0.0)
+        self.counts = np.zeros(low.shape + (bins,), dtype=np.int64)
+        ## where each location's bins start in the flattened counts
+        self._offsets = np.arange(low.size, dtype=np.intp).reshape(low.shape) * bins
+        self._lock = threading.Lock()
+
+    def add(self, block, valid=None):
+        """
+        add a block of time steps to the histogram -- blocks can be added
+        from more than one thread at once
+
+        :param valid=None: boolean array, False for values to leave out
+        """
+        block = _as_float(block, valid)
+        with np.errstate(invalid='ignore'):
+            bin_index = np.clip(np.floor((block - self.low) * self.scale), 0, self.bins - 1)
+            flat = bin_index.astype(np.intp) + self._offsets
+        invalid = np.isnan(block)
+        flat = flat[~invalid] if invalid.any() else flat.ravel()
+        with self._lock:
+            np.add.at(self.counts.reshape(-1), flat, 1)
+
+    def percentile(self, q):
+        """
+        the q-th percentile of each location's values, interpolated
+        within the histogram bin it falls in
+        """
+        total = self.counts.sum(axis=-1)
+        cumulative = np.cumsum(self.counts, axis=-1)
+        target = q / 100.0 * total
+        ## the first bin where the cumulative count reaches the target
+        index = np.minimum((cumulative < target[..., np.newaxis]).sum(axis=-1), self.bins - 1)
+        in_bin = np.take_along_axis(self.counts, index[..., np.newaxis], -1)[..., 0]
+        before = np.take_along_axis(cumulative, index[..., np.newaxis], -1)[..., 0] - in_bin
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(in_bin > 0, (target - before) / in_bin, 0.0)
+            width = np.where(self.scale > 0, 1.0 / self.scale, 0.0)
+        value = self.low + (index + np.clip(fraction, 0, 1)) * width
+        return np.where(total > 0, value, np.nan)
+
+
+def _tasks(time, num_times, chunk, time_bins):
+    """
+    the (bin, start, stop) blocks of time steps to reduce: blocks of up
+    to chunk steps, that don't cross the edges of the time bins
+    """
+    if time_bins is None:
+        step_bins = np.zeros((num_times,), dtype=np.intp)
+    else:
+        step_bins = np.searchsorted(time_bins, time, side='right') - 1
+        step_bins[(step_bins < 0) | (step_bins >= len(time_bins) - 1)] = -1
+    tasks = []
+    for start in range(0, num_times, chunk):
+        stop = min(start + chunk, num_times)
+        bins = step_bins[start:stop]
+        breaks = np.flatnonzero(np.diff(bins)) + 1
+        for run_start, run_stop in zip(np.r_[0, breaks], np.r_[breaks, len(bins)]):
+            if bins[run_start] >= 0:
+                tasks.append((int(bins[run_start]), start + run_start, start + run_stop))
+    return tasks
+
+
+def _map(workers, function, tasks):
+    """
+    apply function to the tasks on a pool of threads -- results in order
+
+    At most workers + 1 tasks are started and not yet taken, so the
+    results of blocks read ahead don't pile up in memory.
+    """
+    if workers <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            yield function(task)
+        return
+    workers = min(workers, len(tasks))
+    pool = ThreadPool(workers)
+    pending = deque()
+    try:
+        for task in tasks:
+            if len(pending) > workers:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(function, (task,)))
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+
+
+def reduce_time(source, stats=('mean',), thresholds=(), percentiles=(), time_bins=None,
+                chunk=None, workers=4, bins=64, ddof=0):
+    """
+    reduce time-varying data over time, streaming through it a block at a time
+
+    :param source: the data: a UCube or a DataSet with a time axis
+
+    :param stats=('mean',): the statistics to compute: 'mean', 'std', 'min',
+                            'max' and/or 'count' (of the values that aren't NaN)
+
+    :param thresholds=(): count the time steps with values above each of these
+
+    :param percentiles=(): approximate percentiles to compute, from 0 to 100.
+                           These take a second pass through the data, and
+                           a histogram of bins values for each location
+                           (per thread).
+
+    :param time_bins=None: edges of periods to reduce over separately, in
+                           the units of the times -- e.g. the start of
+                           each day, and the end of the last. Time steps
+                           outside them are left out. Default: all the times.
+
+    :param chunk=None: the number of time steps read at once. Defaults
+                       to the cube's chunk_steps, or about 4 million values.
+
+    :param workers=4: the number of blocks read and reduced at once, on
+                      a pool of threads
+
+    :param bins=64: the number of histogram bins for the percentiles:
+                    they are accurate to (max - min) / bins at each location
+
+    :param ddof=0: delta degrees of freedom for the standard deviation
+
+    returns a dict of DataSets on the same location as the data, keyed by
+    statistic: 'mean', 'std', 'min', 'max', 'count', 'gt_<threshold>'
+    and 'p<percentile>', named <name>_<key>. With time_bins, their first
+    axis is the periods, and their times the start of each period -- they
+    can be saved together, but a file has only one time axis, so not with
+    data at other times.
+    """
+    from .ucube import UCube, default_block_steps
+
+    for stat in stats:
+        if stat not in STATS:
+            raise ValueError("unknown statistic: %r -- use one of %s" % (stat, ", ".join(STATS)))
+    for q in percentiles:
+        if not 0 <= q <= 100:
+            raise ValueError("percentiles must be between 0 and 100, not %r" % (q,))
+    if source.time is None:
+        raise ValueError("%s does not vary in time" % source.name)
+
+    data = source if isinstance(source, UCube) else source.data
+    time = np.asarray(source.time)
+    num_times = data.shape[0]
+    if chunk is None:
+        chunk = source.block_steps() if isinstance(source, UCube) else default_block_steps(data.shape)
+    if chunk < 1:
+        raise ValueError("chunk must be at least one time step")
+    if time_bins is not None:
+        time_bins = np.asarray(time_bins)
+        if time_bins.ndim != 1 or len(time_bins) < 2 or (np.diff(time_bins) <= 0).any():
+            raise ValueError("time_bins must be at least two increasing times")
+    num_bins = 1 if time_bins is None else len(time_bins) - 1
+    tasks = _tasks(time, num_times, chunk, time_bins)
+    step_shape = tuple(data.shape[1:])
+
+    accumulators = [Accumulator(step_shape, thresholds) for i in range(num_bins)]
+
+    def valid(start, stop):
+        ## the DataSet's validity mask, for the block -- a cube's blocks are
+        ## read as masked arrays, with its validity mask applied
+        if isinstance(source, UCube):
+            return None
+        return source.valid_mask(slice(start, stop))
+
+    def reduce_block(task):
+        bin_num, start, stop = task
+        return bin_num, Accumulator.from_block(data[start:stop], thresholds, valid(start, stop))
+
+    for bin_num, acc in _map(workers, reduce_block, tasks):
+        accumulators[bin_num].merge(acc)
+
+    results = []
+    for stat in stats:
+        results.append((stat, [acc.result(stat, ddof) for acc in accumulators]))
+    for i, threshold in enumerate(thresholds):
+        results.append(("gt_%g" % threshold, [acc.exceed[i] for acc in accumulators]))
+
+    if percentiles:
+        histograms = [Histogram(acc.min, acc.max, bins) for acc in accumulators]
+
+        def histogram_block(task):
+            bin_num, start, stop = task
+            histograms[bin_num].add(data[start:stop], valid(start, stop))
+
+        for done in _map(workers, histogram_block, tasks):
+            pass
+        for q in percentiles:
+            results.append(("p%g" % q, [hist.percentile(q) for hist in histograms]))
+
+    datasets = {}
+    for key, values in results:
+        if time_bins is None:
+            values, times = values[0], None
+        else:
+            values, times = np.array(values), time_bins[:-1]
+        datasets[key] = DataSet("%s_%s" % (source.name, key),
+                                location=source.location,
+                                data=values,
+                                attributes=_attributes(source, key, thresholds),
+                                time=times)
+    return datasets
+
+
+def _attributes(source, key, thresholds):
+    """
+    the attributes of a statistic of the source
+    """
+    name = source.name
+    units = source.attributes.get('units')
+    attributes = {}
+    if key in STATS and STATS[key] is not None:
+        attributes['cell_methods'] = STATS[key]
+        attributes['long_name'] = "%s of %s" % ({'std': 'standard deviation',
+                                                 'min': 'minimum',
+                                                 'max': 'maximum'}.get(key, key), name)
+        if units is not None:
+            attributes['units'] = units
+    elif key == 'count':
+        attributes['long_name'] = "number of time steps with %s" % name
+    elif key.startswith('gt_'):
+        attributes['long_name'] = "number of time steps with %s > %s" % (name, key[3:])
+    else:
+        attributes['long_name'] = "%s percentile of %s" % (key[1:], name)
+        if units is not None:
+            attributes['units'] = units
+    ## the statistics that are still the same quantity
+    if 'standard_name' in source.attributes and 'units' in attributes:
+        attributes['standard_name'] = source.attributes['standard_name']
+    return attributes
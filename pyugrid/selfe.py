@@ -0,0 +1,805 @@
+#!/usr/bin/env python
+
+"""
+code to read SELFE model output: data format v5 binary files
+(1_elev.61, 1_salt.63, 1_hvel.64, etc.)
+
+A file is a header, with the vertical and horizontal grids, followed by
+one fixed size record per time step:
+
+    time (float32), iteration (int32),
+    eta[np] (float32), values[grid_size, ivs] (float32)
+
+The records are memory-mapped with a numpy record dtype, so the time
+series of any variable is a strided view of the file: nothing is read
+until it is indexed, and only the pages that hold the requested
+values are read.
+
+For 3D variables, each node has values from its bottom level (bot_idx)
+up to the surface, so the nodes' columns are of different lengths: the
+values of a record are the columns of all the nodes, one after the
+other.
+
+read_time_series() extracts the time series at some nodes or points
+from a run's series of files (1_elev.61, 2_elev.61, ...), on a pool of
+processes.
+
+convert_to_netcdf() converts a run's series of files to a UGRID netcdf
+file, a time step at a time.
+
+This code is called by the UGrid class (UGrid.from_selfe)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import multiprocessing
+import os
+
+import numpy as np
+
+from .data_set import DataSet
+from .write_netcdf import TimeSeriesWriter
+from .util import build_face_tree, locate_points
+
+# the length of the strings at the start of the header
+HEADER_STRING_LENGTH = 48
+
+# CF attributes for the variables SELFE writes -- a list for vectors
+VARIABLE_ATTRIBUTES = {
+    'elev': {'standard_name': 'sea_surface_height_above_geoid', 'units': 'm'},
+    'salt': {'standard_name': 'sea_water_salinity', 'units': '1e-3'},
+    'temp': {'standard_name': 'sea_water_temperature', 'units': 'degC'},
+    'hvel': [{'standard_name': 'eastward_sea_water_velocity', 'units': 'm s-1'},
+             {'standard_name': 'northward_sea_water_velocity', 'units': 'm s-1'}],
+    'dahv': [{'standard_name': 'eastward_sea_water_velocity', 'units': 'm s-1',
+              'long_name': 'depth averaged eastward velocity'},
+             {'standard_name': 'northward_sea_water_velocity', 'units': 'm s-1',
+              'long_name': 'depth averaged northward velocity'}],
+    'wind': [{'standard_name': 'eastward_wind', 'units': 'm s-1'},
+             {'standard_name': 'northward_wind', 'units': 'm s-1'}],
+}
+
+
+def _read(infile, dtype, count=1):
+    """
+    read count items from the file -- raises a ValueError if it is too short
+    """
+    dtype = np.dtype(dtype)
+    count = int(count)
+    buf = infile.read(dtype.itemsize * count)
+    if len(buf) != dtype.itemsize * count:
+        raise ValueError("%s is too short: it ends in the header" % infile.name)
+    return np.frombuffer(buf, dtype=dtype, count=count)
+
+
+def _read_string(infile):
+    return _read(infile, 'S%i' % HEADER_STRING_LENGTH)[0].decode('latin-1').strip()
+
+
+def _read_elements(infile, num_elements, byteorder):
+    """
+    read the element table: for each element the number of nodes, then the nodes
+
+    returns a (num_elements, max nodes) array of 1-based node numbers,
+    padded with 0 for elements with fewer nodes than the others.
+    """
+    int_dt = byteorder + 'i4'
+    start = infile.tell()
+    ## SELFE v5 meshes are all triangles -- read them in one go
+    table = _read(infile, int_dt, 4 * num_elements).reshape(num_elements, 4)
+    if (table[:, 0] == 3).all():
+        return table[:, 1:]
+    ## mixed triangles and quads: the rows are different lengths
+    infile.seek(start)
+    elements = np.zeros((num_elements, 4), dtype=np.int32)
+    for i in range(num_elements):
+        num_nodes = _read(infile, int_dt)[0]
+        if num_nodes not in (3, 4):
+            raise ValueError("element %i has %i nodes -- only triangles and "
+                             "quads are supported" % (i + 1, num_nodes))
+        elements[i, :num_nodes] = _read(infile, int_dt, num_nodes)
+    return elements
+
+
+class SelfeOutput(object):
+    """
+    A SELFE v5 binary output file, with its time steps memory-mapped
+
+    records: the time steps, as a numpy record array with the fields
+             'time', 'iteration', 'eta' and 'values'.
+
+    time, iteration, eta, values: views of those fields -- e.g. values
+             is a (num_steps, grid_size, ivs) array
+    """
+
+    def __init__(self, filename, byteorder='<'):
+        """
+        open a SELFE output file, and memory-map its time steps
+
+        :param filename: path to the file (e.g. 1_salt.63)
+
+        :param byteorder='<': the byte order the file was written in:
+                              '<' little-endian, '>' big-endian.
+        """
+        if byteorder not in ('<', '>'):
+            raise ValueError("byteorder must be '<' or '>', not %r" % (byteorder,))
+        self.filename = filename
+        self.byteorder = byteorder
+        with open(filename, 'rb') as infile:
+            self._read_header(infile)
+            self._read_hgrid(infile)
+            self.data_start = infile.tell()
+        self._compute_step_size()
+        self.records = self._map_records()
+        self._face_tree = None
+
+    def _read_header(self, infile):
+        int_dt = self.byteorder + 'i4'
+        float_dt = self.byteorder + 'f4'
+
+        self.data_format = _read_string(infile)
+        if not self.data_format.startswith('DataFormat v5'):
+            raise ValueError("%s is not a SELFE v5 binary file (its data format is %r)" %
+                             (self.filename, self.data_format))
+        self.version = _read_string(infile)
+        self.start_time = _read_string(infile)
+        self.var_type = _read_string(infile)
+        self.var_dimension = _read_string(infile)
+        self.nsteps = int(_read(infile, int_dt)[0])
+        self.dt = float(_read(infile, float_dt)[0])
+        self.skip = int(_read(infile, int_dt)[0])
+        self.flag_sv = int(_read(infile, int_dt)[0])
+        self.flag_dm = int(_read(infile, int_dt)[0])
+        if self.flag_sv not in (1, 2):
+            raise ValueError("%s has %i values per point -- expected 1 (scalar) "
+                             "or 2 (vector)" % (self.filename, self.flag_sv))
+        if self.flag_dm not in (2, 3):
+            raise ValueError("%s is %iD -- expected 2D or 3D" % (self.filename, self.flag_dm))
+
+        ## the vertical grid
+        self.nlevels = int(_read(infile, int_dt)[0])
+        self.kz = int(_read(infile, int_dt)[0])
+        self.h0, self.hs, self.hc, self.theta_b, self.theta = _read(infile, float_dt, 5)
+        self.zlevels = _read(infile, float_dt, self.kz)
+        self.slevels = _read(infile, float_dt, self.nlevels - self.kz)
+
+    def _read_hgrid(self, infile):
+        int_dt = self.byteorder + 'i4'
+        float_dt = self.byteorder + 'f4'
+
+        self.np, self.ne = [int(n) for n in _read(infile, int_dt, 2)]
+        nodes = _read(infile, [('x', float_dt), ('y', float_dt),
+                               ('dp', float_dt), ('bot_idx', int_dt)], self.np)
+        self.x = nodes['x']
+        self.y = nodes['y']
+        self.dp = nodes['dp']
+        ## dry nodes can have a bottom index of 0
+        self.bot_idx = np.maximum(nodes['bot_idx'], 1)
+        self.elem = _read_elements(infile, self.ne, self.byteorder)
+
+    def _compute_step_size(self):
+        """
+        the size of the values of a time step, and of the whole record
+        """
+        if self.flag_dm == 3:
+            self.level_counts = self.nlevels - self.bot_idx + 1
+        else:
+            self.level_counts = np.ones((self.np,), dtype=np.int32)
+        ## CSR style offsets: the column of node i is
+        ## values[level_offsets[i]:level_offsets[i + 1]]
+        self.level_offsets = np.zeros((self.np + 1,), dtype=np.int64)
+        np.cumsum(self.level_counts, out=self.level_offsets[1:])
+        self.grid_size = int(self.level_offsets[-1])
+        self.step_size = 2 * 4 + self.np * 4 + self.grid_size * 4 * self.flag_sv
+
+    @property
+    def record_dtype(self):
+        """
+        the numpy dtype of one time step
+        """
+        float_dt = self.byteorder + 'f4'
+        dtype = np.dtype([('time', float_dt),
+                          ('iteration', self.byteorder + 'i4'),
+                          ('eta', float_dt, (self.np,)),
+                          ('values', float_dt, (self.grid_size, self.flag_sv)),
+                          ])
+        assert dtype.itemsize == self.step_size
+        return dtype
+
+    def _map_records(self):
+        """
+        memory-map the time steps
+
+        A file that is still being written (or was cut short) can have
+        fewer steps than the header says: only the complete ones are mapped.
+        """
+        num_bytes = os.path.getsize(self.filename) - self.data_start
+        num_steps = min(self.nsteps, num_bytes // self.step_size)
+        if num_steps == 0:
+            return np.zeros((0,), dtype=self.record_dtype)
+        return np.memmap(self.filename, dtype=self.record_dtype, mode='r',
+                         offset=self.data_start, shape=(num_steps,))
+
+    @property
+    def num_steps(self):
+        return len(self.records)
+
+    @property
+    def time(self):
+        return self.records['time']
+
+    @property
+    def iteration(self):
+        return self.records['iteration']
+
+    @property
+    def eta(self):
+        return self.records['eta']
+
+    @property
+    def values(self):
+        return self.records['values']
+
+    @property
+    def data(self):
+        """
+        the values as a (num_steps, np, nlevels, ivs) view of the file --
+        for 2D variables nlevels is 1
+
+        Only possible if every node has all the levels (pure S
+        coordinates, with no dry nodes): raises a ValueError otherwise.
+        """
+        nlevels = self.num_levels
+        if self.grid_size != self.np * nlevels:
+            raise ValueError("the nodes of %s don't all have %i levels -- "
+                             "use read_profiles()" % (self.filename, nlevels))
+        return self.values.reshape(self.num_steps, self.np, nlevels, self.flag_sv)
+
+    @property
+    def num_levels(self):
+        """
+        the number of levels: 1 for a 2D variable
+        """
+        return self.nlevels if self.flag_dm == 3 else 1
+
+    def value_rows(self, nodes, levels):
+        """
+        the rows of the values (the second axis of values) that hold
+        the given nodes and levels
+
+        :param nodes: node indexes (from 0)
+
+        :param levels: level indexes, from 0 for the bottom level of the
+                       vertical grid (SELFE's level 1) -- as in data.
+
+        nodes and levels are broadcast together, so e.g.
+        value_rows(nodes[:, None], levels) gives the rows of every level
+        of each node. Levels below the bottom of their node are -1.
+        """
+        nodes = np.asarray(nodes, dtype=np.intp)
+        levels = np.asarray(levels, dtype=np.intp)
+        if nodes.size and (nodes.min() < 0 or nodes.max() >= self.np):
+            raise ValueError("node indexes must be in the range [0, %i)" % self.np)
+        if levels.size and (levels.min() < 0 or levels.max() >= self.num_levels):
+            raise ValueError("level indexes must be in the range [0, %i)" % self.num_levels)
+        ## the level of the first value of each node's column
+        bottom = self.num_levels - self.level_counts[nodes]
+        rows = self.level_offsets[nodes] + (levels - bottom)
+        return np.where(levels >= bottom, rows, -1)
+
+    def file_offsets(self, steps, nodes, levels, var=0):
+        """
+        the positions in the file (in bytes) of values
+
+        :param steps: time step indexes
+
+        :param nodes, levels: as for value_rows()
+
+        :param var=0: the component: 0, or 1 for the second component of
+                      a vector variable.
+
+        all the arguments are broadcast together. Levels below the bottom
+        of their node are -1.
+        """
+        rows = self.value_rows(nodes, levels)
+        steps = np.asarray(steps, dtype=np.int64)
+        var = np.asarray(var, dtype=np.int64)
+        if var.size and (var.min() < 0 or var.max() >= self.flag_sv):
+            raise ValueError("var must be in the range [0, %i)" % self.flag_sv)
+        offsets = (self.data_start + steps * self.step_size + 8 + 4 * self.np +
+                   (rows * self.flag_sv + var) * 4)
+        return np.where(rows >= 0, offsets, -1)
+
+    def read_profiles(self, nodes, levels=None, steps=None):
+        """
+        read the vertical profiles at some nodes
+
+        :param nodes: the node indexes (from 0)
+
+        :param levels=None: the level indexes (see value_rows). Defaults to all.
+
+        :param steps=None: the time steps: an index, slice or array of
+                           indexes. Defaults to all.
+
+        returns a (num steps, num nodes, num levels, ivs) float32 array, with
+        NaN for the levels below the bottom. Only the values asked for
+        are read from the file, not whole time steps.
+        """
+        nodes = np.atleast_1d(np.asarray(nodes, dtype=np.intp))
+        if levels is None:
+            levels = np.arange(self.num_levels)
+        levels = np.atleast_1d(np.asarray(levels, dtype=np.intp))
+        rows = self.value_rows(nodes[:, np.newaxis], levels[np.newaxis, :])
+        values = self.values if steps is None else self.values[steps]
+        profiles = values[..., np.maximum(rows, 0), :].astype(np.float32)
+        profiles[..., rows < 0, :] = np.nan
+        return profiles
+
+    @property
+    def variable_name(self):
+        """
+        the name of the variable, from the file name: 1_salt.63 -> 'salt'
+        """
+        name = os.path.splitext(os.path.basename(self.filename))[0]
+        return name.split('_', 1)[-1]
+
+    def find_parent_elements(self, xy, num_candidates=8):
+        """
+        find the elements that hold points, and their interpolation weights
+
+        :param xy: (num points, 2) coordinates of the points
+
+        :param num_candidates=8: how many elements near each point are
+                                 checked first -- see util.locate_points
+
+        returns (parent, arco, node3): for each point the index of its
+        element (from 0), the weights of the element's nodes, and the
+        nodes (indexes from 0). Points outside the mesh have parent -1,
+        zero weights and nodes -1.
+
+        The search tree of the elements is built on the first call
+        (with scipy, if it is installed) and kept for later ones.
+        """
+        nodes = np.column_stack((self.x, self.y)).astype(np.float64)
+        faces = self.elem.astype(np.intp) - 1
+        if self._face_tree is None:
+            self._face_tree = build_face_tree(nodes, faces)
+        parent, arco = locate_points(nodes, faces, xy, self._face_tree, num_candidates)
+        node3 = np.where(parent[:, np.newaxis] >= 0, faces[parent], -1)
+        return parent, arco, node3
+
+    def load_grid(self, grid):
+        """
+        loads the horizontal grid into the passed-in grid object
+
+        The nodes are the (x, y) of the file, the faces its elements (with
+        the node numbers from 0), and the bathymetry is a node DataSet
+        named 'depth'.
+        """
+        grid.nodes = np.column_stack((self.x, self.y))
+        grid.faces = self.elem.astype(np.int64) - 1
+        grid.add_data(DataSet('depth',
+                              location='node',
+                              data=self.dp,
+                              attributes={'standard_name': 'sea_floor_depth_below_geoid',
+                                          'units': 'm',
+                                          'positive': 'down',
+                                          }))
+
+
+def series_filenames(datadir, variable, num_files, start=1):
+    """
+    the names of a series of SELFE output files: datadir/1_elev.61, datadir/2_elev.61, ...
+
+    :param datadir: the directory the files are in
+
+    :param variable: the variable, with its extension -- e.g. 'elev.61'
+
+    :param num_files: how many files
+
+    :param start=1: the number of the first file
+    """
+    return [os.path.join(datadir, "%i_%s" % (i, variable))
+            for i in range(start, start + num_files)]
+
+
+class TimeSeries(object):
+    """
+    Time series extracted from a series of SELFE output files
+
+    The arrays are indexed by (file, step, ...) -- flatten the first two
+    axes for a single series:
+
+    time, iteration: (num files, num steps)
+
+    eta: (num files, num steps, num points) -- the water surface elevation
+
+    data: (num files, num steps, num points, num levels, ivs) -- the variable
+
+    depth: (num points,) the bathymetry
+
+    valid: (num files, num steps) -- True for the steps that were read.
+           The others are NaN (and iteration -1).
+
+    errors: {filename: message} for the files that are missing, or
+            couldn't be (completely) read
+    """
+    def __init__(self, filenames, num_steps, num_points, num_levels, ivs):
+        num_files = len(filenames)
+        self.filenames = filenames
+        self.time = np.full((num_files, num_steps), np.nan)
+        self.iteration = np.full((num_files, num_steps), -1, dtype=np.int32)
+        self.eta = np.full((num_files, num_steps, num_points), np.nan, dtype=np.float32)
+        self.data = np.full((num_files, num_steps, num_points, num_levels, ivs), np.nan,
+                            dtype=np.float32)
+        self.depth = None
+        self.valid = np.zeros((num_files, num_steps), dtype=bool)
+        self.errors = {}
+
+
+def _check_compatible(output, reference):
+    """
+    raises a ValueError if the output file isn't laid out like the reference
+    """
+    for attr in ('np', 'ne', 'flag_dm', 'flag_sv', 'nlevels', 'grid_size'):
+        if getattr(output, attr) != getattr(reference, attr):
+            raise ValueError("%s is %s, not %s as in %s" %
+                             (attr, getattr(output, attr), getattr(reference, attr),
+                              reference.filename))
+    if not np.array_equal(output.bot_idx, reference.bot_idx):
+        raise ValueError("its bottom levels are not those of %s" % reference.filename)
+
+
+class _Layout(object):
+    """
+    the layout of an output file -- what _check_compatible() compares --
+    without its memory-mapped records, so it can be sent to other processes
+    """
+    def __init__(self, output):
+        for attr in ('filename', 'np', 'ne', 'flag_dm', 'flag_sv', 'nlevels',
+                     'grid_size', 'bot_idx', 'nsteps'):
+            setattr(self, attr, getattr(output, attr))
+
+
+def _read_series_file(task):
+    """
+    read the time series of one file, in a worker process
+
+    task is (index, filename, byteorder, reference layout, nodes, levels)
+
+    returns (index, filename, arrays, problem): arrays is (time, iteration,
+    eta, data) of the steps that were read, or None if none could be.
+    """
+    i, filename, byteorder, reference, nodes, levels = task
+    try:
+        output = SelfeOutput(filename, byteorder)
+        _check_compatible(output, reference)
+        steps = slice(0, min(output.num_steps, reference.nsteps))
+        arrays = (np.array(output.time[steps]),
+                  np.array(output.iteration[steps]),
+                  output.eta[steps][:, nodes],
+                  output.read_profiles(nodes, levels, steps))
+    except (IOError, OSError, ValueError) as err:
+        return i, filename, None, str(err)
+    num_steps = len(arrays[0])
+    problem = None
+    if num_steps < reference.nsteps:
+        problem = "it has only %i of %i time steps" % (num_steps, reference.nsteps)
+    return i, filename, arrays, problem
+
+
+def read_time_series(filenames, nodes=None, levels=None, xy=None,
+                     workers=4, errors='raise', byteorder='<'):
+    """
+    extract time series from a series of SELFE output files
+
+    :param filenames: the files, in time order -- see series_filenames()
+
+    :param nodes=None: the node indexes (from 0) to extract. Defaults to all.
+
+    :param levels=None: the level indexes to extract (see
+                        SelfeOutput.value_rows). Defaults to all.
+
+    :param xy=None: (num points, 2) coordinates of points to extract instead
+                    of nodes: the values are interpolated from the nodes of
+                    the elements that hold them. Points outside the mesh
+                    are NaN.
+
+    :param workers=4: the number of files read at once, each one by a
+                      worker process that opens it itself. 1 reads them
+                      one at a time, in this process.
+
+    :param errors='raise': what to do about files that are missing, or
+                           don't match the first file, or are cut short:
+                           'raise' a ValueError that lists them all (once
+                           the rest have been read), or 'report' them
+                           in the errors of the result.
+
+    Each file is memory-mapped, and only the values asked for are read.
+
+    returns a TimeSeries, with its arrays indexed by (file, step)
+    """
+    if errors not in ('raise', 'report'):
+        raise ValueError("errors must be 'raise' or 'report', not %r" % (errors,))
+    filenames = list(filenames)
+    problems = {}
+
+    ## the first file that can be read defines the layout
+    reference = None
+    for filename in filenames:
+        try:
+            reference = SelfeOutput(filename, byteorder)
+            break
+        except (IOError, OSError, ValueError) as err:
+            problems[filename] = str(err)
+    if reference is None:
+        raise ValueError("none of the %i files could be read:\n%s" %
+                         (len(filenames), _format_problems(filenames, problems)))
+
+    if xy is not None:
+        parent, arco, node3 = reference.find_parent_elements(xy)
+        read_nodes, node_index = np.unique(np.maximum(node3, 0), return_inverse=True)
+        node_index = node_index.reshape(node3.shape)
+    elif nodes is None:
+        read_nodes = np.arange(reference.np)
+    else:
+        read_nodes = np.atleast_1d(np.asarray(nodes, dtype=np.intp))
+    if levels is None:
+        levels = np.arange(reference.num_levels)
+    levels = np.atleast_1d(np.asarray(levels, dtype=np.intp))
+    ## check the indexes before starting
+    reference.value_rows(read_nodes[:, np.newaxis], levels[np.newaxis, :])
+
+    series = TimeSeries(filenames, reference.nsteps, len(read_nodes), len(levels),
+                        reference.flag_sv)
+    series.depth = reference.dp[read_nodes].astype(np.float32)
+
+    tasks = [(i, filename, byteorder, _Layout(reference), read_nodes, levels)
+             for i, filename in enumerate(filenames) if filename not in problems]
+    workers = max(1, min(workers, len(tasks)))
+    if workers == 1:
+        results = map(_read_series_file, tasks)
+        pool = None
+    else:
+        ## indexing memmaps holds the GIL: processes, not threads, read
+        ## the files at the same time
+        try:
+            context = multiprocessing.get_context('fork')
+        except ValueError:
+            context = multiprocessing
+        pool = context.Pool(workers)
+        results = pool.imap_unordered(_read_series_file, tasks)
+    try:
+        for i, filename, arrays, problem in results:
+            if arrays is not None:
+                steps = slice(0, len(arrays[0]))
+                (series.time[i, steps], series.iteration[i, steps],
+                 series.eta[i, steps], series.data[i, steps]) = arrays
+                series.valid[i, steps] = True
+            if problem is not None:
+                problems[filename] = problem
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    if problems and errors == 'raise':
+        raise ValueError("%i of %i files could not be read:\n%s" %
+                         (len(problems), len(filenames), _format_problems(filenames, problems)))
+    series.errors = problems
+
+    if xy is not None:
+        ## interpolate from the nodes to the points
+        inside = parent >= 0
+        weights = np.where(inside[:, np.newaxis], arco, np.nan)
+        weights = weights.astype(np.float32)
+        series.eta = (series.eta[..., node_index] * weights).sum(axis=-1)
+        series.data = (series.data[:, :, node_index] *
+                       weights[:, :, np.newaxis, np.newaxis]).sum(axis=3)
+        series.depth = (series.depth[node_index] * weights).sum(axis=-1)
+    return series
+
+
+def _format_problems(filenames, problems):
+    return "\n".join("%s: %s" % (filename, problems[filename])
+                     for filename in filenames if filename in problems)
+
+
+def _component_names(output, name):
+    """
+    the names, and attributes, of the netcdf variables for a SELFE variable
+    -- vectors are written as a variable for each component: name_u, name_v
+    """
+    attributes = VARIABLE_ATTRIBUTES.get(name, {})
+    if output.flag_sv == 1:
+        if isinstance(attributes, list):
+            attributes = attributes[0]
+        return [(name, dict(attributes, long_name=attributes.get('long_name', name)))]
+    if not isinstance(attributes, list):
+        attributes = [attributes, attributes]
+    return [(name + suffix, dict(attrs, long_name=attrs.get('long_name', name + suffix)))
+            for suffix, attrs in zip(('_u', '_v'), attributes)]
+
+
+def _level_nodes(output):
+    """
+    the level and node of each row of the values -- where each
+    value goes in a (num levels, num nodes) array
+    """
+    nodes = np.repeat(np.arange(output.np), output.level_counts)
+    levels = (np.arange(output.grid_size) - output.level_offsets[nodes] +
+              (output.num_levels - output.level_counts[nodes]))
+    return levels, nodes
+
+
+def _open_series(series, byteorder):
+    """
+    opens the files of each variable for one time -- {name: SelfeOutput}
+    """
+    return dict((name, SelfeOutput(filename, byteorder)) for name, filename in series)
+
+
+def convert_to_netcdf(filenames, filepath, mesh_name='mesh', time_units=None,
+                      complevel=None, chunk_steps=None, encoding=None,
+                      buffer_steps=10, byteorder='<'):
+    """
+    convert a series of SELFE output files to a UGRID netcdf file
+
+    :param filenames: the files to convert, in time order -- see
+                      series_filenames(). For more than one variable, a
+                      dict of {name: files}, with the same number of files
+                      for each, e.g. {'salt': salt_files, 'hvel': hvel_files}.
+                      The name is taken from the first file otherwise.
+
+    :param filepath: the netcdf file to write. An existing one is clobbered.
+
+    :param mesh_name='mesh': the name of the mesh in the netcdf file
+
+    :param time_units=None: units of the time variable. SELFE times are
+                            seconds from the start of the run: the default
+                            is "seconds since <the start time in the header>".
+
+    :param complevel=None: compress the time-varying variables with zlib
+                           at this level (1-9). None for no compression.
+
+    :param chunk_steps=None: chunk the time-varying variables by this many
+                             time steps. Defaults to one.
+
+    :param encoding=None: more storage options -- see UGrid.save_as_netcdf.
+                          These override complevel and chunk_steps.
+
+    :param buffer_steps=10: the number of time steps held in memory before
+                            they are written -- see TimeSeriesWriter
+
+    The mesh, with the depth, is written first, then the time steps one at
+    a time, so memory use doesn't depend on the length of the run. The
+    surface elevation of the records is written as 'eta' (unless 'elev'
+    is one of the variables), vectors as a variable for each component
+    (hvel_u, hvel_v), and 3D variables as (time, level, node), NaN below
+    the bottom of each node.
+
+    All the files are checked before anything is written: a ValueError
+    lists the ones that are missing, aren't on the grid of the first, or
+    aren't laid out like the first file of their variable.
+
+    returns the number of time steps written
+    """
+    if not isinstance(filenames, dict):
+        filenames = list(filenames)
+        if not filenames:
+            raise ValueError("no files to convert")
+        filenames = {SelfeOutput(filenames[0], byteorder).variable_name: filenames}
+    names = sorted(filenames)
+    num_files = set(len(files) for files in filenames.values())
+    if len(num_files) != 1:
+        raise ValueError("every variable needs the same number of files")
+    num_files = num_files.pop()
+    series = [[(name, filenames[name][i]) for name in names] for i in range(num_files)]
+
+    ## check the files before writing anything -- the first one defines the
+    ## grid, and the first one of each variable its vertical layout
+    problems = []
+    reference = None
+    layouts = {}
+    for files in series:
+        step_times = None
+        for name, filename in files:
+            try:
+                output = SelfeOutput(filename, byteorder)
+                if reference is None:
+                    reference = output
+                _check_compatible_grid(output, reference)
+                layouts.setdefault(name, _Layout(output))
+                _check_compatible(output, layouts[name])
+                if output.num_steps != reference.nsteps:
+                    raise ValueError("it has %i time steps, not %i" %
+                                     (output.num_steps, reference.nsteps))
+                if step_times is None:
+                    step_times = np.array(output.time)
+                elif not np.array_equal(output.time, step_times):
+                    raise ValueError("its times are not those of the other variables")
+            except (IOError, OSError, ValueError) as err:
+                problems.append("%s: %s" % (filename, err))
+            ## don't hold every file open
+            output = None
+    if problems:
+        raise ValueError("%i files can't be converted:\n%s" % (len(problems), "\n".join(problems)))
+
+    from .ugrid import UGrid
+    grid = UGrid(mesh_name=mesh_name)
+    reference.load_grid(grid)
+    if time_units is None:
+        time_units = ("seconds since %s" % reference.start_time
+                      if reference.start_time else "seconds")
+
+    ## the netcdf variables, and the arrays each time step is put in
+    first = _open_series(series[0], byteorder)
+    variables = []
+    scatter = {}
+    if 'elev' not in names:
+        variables.append(('eta', None, 0, {'long_name': 'water surface elevation',
+                                           'standard_name': 'sea_surface_height_above_geoid',
+                                           'units': 'm'}))
+    for name in names:
+        output = first[name]
+        for component, (var_name, attributes) in enumerate(_component_names(output, name)):
+            variables.append((var_name, name, component, attributes))
+        if output.flag_dm == 3:
+            scatter[name] = _level_nodes(output)
+    templates = []
+    buffers = {}
+    for var_name, name, component, attributes in variables:
+        if name in scatter:
+            shape = (first[name].num_levels, grid.nodes.shape[0])
+        else:
+            shape = (grid.nodes.shape[0],)
+        buffers[var_name] = np.full(shape, np.nan, dtype=np.float32)
+        templates.append(DataSet(var_name, location='node', data=buffers[var_name],
+                                 attributes=attributes))
+    del first
+
+    var_encoding = {}
+    for var_name, name, component, attributes in variables:
+        options = {}
+        if complevel is not None:
+            options.update(zlib=True, complevel=complevel)
+        if chunk_steps is not None:
+            options['chunksizes'] = (chunk_steps,)
+        var_encoding[var_name] = options
+    for key, options in (encoding or {}).items():
+        var_encoding[key] = dict(var_encoding.get(key, {}), **options)
+
+    num_steps = 0
+    with TimeSeriesWriter(filepath, grid, templates, time_units=time_units,
+                          encoding=var_encoding, buffer_steps=buffer_steps) as writer:
+        for files in series:
+            outputs = _open_series(files, byteorder)
+            for step in range(reference.nsteps):
+                records = dict((name, output.records[step]) for name, output in outputs.items())
+                for var_name, name, component, attributes in variables:
+                    if name is None:
+                        buffers[var_name][:] = records[names[0]]['eta']
+                        continue
+                    values = records[name]['values'][:, component]
+                    if name in scatter:
+                        levels, nodes = scatter[name]
+                        buffers[var_name][levels, nodes] = values
+                    else:
+                        buffers[var_name][:] = values
+                writer.append(records[names[0]]['time'], buffers)
+                num_steps += 1
+            del outputs
+    return num_steps
+
+
+def _check_compatible_grid(output, reference):
+    """
+    raises a ValueError if the output file isn't on the reference's grid
+    """
+    for attr in ('np', 'ne'):
+        if getattr(output, attr) != getattr(reference, attr):
+            raise ValueError("%s is %s, not %s as in %s" %
+                             (attr, getattr(output, attr), getattr(reference, attr),
+                              reference.filename))
+    if not np.array_equal(output.elem, reference.elem):
+        raise ValueError("its elements are not those of %s" % reference.filename)
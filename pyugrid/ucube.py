@@ -3,17 +3,456 @@
 """
 Core class that handles a dataset on an unstructured grid.
 
+A UCube pairs a UGrid with the data of one variable on it, along up to
+three axes: time, level (the vertical) and the grid location (node,
+face, etc.) -- always in that order.
+
+The data is not read when the cube is made: it stays in its storage
+(a netCDF variable, a memory-mapped array, a LazyArray, or an in-memory
+array). Selecting a time range, levels or a spatial subset makes a new
+cube that is a view of the same storage, and only the selected values
+are read when the data is used -- by indexing, np.asarray() or
+iter_time(), which reads a block of time steps at a time.
+
+Values flagged as missing -- by the storage (e.g. a netCDF fill value),
+or by a validity mask like a DataSet's -- are read as masked arrays.
 """
 
 from __future__ import (absolute_import, division, print_function)
 
+import numpy as np
+
+from .data_set import DataSet
+from .lazy_array import LazyArray, expand_key
+from .expressions import Operators
+from .read_netcdf import NETCDF_LOCK
+from .util import face_centroids, prefetched
+
+# the default number of values read at once by iter_time
+BLOCK_SIZE = 2**22
+
+
+def default_block_steps(shape):
+    """
+    the number of time steps (the first axis) that make about BLOCK_SIZE values
+    """
+    step_size = int(np.prod(shape[1:], dtype=np.int64))
+    return max(1, BLOCK_SIZE // max(1, step_size))
+
 
-class UCube():
+class UCube(Operators, LazyArray):
     """
     Core class that handles a dataset on an unstructured grid.
+
+    dims: the names of the axes, e.g. ('time', 'level', 'node')
+
+    time: the times of the time axis (None if there isn't one)
+
+    levels: the vertical coordinate of the levels (None if there is no
+            level axis, or it wasn't given)
+
+    location_indexes: the indexes of the grid's locations (nodes,
+            faces, ...) that are in the cube
+
+    A UCube is a LazyArray: indexing it reads and returns a numpy array,
+    and it can be the data of a DataSet without being read.
+
+    Arithmetic on cubes is lazy too -- it makes an expressions.Expr.
     """
 
-    def __init__():
-        pass
+    def __init__(self, grid, data, location='node', time=None, levels=None,
+                 name=None, attributes=None, chunk_steps=None, valid_bits=None):
+        """
+        :param grid: the grid the data is on
+        :type grid: UGrid object.
+
+        :param data: the data: an array-like with the location as the last
+                     axis, time as the first (if time is given), and
+                     optionally a level axis between them. Anything that
+                     can be sliced: a numpy array or memmap, a netCDF4
+                     Variable, a LazyArray.
+
+        :param location='node': the type of grid element the data is on:
+                                'node', 'edge', 'face' or 'boundary'
+
+        :param time=None: the times of the first axis, if the data varies in time
+
+        :param levels=None: the vertical coordinates of the level axis
+
+        :param name=None: the name of the variable
+
+        :param attributes=None: its attributes (units, etc.)
+
+        :param chunk_steps=None: the number of time steps iter_time()
+                                 reads at once. Defaults to the chunking
+                                 of a netCDF variable, or as many as make
+                                 about BLOCK_SIZE values.
+
+        :param valid_bits=None: the validity mask of the data, bit-packed
+                                along the location axis -- as a DataSet
+                                keeps it. None if all the values are valid.
+        """
+        from .write_netcdf import location_size
+
+        self.grid = grid
+        self.location = location
+        self.name = name
+        self.attributes = {} if attributes is None else attributes
+        self._storage = data
+
+        shape = tuple(data.shape)
+        num = location_size(grid, location)
+        if not shape or shape[-1] != num:
+            raise ValueError("the last axis of the data should be the %i %ss, not %s" %
+                             (num, location, shape))
+        dims = ['time'] if time is not None else []
+        if len(shape) - len(dims) == 2:
+            dims.append('level')
+        elif len(shape) - len(dims) != 1:
+            raise ValueError("data shaped %s should be ([time,] [level,] %s)" % (shape, location))
+        dims.append(location)
+        self.dims = tuple(dims)
+
+        self._time = None
+        if time is not None:
+            self._time = np.asarray(time)
+            if self._time.shape != (shape[0],):
+                raise ValueError("there are %i times for %i time steps" %
+                                 (self._time.size, shape[0]))
+        self._levels = None
+        if levels is not None:
+            if 'level' not in self.dims:
+                raise ValueError("levels given for data with no level axis")
+            self._levels = np.asarray(levels)
+            if self._levels.shape != (shape[self.dims.index('level')],):
+                raise ValueError("there are %i levels for %i in the data" %
+                                 (self._levels.size, shape[self.dims.index('level')]))
+
+        ## what of the storage is in the cube: a range or an index array for each axis
+        self._index = [range(n) for n in shape]
+
+        if valid_bits is not None:
+            packed = shape[:-1] + ((shape[-1] + 7) // 8,)
+            if tuple(valid_bits.shape) != packed:
+                raise ValueError("valid_bits should be shaped %s, not %s" %
+                                 (packed, tuple(valid_bits.shape)))
+        self._valid_bits = valid_bits
+
+        if chunk_steps is None and 'time' in self.dims:
+            chunking = getattr(data, 'chunking', None)
+            chunking = chunking() if chunking is not None else None
+            if isinstance(chunking, (list, tuple)):
+                chunk_steps = chunking[0]
+        self.chunk_steps = chunk_steps
+
+    @classmethod
+    def from_dataset(klass, grid, dataset, levels=None, chunk_steps=None):
+        """
+        make a cube of a DataSet's data -- without reading it
+
+        :param grid: the grid the data is on
+        :type grid: UGrid object.
+
+        :param dataset: the DataSet, or the name of one on the grid
+
+        :param levels=None: the vertical coordinates of its levels, if it has them
+        """
+        if not isinstance(dataset, DataSet):
+            try:
+                dataset = grid.data[dataset]
+            except KeyError:
+                raise ValueError("There is no DataSet named %s on the grid" % dataset)
+        return klass(grid, dataset.data, dataset.location, dataset.time, levels,
+                     dataset.name, dataset.attributes, chunk_steps, dataset.valid_bits)
+
+    def _view(self, index):
+        """
+        a new cube on the same storage, with the given index
+        """
+        cube = self.__class__.__new__(self.__class__)
+        cube.__dict__.update(self.__dict__)
+        cube._index = index
+        return cube
+
+    @property
+    def shape(self):
+        return tuple(len(index) for index in self._index)
+
+    @property
+    def dtype(self):
+        return self._storage.dtype
+
+    @property
+    def time(self):
+        if self._time is None:
+            return None
+        return self._time[self._as_key(self._index[0])]
+
+    @property
+    def levels(self):
+        if self._levels is None:
+            return None
+        return self._levels[self._as_key(self._index[self.dims.index('level')])]
+
+    @property
+    def location_indexes(self):
+        return np.asarray(self._index[-1])
+
+    @staticmethod
+    def _as_key(index):
+        """
+        a storage index as a key: ranges become slices (if they can)
+        """
+        if isinstance(index, range):
+            if index.step > 0:
+                return slice(index.start, index.stop, index.step)
+            if len(index) == 0:
+                return slice(0, 0)
+            return np.asarray(index)
+        return index
+
+    def _axis(self, dim):
+        if dim == 'location':
+            return len(self.dims) - 1
+        try:
+            return self.dims.index(dim)
+        except ValueError:
+            raise ValueError("this cube has no %s axis: it is %s" % (dim, self.dims))
+
+    def isel(self, time=None, level=None, location=None):
+        """
+        select by index: a slice, index or array of indexes for each axis
+
+        :param time=None, level=None, location=None: what to select
+                                                     on each axis. None for all.
+
+        returns a new cube -- nothing is read. An integer index keeps its
+        axis (with length one).
+        """
+        index = list(self._index)
+        for dim, key in (('time', time), ('level', level), ('location', location)):
+            if key is None:
+                continue
+            axis = self._axis(dim)
+            if isinstance(key, (int, np.integer)):
+                key = [key]
+            if isinstance(key, slice):
+                index[axis] = index[axis][key]
+            else:
+                key = np.asarray(key)
+                if key.dtype == bool:
+                    key = np.flatnonzero(key)
+                index[axis] = np.asarray(index[axis])[key]
+        return self._view(index)
+
+    def sel_time(self, start=None, stop=None):
+        """
+        select the time steps from start to stop (inclusive) -- both
+        in the units of the times. None for no limit.
+        """
+        time = self.time
+        if time is None:
+            raise ValueError("this cube does not vary in time")
+        first = 0 if start is None else np.searchsorted(time, start, side='left')
+        last = len(time) if stop is None else np.searchsorted(time, stop, side='right')
+        return self.isel(time=slice(first, last))
+
+    def location_coordinates(self):
+        """
+        the (x, y) coordinates of the cube's locations: the nodes, or
+        the face, edge or boundary coordinates (their centres, if the
+        grid doesn't have them)
+        """
+        grid = self.grid
+        if self.location == 'node':
+            coords = grid.nodes
+        else:
+            coords = getattr(grid, self.location + '_coordinates')
+            if coords is None:
+                elements = {'face': grid.faces,
+                            'edge': grid.edges,
+                            'boundary': grid.boundaries}[self.location]
+                coords = face_centroids(grid.nodes, elements)
+        return coords[self._as_key(self._index[-1])]
+
+    def sel_bbox(self, bbox):
+        """
+        select the locations in a bounding box
+
+        :param bbox: (min_x, min_y, max_x, max_y) -- as for UGrid.from_ncfile
+        """
+        min_x, min_y, max_x, max_y = bbox
+        coords = self.location_coordinates()
+        x, y = coords[:, 0], coords[:, 1]
+        return self.isel(location=(x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y))
+
+    def _read_index(self, index):
+        """
+        read the data for a (storage) index: a range or index array for each axis
+        """
+        storage = self._storage
+        if isinstance(storage, np.ndarray):
+            ## numpy indexes one array orthogonally to the slices:
+            ## use it for the most selective axis, and take the rest after
+            keys = [self._as_key(i) for i in index]
+            arrays = [axis for axis, key in enumerate(keys) if isinstance(key, np.ndarray)]
+            first = None
+            if arrays:
+                first = min(arrays, key=lambda axis: len(keys[axis]) / storage.shape[axis])
+            data = storage[tuple(key if (axis == first or not isinstance(key, np.ndarray))
+                                 else slice(None) for axis, key in enumerate(keys))]
+            for axis in arrays:
+                if axis != first:
+                    data = np.take(data, keys[axis], axis=axis)
+            return data
+
+        ## netCDF variables and lazy arrays index arrays orthogonally,
+        ## but may need them to be sorted and unique
+        keys = []
+        reorder = []
+        for axis, i in enumerate(index):
+            key = self._as_key(i)
+            if isinstance(key, np.ndarray):
+                if len(key) == 0:
+                    keys.append(slice(0, 0))
+                    continue
+                unique, inverse = np.unique(key, return_inverse=True)
+                if not np.array_equal(unique, key):
+                    reorder.append((axis, inverse))
+                steps = np.diff(unique)
+                if len(unique) == 1 or (steps == steps[0]).all():
+                    key = slice(unique[0], unique[-1] + 1, steps[0] if len(unique) > 1 else 1)
+                else:
+                    key = unique
+            keys.append(key)
+        if isinstance(storage, LazyArray):
+            data = storage[tuple(keys)]
+        else:
+            ## netCDF4 isn't thread safe
+            with NETCDF_LOCK:
+                data = storage[tuple(keys)]
+        if not isinstance(data, np.ma.MaskedArray):
+            data = np.asarray(data)
+        for axis, inverse in reorder:
+            data = np.take(data, inverse, axis=axis)
+        return data
+
+    def _valid_rows(self, index):
+        """
+        the (still packed) rows of the validity mask for a storage index
+        -- selected one axis at a time, orthogonally, like the data
+        """
+        bits = self._valid_bits
+        for axis, i in enumerate(index[:-1]):
+            bits = bits[(slice(None),) * axis + (self._as_key(i),)]
+        return bits
+
+    def _read_valid(self, index):
+        """
+        the validity mask for a (storage) index -- None if all the values are valid
+        """
+        if self._valid_bits is None:
+            return None
+        valid = np.unpackbits(self._valid_rows(index), axis=-1,
+                              count=self._storage.shape[-1]).view(bool)
+        return valid[..., self._as_key(index[-1])]
+
+    def __getitem__(self, key):
+        key = expand_key(key, self.ndim)
+        index = []
+        squeeze = []
+        for axis, (current, k) in enumerate(zip(self._index, key)):
+            if isinstance(k, (int, np.integer)):
+                k = [k]
+                squeeze.append(axis)
+            if isinstance(k, slice):
+                index.append(current[k])
+            else:
+                k = np.asarray(k)
+                if k.dtype == bool:
+                    k = np.flatnonzero(k)
+                index.append(np.asarray(current)[k])
+        data = self._read_index(index)
+        valid = self._read_valid(index)
+        if valid is not None and not valid.all():
+            data = np.ma.masked_array(data, mask=~valid | np.ma.getmaskarray(data))
+        if squeeze:
+            data = data.reshape([n for axis, n in enumerate(data.shape) if axis not in squeeze])
+        return data
+
+    def block_steps(self, chunk=None):
+        """
+        the number of time steps to read at once: chunk if it is given,
+        else chunk_steps, else as many as make about BLOCK_SIZE values
+        """
+        if 'time' not in self.dims:
+            raise ValueError("this cube does not vary in time")
+        if chunk is None:
+            chunk = self.chunk_steps
+        if chunk is None:
+            chunk = default_block_steps(self.shape)
+        if chunk < 1:
+            raise ValueError("chunk must be at least one time step")
+        return chunk
+
+    def iter_time(self, chunk=None, prefetch=True):
+        """
+        iterate through the cube, a block of time steps at a time
+
+        :param chunk=None: the number of time steps in each block.
+                           Defaults to chunk_steps.
+
+        :param prefetch=True: if True, the next block is read on a background
+                              thread while the current one is being used.
+
+        yields (times, block) for each block: block is a numpy array of
+        the cube's data for the times -- a masked array, if any of it is
+        missing.
+
+        Only the blocks being used (and prefetched) are in memory at once.
+        """
+        chunk = self.block_steps(chunk)
+        time = self.time
+        num_times = self.shape[0]
+
+        def read_block(start):
+            block = slice(start, min(start + chunk, num_times))
+            return time[block], self[block]
+
+        for block in prefetched(read_block, range(0, num_times, chunk), prefetch):
+            yield block
+
+    def reduce_time(self, stats=('mean',), **kwargs):
+        """
+        reduce the cube over time, a block of time steps at a time
+
+        returns a dict of DataSets -- see reductions.reduce_time for the options
+        """
+        from .reductions import reduce_time
+        return reduce_time(self, stats, **kwargs)
+
+    def to_dataset(self, name=None):
+        """
+        a DataSet of the cube's data -- which is not read
+
+        Only a cube with all of the grid's locations can be a DataSet on the grid.
+        """
+        locations = self._index[-1]
+        num = self._storage.shape[-1]
+        if not (locations == range(num) if isinstance(locations, range)
+                else np.array_equal(locations, np.arange(num))):
+            raise ValueError("the cube has a subset (or a reordering) of the %ss: it can't be a DataSet on the grid"
+                             % self.location)
+        dataset = DataSet(self.name if name is None else name,
+                          location=self.location,
+                          data=self,
+                          attributes=dict(self.attributes),
+                          time=self.time)
+        if self._valid_bits is not None:
+            dataset.valid_bits = self._valid_rows(self._index)
+        return dataset
 
-    
\ No newline at end of file
+    def __repr__(self):
+        return "<UCube %s: %s, %s>" % (self.name,
+                                       ", ".join("%s: %i" % dim for dim in zip(self.dims, self.shape)),
+                                       self.dtype)
@@ -20,13 +20,24 @@ from __future__ import (absolute_import, division, print_function)
 import numpy as np
 
 from . import read_netcdf
+from . import read_mfnetcdf
+from . import write_netcdf
+from . import native
+from . import write_vtk
+from . import ascii_grids
+from . import selfe
 # used for simple locate_face test
 #from py_geometry.cy_point_in_polygon import point_in_poly as point_in_tri
-from .util import point_in_tri
+from .util import point_in_tri, locate_points, prefetched
 from .data_set import DataSet
 
-IND_DT = np.int32 ## datatype used for indexes -- might want to change for 64 bit some day.
-NODE_DT = np.float64 ## datatype used for node coordinates
+IND_DT = np.int32 ## default datatype used for indexes -- see UGrid(index_dtype=...)
+NODE_DT = np.float64 ## default datatype used for node coordinates -- see UGrid(node_dtype=...)
+
+## the DataSet fields that UGrid.find_data_sets / query_data can look up by
+## without scanning every DataSet -- name and location are DataSet
+## attributes, the others are keys of DataSet.attributes
+INDEXED_FIELDS = ('name', 'location', 'standard_name', 'units')
 
 
 
@@ -50,6 +61,8 @@ class UGrid(object):
                  boundary_coordinates=None,
                  data = None,
                  mesh_name = "mesh",
+                 index_dtype = IND_DT,
+                 node_dtype = NODE_DT,
                  ):
         """
         ugrid class -- holds, saves, etc. an unstructured grid
@@ -77,9 +90,27 @@ class UGrid(object):
         :param mesh_name = "mesh": optional name for the mesh 
         :type string: 
 
+        :param index_dtype = IND_DT: integer dtype of the connectivity arrays:
+                                     e.g. np.int64 for meshes with more than 2**31
+                                     elements, or np.uint16 for small ones.
+                                     With an unsigned dtype, the arrays that use
+                                     -1 for "no element" (face_face_connectivity,
+                                     etc.) get the next larger signed dtype
+                                     (see flag_dtype).
+
+        :param node_dtype = NODE_DT: float dtype of the node coordinates
+                                     (and face, edge coordinates):
+                                     e.g. np.float32 for projected meshes.
+
         often this is too much data to pass in as literals -- so usually
         specialized constructors will be used instead (load from file, etc.)
         """
+        self.index_dtype = np.dtype(index_dtype)
+        if self.index_dtype.kind not in 'iu':
+            raise ValueError("index_dtype must be an integer type, not %s" % self.index_dtype)
+        self.node_dtype = np.dtype(node_dtype)
+        if self.node_dtype.kind != 'f':
+            raise ValueError("node_dtype must be a floating point type, not %s" % self.node_dtype)
 
         self.nodes = nodes
         self.faces = faces
@@ -100,12 +131,22 @@ class UGrid(object):
         # should be a dict of DataSet objects
 
         self._data = {} # the data associated with the grid
+        ## field -> value -> set of the DataSets with that value
+        self._data_index = {field: {} for field in INDEXED_FIELDS}
+        ## (field, value) -> frozenset copy of its set, made when it's queried
+        self._frozen_index = {}
+        ## name -> the indexed values each DataSet was indexed under
+        self._indexed_values = {}
         if data is not None:
             for dataset in data.values():
                 self.add_data(dataset)
 
+        ## the open files lazy data is read from (see from_ncfiles), if any
+        self.source = None
+
     @classmethod
-    def from_ncfile(klass, nc_url, mesh_name=None, load_data=False):
+    def from_ncfile(klass, nc_url, mesh_name=None, load_data=False, bbox=None,
+                    index_dtype=IND_DT, node_dtype=NODE_DT):
         """
         create a UGrid object from a netcdf file name (or opendap url)
 
@@ -121,13 +162,65 @@ class UGrid(object):
                                 associated with the mesh will be loaded. This could be huge!
         :type load_data: boolean
 
+        :param bbox=None: (min_x, min_y, max_x, max_y) bounding box. If given,
+                          only the faces that touch the box (and their nodes,
+                          edges, etc, and data) are read, using hyperslab reads,
+                          and the result is a small, renumbered grid.
+
+        :param index_dtype=IND_DT: dtype of the connectivity arrays -- they are
+                                   read straight into it. See UGrid().
+
+        :param node_dtype=NODE_DT: dtype of the coordinates. See UGrid().
+
+        """
+        grid = klass(index_dtype=index_dtype, node_dtype=node_dtype)
+        read_netcdf.load_grid_from_ncfilename(nc_url, grid, mesh_name, load_data, bbox)
+        return grid
+
+    @classmethod
+    def from_ncfiles(klass, filenames, mesh_name=None, time_dim=None, max_workers=4,
+                     index_dtype=IND_DT, node_dtype=NODE_DT, lock=None):
+        """
+        create a UGrid object from a series of netcdf files that share a mesh,
+        e.g. one file per time step.
+
+        :param filenames: a glob pattern, or a sequence of filenames or urls
+
+        :param mesh_name=None: the name of the mesh you want. If None, then
+                               you'll get the only mesh in the file.
+
+        :param time_dim=None: the name of the dimension to join the files on.
+                              Defaults to the unlimited dimension (or 'time').
+
+        :param max_workers=4: number of threads used to read from the files.
+
+        :param index_dtype=IND_DT: dtype of the connectivity arrays -- they are
+                                   read straight into it. See UGrid().
+
+        :param node_dtype=NODE_DT: dtype of the coordinates. See UGrid().
+
+        :param lock=None: the lock held around each read. Each file has its
+                          own by default -- pass True if your netCDF library
+                          is not thread safe. See read_mfnetcdf.MultiFileSource.
+
+        The mesh is only read once. The time-varying data are not read at all:
+        each DataSet gets a lazy array that spans all the files, and reads
+        only what is asked for when it is indexed.
+
+        The files stay open (as grid.source) until grid.close() is called --
+        or use the grid as a context manager::
+
+          with UGrid.from_ncfiles('output_*.nc') as grid:
+              ...
         """
-        grid = klass()
-        read_netcdf.load_grid_from_ncfilename(nc_url, grid, mesh_name, load_data)
+        grid = klass(index_dtype=index_dtype, node_dtype=node_dtype)
+        grid.source = read_mfnetcdf.load_grid_from_ncfiles(filenames, grid, mesh_name,
+                                                           time_dim, max_workers, lock)
         return grid
 
     @classmethod
-    def from_nc_dataset(klass, nc, mesh_name=None, load_data=False):
+    def from_nc_dataset(klass, nc, mesh_name=None, load_data=False, bbox=None,
+                        index_dtype=IND_DT, node_dtype=NODE_DT):
         """
         create a UGrid object from a netcdf file (or opendap url)
 
@@ -146,11 +239,107 @@ class UGrid(object):
 
         :type load_data: boolean
 
+        :param bbox=None: (min_x, min_y, max_x, max_y) bounding box to subset
+                          the grid to, as in from_ncfile()
+
+        :param index_dtype=IND_DT: dtype of the connectivity arrays -- they are
+                                   read straight into it. See UGrid().
+
+        :param node_dtype=NODE_DT: dtype of the coordinates. See UGrid().
+
+        """
+        grid = klass(index_dtype=index_dtype, node_dtype=node_dtype)
+        read_netcdf.load_grid_from_nc_dataset(nc, grid, mesh_name, load_data, bbox)
+        return grid
+
+    @classmethod
+    def from_gr3(klass, filename, data_name='depth', index_dtype=IND_DT, node_dtype=NODE_DT):
+        """
+        create a UGrid object from a SELFE/SCHISM .gr3 (e.g. hgrid.gr3)
+        or ADCIRC fort.14 file
+
+        :param filename: the file to read
+
+        :param data_name='depth': name of the node DataSet for the values in the file
+
+        :param index_dtype=IND_DT, node_dtype=NODE_DT: dtypes for the grid -- see UGrid()
+        """
+        grid = klass(index_dtype=index_dtype, node_dtype=node_dtype)
+        ascii_grids.load_grid_from_gr3(filename, grid, data_name)
+        return grid
+
+    @classmethod
+    def from_2dm(klass, filename, data_name='depth', index_dtype=IND_DT, node_dtype=NODE_DT):
+        """
+        create a UGrid object from an SMS .2dm mesh file
+
+        :param filename: the file to read
+
+        :param data_name='depth': name of the node DataSet for the z values
+
+        :param index_dtype=IND_DT, node_dtype=NODE_DT: dtypes for the grid -- see UGrid()
         """
-        grid = klass()
-        read_netcdf.load_grid_from_nc_dataset(nc, grid, mesh_name, load_data)
+        grid = klass(index_dtype=index_dtype, node_dtype=node_dtype)
+        ascii_grids.load_grid_from_2dm(filename, grid, data_name)
         return grid
 
+    @classmethod
+    def from_selfe(klass, filename, byteorder='<', index_dtype=IND_DT, node_dtype=NODE_DT):
+        """
+        create a UGrid object from the horizontal grid in the header of
+        a SELFE v5 binary output file (e.g. 1_elev.61)
+
+        :param filename: the file to read
+
+        :param byteorder='<': the byte order of the file -- see selfe.SelfeOutput
+
+        :param index_dtype=IND_DT, node_dtype=NODE_DT: dtypes for the grid -- see UGrid()
+
+        The time steps are not read: use selfe.SelfeOutput for those.
+        """
+        grid = klass(index_dtype=index_dtype, node_dtype=node_dtype)
+        selfe.SelfeOutput(filename, byteorder).load_grid(grid)
+        return grid
+
+    @classmethod
+    def from_native(klass, dirname, mmap_mode='r', index_dtype=None, node_dtype=None):
+        """
+        create a UGrid object from a grid saved with save_native()
+
+        :param dirname: the directory the grid was saved in
+
+        :param mmap_mode='r': how to open the arrays -- passed to np.load.
+                              The default memory-maps them read-only, so
+                              nothing is read until it is used, and the
+                              pages are shared between processes.
+                              None reads them all into memory.
+
+        :param index_dtype=None, node_dtype=None: dtypes for the grid -- see
+                              UGrid(). The default is the dtypes it was saved
+                              with, so that the arrays don't need converting
+                              (which would read them into memory).
+        """
+        manifest = native.read_manifest(dirname)
+        grid = klass(index_dtype=manifest.get('index_dtype', IND_DT) if index_dtype is None else index_dtype,
+                     node_dtype=manifest.get('node_dtype', NODE_DT) if node_dtype is None else node_dtype)
+        native.load_native(dirname, grid, mmap_mode)
+        return grid
+
+    def close(self):
+        """
+        close the files the grid's lazy data is read from, if there are any
+        (see from_ncfiles) -- the lazy data can't be read after this
+        """
+        if self.source is not None:
+            self.source.close()
+            self.source = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
     def check_consistent(self):
         """
         check if the various data is consistent: the edges and faces reference
@@ -168,6 +357,34 @@ class UGrid(object):
         else:
             return self._faces.shape[1]
 
+    @property
+    def flag_dtype(self):
+        """
+        dtype of the index arrays that use -1 for "no element":
+        index_dtype if it is signed, otherwise the smallest signed
+        dtype that holds all its values.
+        """
+        if self.index_dtype.kind == 'i':
+            return self.index_dtype
+        return np.promote_types(self.index_dtype, np.int8)
+
+    def _as_indexes(self, indexes, flagged=False):
+        """
+        make an index array of the grid's dtype -- not copied if it already is
+
+        raises a ValueError if the values don't fit in the dtype
+        """
+        dtype = self.flag_dtype if flagged else self.index_dtype
+        indexes = np.asarray(indexes)
+        if indexes.dtype != dtype:
+            if indexes.size and not np.can_cast(indexes.dtype, dtype):
+                info = np.iinfo(dtype)
+                if indexes.min() < info.min or indexes.max() > info.max:
+                    raise ValueError("indexes from %i to %i don't fit in %s" %
+                                     (indexes.min(), indexes.max(), dtype))
+            indexes = indexes.astype(dtype)
+        return indexes
+
     @property
     def nodes(self):
         return self._nodes
@@ -176,17 +393,19 @@ class UGrid(object):
         # room here to do consistency checking, etc.
         # for now -- simply make sure it's a numpy array
         if nodes_coords is None:
-            self.nodes = np.zeros((0,2), dtype=NODE_DT)
+            self.nodes = np.zeros((0,2), dtype=self.node_dtype)
         else:    
-            self._nodes = np.asarray(nodes_coords, dtype=NODE_DT)
+            self._nodes = np.asarray(nodes_coords, dtype=self.node_dtype)
+        self._mesh_dirty = True
 
     @nodes.deleter
     def nodes(self):
         ## if there are no nodes, there can't be anything else
-        self._nodes = np.zeros((0,2), dtype=NODE_DT)
+        self._nodes = np.zeros((0,2), dtype=self.node_dtype)
         self._edges = None
         self._faces = None
         self._boundaries = None
+        self._mesh_dirty = True
 
     @property
     def faces(self):
@@ -196,12 +415,13 @@ class UGrid(object):
         # room here to do consistency checking, etc.
         # for now -- simply make sure it's a numpy array
         if faces_indexes is not None:
-            self._faces = np.asarray(faces_indexes, dtype=IND_DT)
+            self._faces = self._as_indexes(faces_indexes)
         else:
             self._faces = None
             # other things are no longer valid
             self._face_face_connectivity = None
             self._face_edge_connectivity = None
+        self._mesh_dirty = True
     @faces.deleter
     def faces(self):
         self._faces = None
@@ -210,6 +430,7 @@ class UGrid(object):
         self._face_face_connectivity = None
         self._face_edge_connectivity = None
         self.edge_coordinates = None
+        self._mesh_dirty = True
 
     @property
     def edges(self):
@@ -219,15 +440,17 @@ class UGrid(object):
         # room here to do consistency checking, etc.
         # for now -- simply make sure it's a numpy array
         if edges_indexes is not None:
-            self._edges = np.asarray(edges_indexes, dtype=IND_DT)
+            self._edges = self._as_indexes(edges_indexes)
         else:
             self._edges = None
             self._face_edge_connectivity = None
+        self._mesh_dirty = True
     @edges.deleter
     def edges(self):
         self._edges = None
         self._face_edge_connectivity = None
         self.edge_coordinates = None
+        self._mesh_dirty = True
 
     @property
     def boundaries(self):
@@ -237,13 +460,42 @@ class UGrid(object):
         # room here to do consistency checking, etc.
         # for now -- simply make sure it's a numpy array
         if boundaries_indexes is not None:
-            self._boundaries = np.asarray(boundaries_indexes, dtype=IND_DT)
+            self._boundaries = self._as_indexes(boundaries_indexes)
         else:
             self._boundaries = None
+        self._mesh_dirty = True
     @boundaries.deleter
     def boundaries(self):
         self._boundaries = None
         self.boundary_coordinates = None
+        self._mesh_dirty = True
+
+    @property
+    def mesh_dirty(self):
+        """
+        True if the nodes or connectivity have been set since the grid
+        was loaded or saved.
+
+        Changes made to the arrays in place can't be seen.
+        """
+        return self._mesh_dirty
+
+    @property
+    def dirty(self):
+        """
+        True if the mesh, or any of the data, needs to be saved
+        """
+        return self.mesh_dirty or any(ds.dirty for ds in self._data.values())
+
+    def mark_clean(self):
+        """
+        flag the mesh and all the data as matching what is in the file
+
+        called when the grid is loaded from, or saved to, a file
+        """
+        self._mesh_dirty = False
+        for dataset in self._data.values():
+            dataset.mark_clean()
 
 
     @property
@@ -253,28 +505,32 @@ class UGrid(object):
     def face_face_connectivity(self, face_face_connectivity):
         ## add more checking?
         if face_face_connectivity is not None:
-            face_face_connectivity = np.asarray(face_face_connectivity, dtype=IND_DT)
+            face_face_connectivity = self._as_indexes(face_face_connectivity, flagged=True)
             if face_face_connectivity.shape != (len(self.faces), self.num_vertices):
                 raise ValueError("face_face_connectivity must be size (num_faces, %i)"%self.num_vertices)
         self._face_face_connectivity = face_face_connectivity
+        self._mesh_dirty = True
     @face_face_connectivity.deleter
     def face_face_connectivity(self):
         self._face_face_connectivity = None
+        self._mesh_dirty = True
 
     @property
     def face_edge_connectivity(self):
         return self._face_edge_connectivity
-    @face_face_connectivity.setter
+    @face_edge_connectivity.setter
     def face_edge_connectivity(self, face_edge_connectivity):
         ## add more checking?
         if face_edge_connectivity is not None:
-            face_edge_connectivity = np.asarray(face_edge_connectivity, dtype=IND_DT)
+            face_edge_connectivity = self._as_indexes(face_edge_connectivity, flagged=True)
             if face_edge_connectivity.shape != (len(self.faces), self.num_vertices):
                 raise ValueError("face_face_connectivity must be size (num_face, %i)"%self.num_vertices)
         self._face_edge_connectivity = face_edge_connectivity
+        self._mesh_dirty = True
     @face_edge_connectivity.deleter
     def face_edge_connectivity(self):
         self._face_edge_connectivity = None
+        self._mesh_dirty = True
 
 
     @property
@@ -293,24 +549,133 @@ class UGrid(object):
         :type data_set: a ugrid.DataSet object
 
         some sanity checking is done to make sure array sizes are correct.
+        The last axis of the data is the one that must match the grid:
+        (time, node) or (time, layer, node) data can be added, too.
 
         """
         # do a size check:
+        num = data_set.data.shape[-1]
         if data_set.location == 'node':
-            if len(data_set.data) != len(self.nodes):
+            if num != len(self.nodes):
                 raise ValueError("length of data array must match the number of nodes")
         elif data_set.location == 'edge':
-            if len(data_set.data) != len(self.edges):
+            if num != len(self.edges):
                 raise ValueError("length of data array must match the number of edges")
         elif data_set.location == 'face':
-            if len(data_set.data) != len(self.faces):
+            if num != len(self.faces):
                 raise ValueError("length of data array must match the number of faces")
         elif data_set.location == 'boundary':
-            if len(data_set.data) != len(self.boundaries):
+            if num != len(self.boundaries):
                 raise ValueError("length of data array must match the number of boundaries")
         else:
             raise ValueError("I don't know how to add data associated with '%s'"%data_set.location)
+        self._unindex_data(data_set.name)
         self._data[data_set.name] = data_set
+        self._index_data(data_set)
+
+    @staticmethod
+    def _indexed_value(data_set, field):
+        """
+        the value of a DataSet's indexed field -- None if it doesn't have one,
+        or it can't be used as a dict key
+        """
+        if field in ('name', 'location'):
+            value = getattr(data_set, field)
+        elif data_set.attributes:
+            value = data_set.attributes.get(field)
+        else:
+            value = None
+        try:
+            hash(value)
+        except TypeError:
+            return None
+        return value
+
+    def _index_data(self, data_set):
+        values = {}
+        for field in INDEXED_FIELDS:
+            value = self._indexed_value(data_set, field)
+            if value is None:
+                continue
+            self._data_index[field].setdefault(value, set()).add(data_set)
+            self._frozen_index.pop((field, value), None)
+            values[field] = value
+        self._indexed_values[data_set.name] = values
+
+    def _unindex_data(self, name):
+        values = self._indexed_values.pop(name, None)
+        if values is None:
+            return
+        data_set = self._data[name]
+        for field, value in values.items():
+            index = self._data_index[field]
+            index[value].discard(data_set)
+            if not index[value]:
+                del index[value]
+            self._frozen_index.pop((field, value), None)
+
+    def reindex_data(self):
+        """
+        rebuild the indexes used by find_data_sets() and query_data()
+
+        The DataSets are indexed when they are added with add_data(), so call
+        this after changing the standard_name or units attributes (or the
+        name or location) of a DataSet that is already on the grid.
+        """
+        self._data_index = {field: {} for field in INDEXED_FIELDS}
+        self._frozen_index = {}
+        self._indexed_values = {}
+        for data_set in self._data.values():
+            self._index_data(data_set)
+
+    def query_data(self, **criteria):
+        """
+        Find the :py:class:`DataSet`s with all the given field values, e.g.:
+
+            grid.query_data(standard_name='sea_water_temperature', location='face')
+
+        :param criteria: field=value pairs -- the fields are the ones in
+                         INDEXED_FIELDS: name, location, standard_name, units.
+                         A value of None doesn't narrow the search.
+
+        :return: frozenset of the matching :py:class:`DataSet`s -- with a
+                 single field this is a cached copy of the index's set, so
+                 repeated queries do no work beyond the dict lookups.
+
+        The indexes are kept up to date by add_data(), but can't see changes
+        made to a DataSet that is already on the grid: after changing its
+        name, location, or standard_name or units attributes, call
+        reindex_data(), or it will still be found by its old values.
+        """
+        found = None
+        for field, value in criteria.items():
+            if value is None:
+                continue
+            if field not in self._data_index:
+                raise ValueError("can't query by %r -- the indexed fields are: %s" %
+                                 (field, ", ".join(INDEXED_FIELDS)))
+            try:
+                matches = self._frozen_matches(field, value)
+            except TypeError: # an unhashable value is never indexed
+                matches = frozenset()
+            found = matches if found is None else found & matches
+            if not found:
+                return frozenset()
+        if found is None:
+            return frozenset(self._data.values())
+        return found
+
+    def _frozen_matches(self, field, value):
+        """
+        the DataSets indexed under a field's value, as a frozenset --
+        made when first asked for, and kept until that value's set changes
+        """
+        key = (field, value)
+        matches = self._frozen_index.get(key)
+        if matches is None:
+            matches = frozenset(self._data_index[field].get(value, ()))
+            self._frozen_index[key] = matches
+        return matches
 
     def find_data_sets(self, standard_name, location=None):
         """
@@ -322,17 +687,70 @@ class UGrid(object):
                            :py:class:`DataSet`s (one of 'node', 'edge', 'face', or 'boundary').
         
         :return: set of matching :py:class:`DataSet`s
+
+        This is a lookup in the indexes kept by add_data() -- see query_data()
+        for other fields. Like query_data(), it finds a DataSet by the
+        standard_name it had when it was added: call reindex_data() after
+        changing the attributes of a DataSet on the grid.
         """
-        found = set()
-        for ds in self._data.values():
-            if not ds.attributes or 'standard_name' not in ds.attributes:
-                continue
-            if ds.attributes['standard_name'] == standard_name:
-                if location is not None and ds.location != location:
-                    continue
-                found.add(ds)
-        return found
+        if standard_name is None:
+            return set()
+        return set(self.query_data(standard_name=standard_name, location=location))
+
+
+    def iter_time(self, names=None, chunk=1, start=0, stop=None, prefetch=True):
+        """
+        iterate through the time-varying data, a block of time steps at a time
+
+        :param names=None: names of the DataSets to read. Defaults to all the
+                           DataSets with a time axis.
 
+        :param chunk=1: number of time steps in each block
+
+        :param start=0, stop=None: the range of time steps to go through
+
+        :param prefetch=True: if True, the next block is read on a background
+                              thread while the current one is being used.
+
+        yields (times, fields) for each block, where times is the array of
+        times of the block, and fields is a dict of the data arrays,
+        with the time steps in the block as the first axis -- masked
+        arrays, where any of the values are missing.
+
+        Only the blocks being used (and prefetched) are in memory at once,
+        so this can be used to work through data much larger than memory,
+        if the DataSets hold lazy arrays, as from UGrid.from_ncfiles()
+
+        ::
+
+          for times, fields in grid.iter_time(['u', 'v'], chunk=24):
+              speed = np.hypot(fields['u'], fields['v'])
+        """
+        if names is None:
+            names = [name for name, ds in self._data.items() if ds.time is not None]
+        elif isinstance(names, str):
+            names = [names]
+        data_sets = [self._data[name] for name in names]
+        if not data_sets:
+            return
+        for ds in data_sets:
+            if ds.time is None:
+                raise ValueError("DataSet %s does not vary in time" % ds.name)
+        times = data_sets[0].time
+        for ds in data_sets[1:]:
+            if len(ds.time) != len(times):
+                raise ValueError("DataSets %s and %s don't have the same number of time steps" %
+                                 (data_sets[0].name, ds.name))
+        if chunk < 1:
+            raise ValueError("chunk must be at least one time step")
+        stop = len(times) if stop is None else min(stop, len(times))
+
+        def read_block(block_start):
+            block = slice(block_start, min(block_start + chunk, stop))
+            return times[block], {ds.name: ds.masked(block) for ds in data_sets}
+
+        for block in prefetched(read_block, range(start, stop, chunk), prefetch):
+            yield block
 
     def locate_face_simple(self, point):
         """
@@ -351,6 +769,75 @@ class UGrid(object):
                 return i
         return None
 
+    def locate_faces(self, points, return_weights=False):
+        """
+        returns the indexes of the faces that the points are in: -1 for
+        points that are not in the mesh
+
+        :param points: the points you want to locate -- (num points, 2)
+
+        :param return_weights=False: also return the interpolation weights
+                                     of each face's nodes -- see util.locate_points
+
+        The faces are searched with a tree of their centroids if scipy
+        is installed, and by checking all of them otherwise.
+        """
+        face_index, weights = locate_points(self.nodes, self.faces, points)
+        if return_weights:
+            return face_index, weights
+        return face_index
+
+    def interpolate(self, data_set, points, index=None):
+        """
+        the values of a DataSet at points
+
+        :param data_set: the DataSet (on the nodes or faces), or its name
+
+        :param points: the points -- (num points, 2)
+
+        :param index=None: index into the leading axes of the data, e.g. a
+                           time step: only that part of it is read.
+
+        Node data is interpolated from the nodes of the face each point is
+        in. Nodes with missing values (NaN, or flagged by the DataSet's
+        validity mask -- e.g. dry ones) are left out, and the weights of
+        the others scaled up to make up for them. Face data is the value
+        of the face.
+
+        returns a float array of (leading axes..., num points): NaN for
+        points outside the mesh, or where there are no valid values.
+        """
+        if not isinstance(data_set, DataSet):
+            try:
+                data_set = self._data[data_set]
+            except KeyError:
+                raise ValueError("There is no DataSet named %s on the grid" % data_set)
+        if data_set.location not in ('node', 'face'):
+            raise ValueError("can only interpolate data on the nodes or faces, not the %ss" %
+                             data_set.location)
+        face_index, weights = self.locate_faces(points, return_weights=True)
+        inside = face_index >= 0
+        data = np.asarray(data_set.filled(np.nan, index), dtype=np.float64)
+        result = np.full(data.shape[:-1] + (len(face_index),), np.nan)
+        if not inside.any():
+            return result
+        faces = face_index[inside]
+        if data_set.location == 'face':
+            result[..., inside] = data[..., faces]
+            return result
+        ## the faces' nodes -- padding (-1) has a weight of zero
+        nodes = self.faces[faces]
+        weights = np.where(nodes >= 0, weights[inside], 0.0)
+        values = data[..., np.maximum(nodes, 0)]
+        missing = np.isnan(values)
+        weights = np.where(missing, 0.0, weights)
+        total = weights.sum(axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result[..., inside] = np.where(total > 0,
+                                           (np.where(missing, 0.0, values) * weights).sum(axis=-1) / total,
+                                           np.nan)
+        return result
+
     def build_face_face_connectivity(self):
         """
         builds the face_face_connectivity array:
@@ -360,7 +847,7 @@ class UGrid(object):
         """        
         num_vertices = self.num_vertices
         num_faces = self.faces.shape[0]
-        face_face = np.zeros( (num_faces, num_vertices), dtype=IND_DT )
+        face_face = np.zeros( (num_faces, num_vertices), dtype=self.flag_dtype )
         face_face += -1 # fill with -1
 
         # loop through all the triangles to find the matching edges:
@@ -383,6 +870,7 @@ class UGrid(object):
                 else:
                     edges[edge] = (i, j) # face num, edge_num
         self._face_face_connectivity = face_face
+        self._mesh_dirty = True
 
     def build_edges(self):
         """
@@ -394,7 +882,7 @@ class UGrid(object):
         """        
         num_vertices = self.num_vertices
         num_faces = self.faces.shape[0]
-        face_face = np.zeros( (num_faces, num_vertices), dtype=IND_DT )
+        face_face = np.zeros( (num_faces, num_vertices), dtype=self.flag_dtype )
         face_face += -1 # fill with -1
 
         # loop through all the faces to find all the edges:
@@ -406,7 +894,8 @@ class UGrid(object):
                 if edge[0] > edge[1]: # flip them
                     edge = (edge[1], edge[0]) 
                 edges.add(edge)
-        self._edges = np.array(list(edges), dtype=IND_DT)
+        self._edges = np.array(list(edges), dtype=self.index_dtype)
+        self._mesh_dirty = True
 
     def build_boundaries(self):
         """
@@ -450,7 +939,7 @@ class UGrid(object):
 
         Useful if you want this in the output file
         """
-        face_coordinates = np.zeros( (len(self.faces),2), dtype=NODE_DT )
+        face_coordinates = np.zeros( (len(self.faces),2), dtype=self.node_dtype )
         ## fixme: there has got to be a way to vectorize this
         for i, face in enumerate(self.faces):
             coords = self.nodes[face]
@@ -471,7 +960,7 @@ class UGrid(object):
 
         Useful if you want this in the output file
         """
-        edge_coordinates = np.zeros( (len(self.edges),2), dtype=NODE_DT )
+        edge_coordinates = np.zeros( (len(self.edges),2), dtype=self.node_dtype )
         ## fixme: there has got to be a way to vectorize this
         for i, edge in enumerate(self.edges):
             coords = self.nodes[edge]
@@ -491,7 +980,7 @@ class UGrid(object):
 
         Useful if you want this in the output file
         """
-        boundary_coordinates = np.zeros( (len(self.boundaries),2), dtype=NODE_DT )
+        boundary_coordinates = np.zeros( (len(self.boundaries),2), dtype=self.node_dtype )
         ## fixme: there has got to be a way to vectorize this
         for i, bound in enumerate(self.boundaries):
             coords = self.nodes[bound]
@@ -499,168 +988,143 @@ class UGrid(object):
         self.boundary_coordinates = boundary_coordinates
 
 
-    def save_as_netcdf(self, filepath):
+    def save_native(self, dirname):
+        """
+        save the ugrid object in pyugrid's native format: a directory of
+        .npy files, one per array, and a JSON manifest of the names and
+        attributes. Open it again with UGrid.from_native().
+
+        :param dirname: the directory to save to. It is created if need be,
+                        and a grid already saved there is replaced.
+        """
+        native.save_native(self, dirname)
+
+    def save_as_gr3(self, filepath, data_name='depth', title=None):
+        """
+        save the grid as a SELFE/SCHISM .gr3 (or ADCIRC fort.14) file
+
+        :param filepath: path to file you want to save to.
+
+        :param data_name='depth': the node DataSet to write as the depth
+
+        :param title=None: the title (first) line of the file
+        """
+        ascii_grids.save_gr3(self, filepath, data_name, title)
+
+    def save_as_2dm(self, filepath, data_name='depth'):
+        """
+        save the grid as an SMS .2dm mesh file
+
+        :param filepath: path to file you want to save to.
+
+        :param data_name='depth': the node DataSet to write as the z values
+        """
+        ascii_grids.save_2dm(self, filepath, data_name)
+
+    def save_as_vtu(self, filepath, datasets=None, time_index=None):
+        """
+        save the grid, and node and face data, as a binary VTK
+        unstructured grid (.vtu) file
+
+        :param filepath: path to file you want to save to.
+
+        :param datasets=None: the names of the DataSets to write (or DataSet
+                              objects). The default is all the node and face data.
+
+        :param time_index=None: the time step to write from time-varying data.
+                                Without it, only data that doesn't vary in
+                                time is written by default.
+        """
+        write_vtk.write_vtu(self, filepath, datasets, time_index)
+
+    def save_as_pvd(self, filepath, datasets=None):
+        """
+        save the time-varying data as a VTK time series: a ParaView
+        collection (.pvd) file, and a .vtu file for each time step,
+        written one step at a time.
+
+        :param filepath: path to the .pvd file. The .vtu files are put
+                         next to it.
+
+        :param datasets=None: the names of the DataSets to write. The default
+                              is all the node and face data. The time-varying
+                              ones must all have the same times.
+
+        Use write_vtk.PVDWriter to write data as it is computed.
+        """
+        names = list(self.data.keys()) if datasets is None else datasets
+        selected = [self.data[name] for name in names
+                    if self.data[name].location in ('node', 'face')]
+        times = [ds.time for ds in selected if ds.time is not None]
+        if not times:
+            raise ValueError("None of the data varies in time")
+        for other in times[1:]:
+            if not np.array_equal(other, times[0]):
+                raise ValueError("The data to save don't all have the same times")
+        with write_vtk.PVDWriter(filepath, self, datasets) as writer:
+            for i, t in enumerate(times[0]):
+                writer.append(t, time_index=i)
+
+    def save_as_netcdf(self, filepath, encoding=None, mode='w'):
         """
         save the ugrid object as a netcdf file
 
         :param filepath: path to file you want o save to.
-                         An existing one will be clobbered if it already exists.
+                         An existing one will be clobbered if it already exists
+                         (unless mode is 'a').
+
+        :param encoding=None: storage options for the netcdf variables.
+                              A dict keyed by location ('node', 'face', 'edge',
+                              'boundary') and/or variable name, of dicts of
+                              keyword arguments to netCDF4 createVariable:
+                              zlib, complevel, shuffle, chunksizes,
+                              least_significant_digit, etc.
+                              A location's options apply to the coordinates,
+                              connectivity and data on that location, and
+                              a variable's options override its location's.
+                              e.g. ``{'node': {'zlib': True, 'complevel': 4},
+                              'depth': {'least_significant_digit': 2}}``
+                              chunksizes can be given for just the leading
+                              (location) axis, the rest are not chunked.
+                              The default is one uncompressed chunk per variable.
+
+        :param mode='w': 'w' writes the whole grid to a new file.
+                         'a' updates an existing file that has the same mesh
+                         (e.g. the one the grid was loaded from): only the
+                         DataSets that are not in the file, or have been
+                         modified since the grid was loaded or saved, are
+                         written -- the mesh is checked, but not rewritten
+                         (connectivity the file doesn't have is added).
+                         A ValueError is raised if the mesh doesn't match.
+
+        Time-varying DataSets are written on a 'time' dimension -- they must
+        all have the same times, which are written as a coordinate variable.
 
         follows the convernsion established by the netcdf UGRID working group:
 
         http://publicwiki.deltares.nl/display/NETCDF/Deltares+CF+proposal+for+Unstructured+Grid+data+model
 
         """
-        mesh_name = self.mesh_name
-
-
         from netCDF4 import Dataset as ncDataset
-        from netCDF4 import num2date, date2num
+        if mode == 'a':
+            with write_netcdf.NETCDF_LOCK, ncDataset(filepath, mode="a") as nclocal:
+                write_netcdf.update_nc_dataset(nclocal, self, encoding)
+            self.mark_clean()
+            return
+        elif mode != 'w':
+            raise ValueError("mode must be 'w' or 'a', not %r" % (mode,))
+
         # create a new netcdf file
-        with ncDataset(filepath, mode="w", clobber=True) as nclocal:
-
-            nclocal.createDimension(mesh_name+'_num_node', len(self.nodes) )
-            if self._edges is not None:
-                nclocal.createDimension(mesh_name+'_num_edge', len(self.edges) )
-            if self._boundaries is not None:
-                nclocal.createDimension(mesh_name+'_num_boundary', len(self.boundaries) )
-            if self._faces is not None:
-                nclocal.createDimension(mesh_name+'_num_face', len(self.faces) )
-                nclocal.createDimension(mesh_name+'_num_vertices', self.faces.shape[1] )
-            nclocal.createDimension('two', 2)
-
-            #mesh topology
-            mesh = nclocal.createVariable(mesh_name, IND_DT, (), )
-            mesh.cf_role = "mesh_topology" 
-            mesh.long_name = "Topology data of 2D unstructured mesh" 
-            mesh.topology_dimension = 2 
-            mesh.node_coordinates = "{0}_node_lon {0}_node_lat".format(mesh_name) 
-
-            if self.edges is not None:
-                mesh.edge_node_connectivity = mesh_name+"_edge_nodes"  ## attribute required if variables will be defined on edges
-                if self.edge_coordinates is not None:
-                    mesh.edge_coordinates =   "{0}_edge_lon {0}_edge_lat".format(mesh_name)  ## optional attribute (requires edge_node_connectivity)
-            if self.faces is not None:
-                mesh.face_node_connectivity = mesh_name+"_face_nodes"
-                if self.face_coordinates is not None: 
-                    mesh.face_coordinates = "{0}_face_lon {0}_face_lat".format(mesh_name) ##  optional attribute
-            if self.face_edge_connectivity is not None:
-                mesh.face_edge_connectivity = mesh_name+"_face_edges"  ## optional attribute (requires edge_node_connectivity)
-            if self.face_face_connectivity is not None:
-                mesh.face_face_connectivity = mesh_name+"_face_links"  ## optional attribute
-            if self.boundaries is not None:
-                mesh.boundary_node_connectivity = mesh_name+"_boundary_nodes"
-
-            ## fixme: This could be re-factored to be more generic, rather than separate for each type of data
-            ##        see the coordinates example below
-            if self.faces is not None:
-                face_nodes = nclocal.createVariable(mesh_name+"_face_nodes",
-                                                    IND_DT,
-                                                    (mesh_name+'_num_face', mesh_name+'_num_vertices'),
-                                                    )
-                face_nodes[:] = self.faces
-
-                face_nodes.cf_role = "face_node_connectivity"
-                face_nodes.long_name = "Maps every triangular face to its three corner nodes."
-                face_nodes.start_index = 0 ;
-
-            if self.edges is not None:
-                edge_nodes = nclocal.createVariable(mesh_name+"_edge_nodes",
-                                                    IND_DT,
-                                                    (mesh_name+'_num_edge', 'two'),
-                                                    )
-                edge_nodes[:] = self.edges
-
-                edge_nodes.cf_role = "edge_node_connectivity"
-                edge_nodes.long_name = "Maps every edge to the two nodes that it connects."
-                edge_nodes.start_index = 0 ;
-
-            if self.boundaries is not None:
-                boundary_nodes = nclocal.createVariable(mesh_name+"_boundary_nodes",
-                                                        IND_DT,
-                                                        (mesh_name+'_num_boundary', 'two'),
-                                                        )
-                boundary_nodes[:] = self.boundaries
-
-                boundary_nodes.cf_role = "boundary_node_connectivity"
-                boundary_nodes.long_name = "Maps every boundary segment to the two nodes that it connects."
-                boundary_nodes.start_index = 0 ;
-
-            ## optional "coordinate variables"
-            for location in ['face', 'edge', 'boundary']:
-                if getattr(self, "{0}_coordinates".format(location)) is not None:
-                    for axis, ind in [('lat',1), ('lon',0)]:
-                        var = nclocal.createVariable("{0}_{1}_{2}".format(mesh_name, location, axis),
-                                                     NODE_DT,
-                                                     dimensions=("{0}_num_{1}".format(mesh_name, location)),
-                                                    )
-                        var[:] = getattr(self, "{0}_coordinates".format(location))[:,ind]
-                        ## attributes of the variable
-                        var.standard_name = "longitude" if axis == 'lon' else 'latitude'
-                        var.units = "degrees_east" if axis == 'lon' else 'degrees_north'
-                        var.long_name = "Characteristics {0} of 2D mesh {1}".format(var.standard_name, location)
-
-            ## the node data
-            node_lon = nclocal.createVariable(mesh_name+'_node_lon',
-                                              self._nodes.dtype,
-                                              (mesh_name+'_num_node',),
-                                              chunksizes=(len(self.nodes), ),
-                                              #zlib=False,
-                                              #complevel=0,
-                                              )
-            node_lon[:] = self.nodes[:,0]
-            node_lon.standard_name = "longitude"
-            node_lon.long_name = "Longitude of 2D mesh nodes."
-            node_lon.units = "degrees_east"
-
-            node_lat = nclocal.createVariable(mesh_name+'_node_lat',
-                                              self._nodes.dtype,
-                                              (mesh_name+'_num_node',),
-                                              chunksizes=(len(self.nodes), ),
-                                              #zlib=False,
-                                              #complevel=0,
-                                              )
-            node_lat[:] = self.nodes[:,1]
-            node_lat.standard_name = "latitude"
-            node_lat.long_name = "Latitude of 2D mesh nodes."
-            node_lat.units = "degrees_north"
+        with write_netcdf.NETCDF_LOCK, ncDataset(filepath, mode="w", clobber=True) as nclocal:
+
+            write_netcdf.write_mesh(nclocal, self, encoding)
 
             ## write the associated data
             for dataset in self.data.values():
-                if dataset.location == 'node':
-                    shape = (mesh_name + '_num_node',)
-                    coordinates = "{0}_node_lon {0}_node_lat".format(mesh_name)
-                    chunksizes = (len(self.nodes), )
-                elif dataset.location == 'face':
-                    shape = (mesh_name + '_num_face',)
-                    coordinates = "{0}_face_lon {0}_face_lat".format(mesh_name) if self.face_coordinates is not None else None
-                    chunksizes = (len(self.faces), )
-                elif dataset.location == 'edge':
-                    shape = (mesh_name + '_num_edge',)
-                    coordinates = "{0}_edge_lon {0}_edge_lat".format(mesh_name) if self.edge_coordinates is not None else None
-                    chunksizes = (len(self.edges), )
-                elif dataset.location == 'boundary':
-                    shape = (mesh_name + '_num_boundary',)
-                    coordinates = "{0}_boundary_lon {0}_boundary_lat".format(mesh_name) if self.boundary_coordinates is not None else None
-                    chunksizes = (len(self.boundaries), )
-                data_var = nclocal.createVariable(dataset.name,
-                                                  dataset.data.dtype,
-                                                  shape,
-                                                  chunksizes=chunksizes,
-                                                  #zlib=False,
-                                                  #complevel=0,
-                                                  )
-                data_var[:] = dataset.data
-                ## add the standard attributes:
-                data_var.location = dataset.location
-                data_var.mesh = mesh_name
-                if coordinates is not None:
-                    data_var.coordinates = coordinates
-                ## add the extra attributes
-                for att_name, att_value in dataset.attributes.items():
-                    setattr(data_var, att_name, att_value)
+                write_netcdf.write_data_set(nclocal, self, dataset, encoding)
 
             nclocal.sync()
+        self.mark_clean()
 
 
 
@@ -4,6 +4,8 @@ miscellaneous util functions
 
 from __future__ import (absolute_import, division, print_function)
 
+from multiprocessing.pool import ThreadPool
+
 import numpy as np
 
 
@@ -49,3 +51,210 @@ def _signed_area_tri(points):
     x3, y3 = points[2]
 
     return(((x1-x3)*(y2-y3)-(x2-x3)*(y1-y3))/2)
+
+
+def signed_areas(a, b, c):
+    """
+    the signed areas of triangles -- positive if a, b, c are anticlockwise
+
+    a, b, c : the coordinates of the vertices -- (..., 2) arrays
+    """
+    return ((a[..., 0] - c[..., 0]) * (b[..., 1] - c[..., 1]) -
+            (b[..., 0] - c[..., 0]) * (a[..., 1] - c[..., 1])) / 2
+
+
+def triangle_weights(points, a, b, c):
+    """
+    the barycentric weights of points in triangles (a, b, c)
+
+    points, a, b, c : coordinates -- (..., 2) arrays that broadcast together
+
+    returns a (..., 3) array of the weights, one for each vertex: NaN
+    for degenerate (zero area) triangles.
+    """
+    area = signed_areas(a, b, c)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.stack((signed_areas(b, c, points),
+                            signed_areas(c, a, points),
+                            signed_areas(a, b, points)), axis=-1) / area[..., np.newaxis]
+    weights[area == 0] = np.nan
+    return weights
+
+
+def clamp_weights(weights):
+    """
+    clamp barycentric weights of points that are just outside their
+    triangle (by round off) so they are all in [0, 1], and add up to 1
+
+    weights : (..., 3) array -- a clamped copy is returned
+
+    This is the clamping SELFE uses for its interpolation weights.
+    """
+    weights = np.array(weights, dtype=np.float64)
+    w0 = weights[..., 0]
+    w1 = np.clip(weights[..., 1], 0.0, 1.0)
+    w2 = np.clip(weights[..., 2], 0.0, 1.0)
+    over = w0 + w1 > 1
+    weights[..., 1] = np.where(over, 1 - w0, w1)
+    weights[..., 2] = np.where(over, 0.0, 1 - w0 - w1)
+    return weights
+
+
+def face_centroids(nodes, faces):
+    """
+    the mean of the vertices of each face
+
+    faces can be padded with -1, for faces with fewer vertices than the others
+    """
+    faces = np.asarray(faces)
+    valid = faces >= 0
+    coords = nodes[np.where(valid, faces, 0)] * valid[..., np.newaxis]
+    return coords.sum(axis=1) / valid.sum(axis=1)[:, np.newaxis]
+
+
+def build_face_tree(nodes, faces):
+    """
+    build a search tree of the face centroids, for locate_points
+
+    returns (tree, radius), where radius is the furthest any vertex is
+    from its face's centroid -- or None if scipy isn't installed.
+    """
+    try:
+        from scipy.spatial import cKDTree
+    except ImportError:
+        return None
+    faces = np.asarray(faces)
+    centroids = face_centroids(nodes, faces)
+    distances = np.hypot(*(nodes[faces] - centroids[:, np.newaxis]).T)
+    radius = np.where(faces.T >= 0, distances, 0.0).max() if len(faces) else 0.0
+    return cKDTree(centroids), radius
+
+
+def _test_faces(nodes, faces, points, candidates):
+    """
+    look for the face that holds each point among its candidates
+
+    candidates : (num points, k) array of face indexes -- -1 for none
+
+    returns the index (in candidates) of the first that holds the point
+    (-1 if none do), and the (clamped) weights of the face's vertices
+    """
+    num_vertices = faces.shape[1]
+    found = np.full((len(points),), -1, dtype=np.intp)
+    weights = np.zeros((len(points), num_vertices))
+    cand_faces = faces[np.maximum(candidates, 0)]
+    cand_faces[candidates < 0] = -1
+    p = points[:, np.newaxis, :]
+    ## split the faces into triangles: (0, 1, 2), (0, 2, 3), ...
+    for i in range(1, num_vertices - 1):
+        vertices = cand_faces[:, :, (0, i, i + 1)]
+        w = triangle_weights(p, *(nodes[np.maximum(vertices, 0)][:, :, j] for j in range(3)))
+        with np.errstate(invalid='ignore'):
+            inside = (np.abs(w).sum(axis=-1) - 1 <= epsilon) & (vertices >= 0).all(axis=-1)
+        points_in = inside.any(axis=1) & (found < 0)
+        if not points_in.any():
+            continue
+        first = inside[points_in].argmax(axis=1)
+        found[points_in] = first
+        rows = np.nonzero(points_in)[0]
+        weights[rows[:, np.newaxis], (0, i, i + 1)] = clamp_weights(w[rows, first])
+    return found, weights
+
+
+def locate_points(nodes, faces, points, tree=None, num_candidates=8):
+    """
+    find the faces that hold points, and the interpolation weights
+
+    :param nodes: (num nodes, 2) coordinates
+
+    :param faces: (num faces, num vertices) node indexes, padded with -1 for
+                  faces with fewer vertices than the others. Faces with more
+                  than 3 vertices are split into triangles from their first vertex.
+
+    :param points: (num points, 2) coordinates
+
+    :param tree=None: the result of build_face_tree(nodes, faces), to reuse
+                      it for many calls. Built if None. If scipy isn't
+                      installed every face is checked for every point (in
+                      vectorized blocks), which is much slower for big grids.
+
+    :param num_candidates=8: how many of the faces with the nearest centroids
+                             are checked first
+
+    returns (face indexes, weights): face index is -1 for points outside
+    the mesh. weights is (num points, num vertices) -- the weight of each
+    vertex of the face (0 for those not used), clamped as by clamp_weights.
+    """
+    nodes = np.asarray(nodes, dtype=np.float64)
+    faces = np.asarray(faces)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    num_faces = len(faces)
+    face_index = np.full((len(points),), -1, dtype=np.intp)
+    weights = np.zeros((len(points), faces.shape[1] if faces.ndim == 2 else 3))
+    if num_faces == 0 or len(points) == 0:
+        return face_index, weights
+
+    ## points outside the bounding box of the mesh can't be in it
+    todo = np.nonzero(((points >= nodes.min(axis=0)) &
+                       (points <= nodes.max(axis=0))).all(axis=1))[0]
+    if tree is None:
+        tree = build_face_tree(nodes, faces)
+
+    if tree is not None:
+        tree, radius = tree
+        k = min(num_candidates, num_faces)
+        while len(todo):
+            distances, candidates = tree.query(points[todo], k=k)
+            candidates = candidates.reshape(len(todo), k)
+            distances = distances.reshape(len(todo), k)
+            ## a face can only hold a point within radius of its centroid
+            candidates[distances > radius] = -1
+            found, w = _test_faces(nodes, faces, points[todo], candidates)
+            ok = found >= 0
+            face_index[todo[ok]] = candidates[ok, found[ok]]
+            weights[todo[ok]] = w[ok]
+            ## look further for points that could be in faces further away
+            todo = todo[~ok & (distances[:, -1] <= radius)]
+            if k == num_faces:
+                break
+            k = min(k * 8, num_faces)
+    else:
+        block = max(1, 2**20 // num_faces)
+        all_faces = np.arange(num_faces)
+        for start in range(0, len(todo), block):
+            rows = todo[start:start + block]
+            candidates = np.broadcast_to(all_faces, (len(rows), num_faces))
+            found, w = _test_faces(nodes, faces, points[rows], candidates)
+            ok = found >= 0
+            face_index[rows[ok]] = found[ok]
+            weights[rows[ok]] = w[ok]
+    return face_index, weights
+
+
+def prefetched(read, keys, prefetch=True):
+    """
+    yields read(key) for each of the keys, in order -- reading the next
+    one on a background thread while the current one is being used
+
+    :param read: function that reads a block, e.g. of time steps
+
+    :param keys: the keys of the blocks, e.g. their first time steps
+
+    :param prefetch=True: if False, the blocks are read in turn, on this thread
+    """
+    keys = list(keys)
+    if not prefetch:
+        for key in keys:
+            yield read(key)
+        return
+
+    pool = ThreadPool(1)
+    try:
+        pending = pool.apply_async(read, (keys[0],)) if keys else None
+        for i in range(len(keys)):
+            block = pending.get()
+            if i + 1 < len(keys):
+                pending = pool.apply_async(read, (keys[i + 1],))
+            yield block
+    finally:
+        pool.terminate()
@@ -0,0 +1,719 @@
+#!/usr/bin/env python
+
+"""
+code to write the netcdf unstructured grid standard:
+
+https://github.com/ugrid-conventions/ugrid-conventions/
+
+This code is called by the UGrid class (UGrid.save_as_netcdf), and
+provides the TimeSeriesWriter, for writing the mesh once and then
+appending data to the file a time step at a time.
+
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import datetime
+
+import numpy as np
+import netCDF4
+
+from . import read_netcdf
+from .read_netcdf import NETCDF_LOCK
+
+
+def var_options(encoding, var_name, location, shape, chunksizes=None):
+    """
+    the createVariable options for one variable
+
+    :param encoding: dict of options, keyed by location and/or variable
+                     name -- see UGrid.save_as_netcdf
+
+    :param var_name: name of the variable
+
+    :param location: location of the variable ('node', 'face', etc.)
+
+    :param shape: shape of the variable -- None for an unlimited dimension
+
+    :param chunksizes=None: default chunksizes for the variable
+    """
+    encoding = {} if encoding is None else encoding
+    options = {} if chunksizes is None else {'chunksizes': chunksizes}
+    options.update(encoding.get(location, {}))
+    options.update(encoding.get(var_name, {}))
+    if options.get('chunksizes') is not None:
+        # chunks can be given for just the leading axes,
+        # and can't be bigger than the (limited) dimensions
+        chunks = (tuple(options['chunksizes']) +
+                  tuple(1 if n is None else n for n in shape[len(options['chunksizes']):]))
+        options['chunksizes'] = tuple(max(1, c if n is None else min(c, n))
+                                      for c, n in zip(chunks, shape))
+    return options
+
+
+def location_dim(grid, location):
+    """
+    the name of the dimension for a location on the grid's mesh
+    """
+    if location not in ('node', 'face', 'edge', 'boundary'):
+        raise ValueError("Can't write data on location: %s" % location)
+    return "{0}_num_{1}".format(grid.mesh_name, location)
+
+
+def location_size(grid, location):
+    """
+    the number of elements of a location (node, face, etc.) on the grid
+    """
+    elements = {'node': grid.nodes,
+                'face': grid.faces,
+                'edge': grid.edges,
+                'boundary': grid.boundaries,
+                }.get(location)
+    if elements is None:
+        raise ValueError("grid has no %ss" % location)
+    return len(elements)
+
+
+def write_mesh(nclocal, grid, encoding=None):
+    """
+    writes the mesh: the dimensions, the mesh variable, the connectivity
+    and the coordinates
+
+    :param nclocal: netCDF4 Dataset open for writing
+
+    :param grid: the grid to write
+    :type grid: UGrid object.
+
+    :param encoding=None: storage options -- see UGrid.save_as_netcdf
+    """
+    from .ugrid import IND_DT
+
+    mesh_name = grid.mesh_name
+
+    nclocal.createDimension(mesh_name+'_num_node', len(grid.nodes) )
+    if grid._edges is not None:
+        nclocal.createDimension(mesh_name+'_num_edge', len(grid.edges) )
+    if grid._boundaries is not None:
+        nclocal.createDimension(mesh_name+'_num_boundary', len(grid.boundaries) )
+    if grid._faces is not None:
+        nclocal.createDimension(mesh_name+'_num_face', len(grid.faces) )
+        nclocal.createDimension(mesh_name+'_num_vertices', grid.faces.shape[1] )
+    nclocal.createDimension('two', 2)
+
+    #mesh topology
+    mesh = nclocal.createVariable(mesh_name, IND_DT, (), )
+    mesh.cf_role = "mesh_topology"
+    mesh.long_name = "Topology data of 2D unstructured mesh"
+    mesh.topology_dimension = 2
+    mesh.node_coordinates = "{0}_node_lon {0}_node_lat".format(mesh_name)
+
+    if grid.edges is not None:
+        mesh.edge_node_connectivity = mesh_name+"_edge_nodes"  ## attribute required if variables will be defined on edges
+        if grid.edge_coordinates is not None:
+            mesh.edge_coordinates =   "{0}_edge_lon {0}_edge_lat".format(mesh_name)  ## optional attribute (requires edge_node_connectivity)
+    if grid.faces is not None:
+        mesh.face_node_connectivity = mesh_name+"_face_nodes"
+        if grid.face_coordinates is not None:
+            mesh.face_coordinates = "{0}_face_lon {0}_face_lat".format(mesh_name) ##  optional attribute
+    if grid.face_edge_connectivity is not None:
+        mesh.face_edge_connectivity = mesh_name+"_face_edges"  ## optional attribute (requires edge_node_connectivity)
+    if grid.face_face_connectivity is not None:
+        mesh.face_face_connectivity = mesh_name+"_face_links"  ## optional attribute
+    if grid.boundaries is not None:
+        mesh.boundary_node_connectivity = mesh_name+"_boundary_nodes"
+
+    for grid_attr in ('faces', 'face_face_connectivity', 'edges', 'boundaries'):
+        if getattr(grid, grid_attr) is not None:
+            write_connectivity(nclocal, grid, grid_attr, encoding)
+
+    ## optional "coordinate variables"
+    for location in ['face', 'edge', 'boundary']:
+        coords = getattr(grid, "{0}_coordinates".format(location))
+        if coords is not None:
+            for axis, ind in [('lat',1), ('lon',0)]:
+                var_name = "{0}_{1}_{2}".format(mesh_name, location, axis)
+                var = nclocal.createVariable(var_name,
+                                             grid.node_dtype,
+                                             dimensions=("{0}_num_{1}".format(mesh_name, location)),
+                                             **var_options(encoding, var_name, location, (len(coords),))
+                                            )
+                var[:] = coords[:,ind]
+                ## attributes of the variable
+                var.standard_name = "longitude" if axis == 'lon' else 'latitude'
+                var.units = "degrees_east" if axis == 'lon' else 'degrees_north'
+                var.long_name = "Characteristics {0} of 2D mesh {1}".format(var.standard_name, location)
+
+    ## the node data
+    for axis, ind in [('lon', 0), ('lat', 1)]:
+        var_name = "{0}_node_{1}".format(mesh_name, axis)
+        var = nclocal.createVariable(var_name,
+                                     grid.node_dtype,
+                                     (mesh_name+'_num_node',),
+                                     **var_options(encoding, var_name, 'node', (len(grid.nodes),),
+                                                   chunksizes=(len(grid.nodes), ))
+                                     )
+        var[:] = grid.nodes[:,ind]
+        if axis == 'lon':
+            var.standard_name = "longitude"
+            var.long_name = "Longitude of 2D mesh nodes."
+            var.units = "degrees_east"
+        else:
+            var.standard_name = "latitude"
+            var.long_name = "Latitude of 2D mesh nodes."
+            var.units = "degrees_north"
+
+
+# the variable name suffix, dimension of the indexes, and long_name of
+# each connectivity array -- see read_netcdf.grid_defs for the rest
+connectivity_defs = {
+    'faces': ('_face_nodes', '_num_vertices',
+              "Maps every triangular face to its three corner nodes."),
+    'face_face_connectivity': ('_face_links', '_num_vertices',
+                               "Indicates which other faces neighbor each face."),
+    'edges': ('_edge_nodes', 'two',
+              "Maps every edge to the two nodes that it connects."),
+    'boundaries': ('_boundary_nodes', 'two',
+                   "Maps every boundary segment to the two nodes that it connects."),
+}
+
+
+def write_connectivity(nclocal, grid, grid_attr, encoding=None):
+    """
+    writes one of the grid's connectivity arrays, and points the mesh
+    variable at it. Its location dimension is created if need be.
+
+    :param nclocal: netCDF4 Dataset open for writing, with the mesh variable
+
+    :param grid: the grid to write
+    :type grid: UGrid object.
+
+    :param grid_attr: the array: 'faces', 'face_face_connectivity',
+                      'edges' or 'boundaries'
+
+    :param encoding=None: storage options -- see UGrid.save_as_netcdf
+    """
+    mesh_name = grid.mesh_name
+    defs = dict((d['grid_attr'], d) for d in read_netcdf.grid_defs)[grid_attr]
+    suffix, index_dim, long_name = connectivity_defs[grid_attr]
+    array = getattr(grid, grid_attr)
+
+    dims = (location_dim(grid, defs['location']),
+            index_dim if index_dim == 'two' else mesh_name + index_dim)
+    for dim, size in zip(dims, array.shape):
+        if dim not in nclocal.dimensions:
+            nclocal.createDimension(dim, size)
+        elif len(nclocal.dimensions[dim]) != size:
+            raise ValueError("%s has %i %s, but the grid has %i" %
+                             (nclocal.filepath(), len(nclocal.dimensions[dim]), dim, size))
+
+    var_name = mesh_name + suffix
+    var = nclocal.createVariable(var_name,
+                                 grid.flag_dtype if defs['flagged'] else grid.index_dtype,
+                                 dims,
+                                 **var_options(encoding, var_name, defs['location'], array.shape)
+                                 )
+    var[:] = array
+
+    var.cf_role = defs['role']
+    var.long_name = long_name
+    var.start_index = 0
+    if defs['flagged']:
+        var.flag_values = -1
+        var.flag_meanings = "out_of_mesh"
+    nclocal.variables[mesh_name].setncattr(defs['role'], var_name)
+    return var
+
+
+def create_data_var(nclocal, grid, name, location, dtype, dimensions=(),
+                    attributes=None, encoding=None):
+    """
+    creates a variable for data on the grid's mesh
+
+    :param nclocal: netCDF4 Dataset open for writing, with the mesh already written
+
+    :param grid: the grid the data is on
+    :type grid: UGrid object.
+
+    :param name: name of the variable
+
+    :param location: location of the data ('node', 'face', 'edge', 'boundary')
+
+    :param dtype: the data type of the variable
+
+    :param dimensions=(): names of the dimensions before the location
+                          dimension, e.g. ('time', 'mesh_num_layer')
+
+    :param attributes=None: extra attributes of the variable
+
+    :param encoding=None: storage options -- see UGrid.save_as_netcdf.
+                          By default the location axis is one chunk,
+                          and each unlimited dimension is chunked by one.
+
+    returns the netCDF4 Variable
+    """
+    mesh_name = grid.mesh_name
+    dimensions = tuple(dimensions) + (location_dim(grid, location),)
+    dims = [nclocal.dimensions[dim] for dim in dimensions]
+    shape = tuple(None if dim.isunlimited() else len(dim) for dim in dims)
+    chunksizes = tuple(1 if dim.isunlimited() else len(dim) for dim in dims)
+
+    if location == 'node' or getattr(grid, "{0}_coordinates".format(location)) is not None:
+        coordinates = "{0}_{1}_lon {0}_{1}_lat".format(mesh_name, location)
+    else:
+        coordinates = None
+
+    options = var_options(encoding, name, location, shape, chunksizes=chunksizes)
+    attributes = dict(attributes or {})
+    ## netCDF4 only takes a _FillValue when the variable is created
+    if '_FillValue' in attributes:
+        options.setdefault('fill_value', attributes.pop('_FillValue'))
+    data_var = nclocal.createVariable(name,
+                                      dtype,
+                                      dimensions,
+                                      **options
+                                      )
+    ## add the standard attributes:
+    data_var.location = location
+    data_var.mesh = mesh_name
+    if coordinates is not None:
+        data_var.coordinates = coordinates
+    ## add the extra attributes
+    for att_name, att_value in attributes.items():
+        setattr(data_var, att_name, att_value)
+    return data_var
+
+
+def fill_value(var):
+    """
+    the value that marks missing data in a netCDF4 Variable: its
+    _FillValue, or the netCDF default for its type
+    """
+    try:
+        return var.getncattr('_FillValue')
+    except AttributeError:
+        return netCDF4.default_fillvals[var.dtype.str[1:]]
+
+
+def check_data_shape(grid, dataset):
+    """
+    check that a DataSet's data fits the grid, and its times
+
+    The data is shaped (num_location,) or (num_layers, num_location),
+    with a time axis first if the DataSet varies in time. A DataSet
+    with no data is skipped.
+
+    raises a ValueError if it doesn't fit
+    """
+    shape = tuple(dataset.data.shape)
+    if dataset.data.size == 0:
+        return
+    num = location_size(grid, dataset.location)
+    num_time = 0 if dataset.time is None else 1
+    if num_time:
+        time = np.asarray(dataset.time)
+        if time.ndim != 1 or time.dtype.kind not in 'iuf':
+            raise ValueError("the times of %s should be a 1-d array of numbers" % dataset.name)
+        if len(shape) < 2 or shape[0] != len(time):
+            raise ValueError("%s has %i times, so its data should be shaped (%i, ...), not %s" %
+                             (dataset.name, len(time), len(time), shape))
+    if len(shape) - num_time not in (1, 2) or shape[-1] != num:
+        time = "num_times, " if num_time else ""
+        raise ValueError("%s should be shaped (%s%i,) or (%snum_layers, %i), not %s" %
+                         (dataset.name, time, num, time, num, shape))
+
+
+def time_dim(nc, time):
+    """
+    the name of the time dimension for data at the given times
+
+    That of the file, if it has one -- its times must match -- otherwise
+    a new, unlimited 'time' dimension, and a coordinate variable with the
+    times. DataSets don't keep the units of their times, so neither does
+    a new time variable.
+
+    raises a ValueError if the file's times don't match
+    """
+    time = np.asarray(time)
+    name = read_netcdf.find_time_dim(nc)
+    if name is None:
+        name = 'time'
+        nc.createDimension(name, None)
+        var = nc.createVariable(name, time.dtype, (name,))
+        var.standard_name = "time"
+        var.long_name = "time"
+        var[:] = time
+        return name
+    var = nc.variables.get(name)
+    if var is None:
+        matches = len(nc.dimensions[name]) == len(time)
+    else:
+        matches = var.shape == time.shape and np.array_equal(var[:], time)
+    if not matches:
+        raise ValueError("the times in %s don't match the data's -- "
+                         "a file can only have one time axis" % nc.filepath())
+    return name
+
+
+def data_dimensions(nc, grid, dataset):
+    """
+    the dimensions of a DataSet's variable before its location dimension:
+    time, if it varies in time, and the layers, if it has any. Those that
+    aren't in the file yet are created.
+    """
+    check_data_shape(grid, dataset)
+    dimensions = ()
+    if dataset.time is not None:
+        dimensions += (time_dim(nc, dataset.time),)
+    if dataset.data.ndim == len(dimensions) + 2:
+        num_layers = dataset.data.shape[-2]
+        layer_dim = grid.mesh_name + '_num_layer'
+        if layer_dim not in nc.dimensions:
+            nc.createDimension(layer_dim, num_layers)
+        elif len(nc.dimensions[layer_dim]) != num_layers:
+            raise ValueError("%s has %i layers, but %s has %i" %
+                             (dataset.name, num_layers, nc.filepath(),
+                              len(nc.dimensions[layer_dim])))
+        dimensions += (layer_dim,)
+    return dimensions
+
+
+def write_data_set(nclocal, grid, dataset, encoding=None):
+    """
+    writes one DataSet to a file that already has the mesh written
+
+    Time-varying data is written on the file's time dimension -- which is
+    created if it isn't there yet, and must have the same times if it is.
+
+    values the DataSet's validity mask flags as missing are written as
+    the variable's fill value
+    """
+    dimensions = data_dimensions(nclocal, grid, dataset)
+    data_var = create_data_var(nclocal, grid, dataset.name, dataset.location,
+                               dataset.data.dtype, dimensions,
+                               attributes=dataset.attributes,
+                               encoding=encoding)
+    data_var[:] = dataset.filled(fill_value(data_var))
+    return data_var
+
+
+def check_mesh(nc, grid, compare_arrays=True):
+    """
+    check that a file has the same mesh as a grid
+
+    :param nc: netCDF4 Dataset object
+
+    :param grid: the grid to compare to
+    :type grid: UGrid object.
+
+    :param compare_arrays=True: compare the nodes and connectivity arrays,
+                                not just their sizes.
+
+    returns the names of the connectivity arrays the grid has, but the
+    file doesn't (other than the faces, which must be in both) -- e.g.
+    face_face_connectivity built after the grid was loaded.
+
+    raises a ValueError if they don't match
+    """
+    mesh_name = grid.mesh_name
+    if not read_netcdf.is_valid_mesh(nc, mesh_name):
+        raise ValueError("There is no mesh named %s in %s" % (mesh_name, nc.filepath()))
+    mesh_var = nc.variables[mesh_name]
+
+    def mismatch(what):
+        raise ValueError("The %s of mesh %s in %s don't match the grid's" %
+                         (what, mesh_name, nc.filepath()))
+
+    coord_names = mesh_var.getncattr('node_coordinates').strip().split()
+    if len(nc.variables[coord_names[0]]) != len(grid.nodes):
+        mismatch('nodes')
+    if compare_arrays:
+        nodes = read_netcdf._read_coordinates(nc, mesh_var, read_netcdf.coord_defs[0],
+                                             dtype=grid.node_dtype)
+        if not np.array_equal(nodes, grid.nodes):
+            mismatch('nodes')
+
+    missing = []
+    for defs in read_netcdf.grid_defs:
+        array = getattr(grid, defs['grid_attr'])
+        try:
+            var = nc.variables[mesh_var.getncattr(defs['role'])]
+        except (AttributeError, KeyError):
+            if array is not None:
+                if defs['grid_attr'] == 'faces':
+                    mismatch(defs['grid_attr'])
+                missing.append(defs['grid_attr'])
+            continue
+        if array is None or read_netcdf._num_elements(var, defs['num_ind']) != len(array):
+            mismatch(defs['grid_attr'])
+        if compare_arrays:
+            if not np.array_equal(read_netcdf.read_connectivity(var, defs['num_ind'], dtype=array.dtype),
+                                  array):
+                mismatch(defs['grid_attr'])
+    return missing
+
+
+def update_nc_dataset(nc, grid, encoding=None):
+    """
+    writes the grid's new and modified data to a file that already has its mesh
+
+    The mesh is checked: only the sizes, unless the grid's mesh has been
+    modified (grid.mesh_dirty), in which case the arrays are compared.
+    Connectivity arrays the grid has, but the file doesn't, are added.
+    DataSets that are not in the file are added. DataSets that are in the
+    file are only written if they are dirty: the data if it has been
+    set, the attributes if they have changed.
+
+    :param nc: netCDF4 Dataset object, open for appending
+
+    :param grid: the grid to write
+    :type grid: UGrid object.
+
+    :param encoding=None: storage options for the new variables --
+                          see UGrid.save_as_netcdf
+
+    raises a ValueError if the mesh doesn't match, or if a modified DataSet
+    no longer fits its variable in the file.
+    """
+    for grid_attr in check_mesh(nc, grid, compare_arrays=grid.mesh_dirty):
+        write_connectivity(nc, grid, grid_attr, encoding)
+
+    existing = dict((name, var) for name, var, location, attributes
+                    in read_netcdf.find_data_vars(nc, grid.mesh_name))
+    for dataset in grid.data.values():
+        var = existing.get(dataset.name)
+        if var is None:
+            if dataset.name in nc.variables:
+                raise ValueError("%s is already a variable in %s, but not data on mesh %s" %
+                                 (dataset.name, nc.filepath(), grid.mesh_name))
+            write_data_set(nc, grid, dataset, encoding)
+            continue
+        if var.location != dataset.location:
+            raise ValueError("%s is on the %ss in %s, not the %ss" %
+                             (dataset.name, var.location, nc.filepath(), dataset.location))
+        if dataset.data_dirty:
+            if var.shape != dataset.data.shape:
+                raise ValueError("%s has shape %s in %s -- can't write shape %s" %
+                                 (dataset.name, var.shape, nc.filepath(), dataset.data.shape))
+            if dataset.time is not None:
+                time_dim(nc, dataset.time)
+            var[:] = dataset.filled(fill_value(var))
+        if dataset.attributes_dirty:
+            for att_name in var.ncattrs():
+                if (att_name not in ('location', 'coordinates', 'mesh', '_FillValue') and
+                    att_name not in dataset.attributes):
+                    var.delncattr(att_name)
+            for att_name, att_value in dataset.attributes.items():
+                if att_name in var.ncattrs():
+                    current = var.getncattr(att_name)
+                    if np.array_equal(np.asarray(current), np.asarray(att_value)):
+                        continue
+                setattr(var, att_name, att_value)
+    nc.sync()
+
+
+class TimeSeriesWriter(object):
+    """
+    Writes a mesh to a netcdf file once, and then appends data to it
+    one time step at a time -- e.g. for output from a running model.
+
+    Records are buffered, and written to the file (and synced) every
+    buffer_steps time steps, so that the file can be read while it is
+    being written. Use as a context manager, or call close() when done.
+
+    Each variable is defined by a template DataSet. Its data sets the
+    shape and type of each time step: either (num_location,) or
+    (num_layers, num_location). A DataSet with no data is a float64
+    variable with no layers.
+    """
+
+    def __init__(self,
+                 filepath,
+                 grid,
+                 variables,
+                 time_units="seconds since 1970-01-01T00:00:00",
+                 calendar="standard",
+                 encoding=None,
+                 buffer_steps=10,
+                 ):
+        """
+        create the file, and write the mesh and the variable definitions
+
+        :param filepath: path to file to write. An existing one will be clobbered.
+
+        :param grid: the grid to write. Any data on the grid that doesn't
+                     vary in time is written to the file as well.
+        :type grid: UGrid object.
+
+        :param variables: the time-varying variables to write
+        :type variables: sequence of DataSet objects
+
+        :param time_units="seconds since 1970-01-01T00:00:00": units of the time variable.
+                          datetime times passed to append() are converted to these units.
+
+        :param calendar="standard": calendar of the time variable
+
+        :param encoding=None: storage options -- see UGrid.save_as_netcdf.
+                              The time-varying variables are chunked by
+                              one time step by default.
+
+        :param buffer_steps=10: number of time steps to hold in memory
+                                before writing them to the file
+        """
+        if buffer_steps < 1:
+            raise ValueError("buffer_steps must be at least one")
+        self.filepath = filepath
+        self.grid = grid
+        self.time_units = time_units
+        self.calendar = calendar
+        self.buffer_steps = buffer_steps
+
+        self.shapes = {}
+        self.dtypes = {}
+        num_layers = None
+        for ds in variables:
+            num = location_size(grid, ds.location)
+            data = ds.data
+            if data.size == 0:
+                shape = (num,)
+                dtype = np.float64
+            else:
+                shape = data.shape
+                dtype = data.dtype
+                if len(shape) not in (1, 2) or shape[-1] != num:
+                    raise ValueError("%s should be shaped (%i,) or (num_layers, %i), not %s" %
+                                     (ds.name, num, num, shape))
+                if len(shape) == 2:
+                    if num_layers is not None and shape[0] != num_layers:
+                        raise ValueError("all layered variables need the same number of layers")
+                    num_layers = shape[0]
+            self.shapes[ds.name] = shape
+            self.dtypes[ds.name] = dtype
+        self.num_layers = num_layers
+
+        self.num_written = 0
+        self._times = np.empty((buffer_steps,), dtype=np.float64)
+        self._buffers = dict((name, np.empty((buffer_steps,) + shape, dtype=self.dtypes[name]))
+                             for name, shape in self.shapes.items())
+        self._num_buffered = 0
+
+        with NETCDF_LOCK:
+            self.nc = netCDF4.Dataset(filepath, mode="w", clobber=True)
+            try:
+                self._create(variables, encoding)
+            except:
+                self.nc.close()
+                raise
+            self._fill_values = dict((name, fill_value(self.nc.variables[name]))
+                                     for name in self.shapes)
+
+    def _create(self, variables, encoding):
+        nc = self.nc
+        grid = self.grid
+        write_mesh(nc, grid, encoding)
+        for dataset in grid.data.values():
+            if getattr(dataset, 'time', None) is None:
+                write_data_set(nc, grid, dataset, encoding)
+
+        nc.createDimension('time', None)
+        time = nc.createVariable('time', np.float64, ('time',))
+        time.standard_name = "time"
+        time.long_name = "time"
+        time.units = self.time_units
+        time.calendar = self.calendar
+
+        layer_dim = grid.mesh_name + '_num_layer'
+        if self.num_layers is not None:
+            nc.createDimension(layer_dim, self.num_layers)
+        for ds in variables:
+            dims = ('time',) if len(self.shapes[ds.name]) == 1 else ('time', layer_dim)
+            create_data_var(nc, grid, ds.name, ds.location, self.dtypes[ds.name], dims,
+                            attributes=ds.attributes, encoding=encoding)
+        nc.sync()
+
+    @property
+    def num_times(self):
+        """
+        number of time steps appended so far -- written or buffered
+        """
+        return self.num_written + self._num_buffered
+
+    def append(self, t, datasets):
+        """
+        append one time step
+
+        :param t: the time -- a number in time_units, or a datetime
+
+        :param datasets: the data for every variable at this time
+        :type datasets: dict of name: array, or sequence of DataSet objects
+        """
+        if self.nc is None:
+            raise ValueError("%s is closed" % self.filepath)
+        if isinstance(datasets, dict):
+            records = datasets
+        else:
+            records = dict((ds.name, ds) for ds in datasets)
+        missing = set(self.shapes) - set(records)
+        if missing:
+            raise ValueError("no data given for: %s" % ", ".join(sorted(missing)))
+        extra = set(records) - set(self.shapes)
+        if extra:
+            raise ValueError("not variables in %s: %s" % (self.filepath, ", ".join(sorted(extra))))
+
+        if isinstance(t, datetime.datetime):
+            t = netCDF4.date2num(t, self.time_units, self.calendar)
+
+        ## check everything before touching the buffers
+        arrays = {}
+        for name, data in records.items():
+            ## missing values -- of a masked array, or flagged by a DataSet's
+            ## validity mask -- are written as the fill value
+            if hasattr(data, 'filled'):
+                data = data.filled(self._fill_values[name])
+            data = np.asarray(data)
+            if data.shape != self.shapes[name]:
+                raise ValueError("%s should have shape %s, not %s" %
+                                 (name, self.shapes[name], data.shape))
+            arrays[name] = data
+
+        i = self._num_buffered
+        self._times[i] = t
+        for name, data in arrays.items():
+            self._buffers[name][i] = data
+        self._num_buffered += 1
+        if self._num_buffered == self.buffer_steps:
+            self.flush()
+
+    def flush(self):
+        """
+        write the buffered time steps to the file
+        """
+        num = self._num_buffered
+        if num == 0 or self.nc is None:
+            return
+        start, stop = self.num_written, self.num_written + num
+        with NETCDF_LOCK:
+            self.nc.variables['time'][start:stop] = self._times[:num]
+            for name, buf in self._buffers.items():
+                self.nc.variables[name][start:stop] = buf[:num]
+            self.nc.sync()
+        self.num_written = stop
+        self._num_buffered = 0
+
+    def close(self):
+        """
+        write anything buffered, and close the file
+        """
+        if self.nc is None:
+            return
+        try:
+            self.flush()
+        finally:
+            with NETCDF_LOCK:
+                self.nc.close()
+            self.nc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
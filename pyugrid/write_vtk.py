@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+
+"""
+code to write grids as VTK unstructured grid (.vtu) files, for
+visualization in ParaView, VisIt, etc.
+
+The files use "appended" raw binary data: an XML header, followed by
+the arrays written straight from the grid's numpy arrays -- there is no
+per-element python code, so it is fast for big grids.
+
+A time series is a ParaView data collection (.pvd) of .vtu files, one per
+time step, which PVDWriter writes a step at a time.
+
+This code is called by the UGrid class (UGrid.save_as_vtu)
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+
+from .data_set import DataSet
+
+# VTK cell types, by number of vertices
+VTK_TRIANGLE = 5
+VTK_QUAD = 9
+VTK_POLYGON = 7
+
+_VTK_KINDS = {'f': 'Float', 'i': 'Int', 'u': 'UInt'}
+
+
+def _vtk_array(array):
+    """
+    returns (little-endian, C-contiguous array, VTK type name) for an array
+
+    only copies if it has to
+    """
+    array = np.asarray(array)
+    if array.dtype.kind == 'b':
+        array = array.astype(np.uint8)
+    if array.dtype.kind not in _VTK_KINDS:
+        raise ValueError("Can't write %s arrays to a VTK file" % array.dtype)
+    array = np.ascontiguousarray(array, dtype=array.dtype.newbyteorder('<'))
+    return array, "%s%i" % (_VTK_KINDS[array.dtype.kind], array.dtype.itemsize * 8)
+
+
+def _cells(grid):
+    """
+    the VTK connectivity, offsets and types arrays for the grid's faces
+
+    faces with fewer vertices than the others are padded with -1
+    (as in mixed triangle / quad meshes) -- those entries are dropped.
+    """
+    faces = grid.faces
+    if faces is None or len(faces) == 0:
+        empty = np.zeros((0,), dtype=np.int64)
+        return empty, empty, np.zeros((0,), dtype=np.uint8)
+    valid = faces >= 0
+    if valid.all():
+        connectivity = faces.ravel()
+        counts = np.full((len(faces),), faces.shape[1], dtype=np.int64)
+    else:
+        connectivity = faces[valid]
+        counts = valid.sum(axis=1)
+    offsets = np.cumsum(counts, dtype=np.int64)
+    types = np.full((len(faces),), VTK_POLYGON, dtype=np.uint8)
+    types[counts == 3] = VTK_TRIANGLE
+    types[counts == 4] = VTK_QUAD
+    return connectivity, offsets, types
+
+
+def _select_data(grid, datasets, time_index):
+    """
+    the (name, location, array) of each dataset to write
+
+    :param datasets: names of datasets on the grid, or DataSet objects.
+                     None for all the node and face data.
+
+    :param time_index: which time to write, for time-varying data
+    """
+    if datasets is None:
+        datasets = [ds for ds in grid.data.values()
+                    if ds.location in ('node', 'face') and
+                    (ds.time is None or time_index is not None)]
+    selected = []
+    for ds in datasets:
+        if not isinstance(ds, DataSet):
+            try:
+                ds = grid.data[ds]
+            except KeyError:
+                raise ValueError("There is no DataSet named %s on the grid" % ds)
+        if ds.location not in ('node', 'face'):
+            raise ValueError("Only node and face data can be written to a VTK file, "
+                             "not %s data (%s)" % (ds.location, ds.name))
+        index = None
+        if ds.time is not None:
+            if time_index is None:
+                raise ValueError("%s varies in time -- pass a time_index" % ds.name)
+            index = time_index
+        # missing (e.g. dry) values are written as NaN
+        data = ds.filled(np.nan, index=index)
+        num = len(grid.nodes) if ds.location == 'node' else len(grid.faces)
+        if data.shape[-1] != num:
+            raise ValueError("%s has %i values, but there are %i %ss" %
+                             (ds.name, data.shape[-1], num, ds.location))
+        if data.ndim > 2:
+            raise ValueError("%s has too many dimensions to write to a VTK file" % ds.name)
+        # (layer, location) data are written as a multi-component array
+        selected.append((ds.name, ds.location, data.T))
+    return selected
+
+
+def write_vtu(grid, filepath, datasets=None, time_index=None):
+    """
+    write a grid, and its data, to a binary VTK unstructured grid file
+
+    :param grid: the grid to write
+    :type grid: UGrid object.
+
+    :param filepath: path to the .vtu file to write. An existing one is clobbered.
+
+    :param datasets=None: the data to write: names of DataSets on the grid, or
+                          DataSet objects. Node data become point data, and
+                          face data cell data. None writes all the node and
+                          face data (that doesn't vary in time, unless
+                          time_index is given).
+
+    :param time_index=None: the index of the time to write from the
+                            time-varying data.
+
+    The nodes are written as points with z = 0. (layer, location) data
+    are written as arrays with one component per layer.
+    """
+    data = _select_data(grid, datasets, time_index)
+
+    points = np.zeros((len(grid.nodes), 3), dtype=grid.nodes.dtype)
+    points[:, :2] = grid.nodes
+    connectivity, offsets, types = _cells(grid)
+
+    ## the arrays, in the order they go in the appended data
+    sections = {'PointData': [], 'CellData': [], 'Points': [], 'Cells': []}
+    arrays = []
+    for name, location, array in data:
+        section = 'PointData' if location == 'node' else 'CellData'
+        sections[section].append((name, array))
+    sections['Points'].append(('Points', points))
+    sections['Cells'].extend([('connectivity', connectivity),
+                              ('offsets', offsets),
+                              ('types', types)])
+
+    header = ['<?xml version="1.0"?>',
+              '<VTKFile type="UnstructuredGrid" version="1.0" '
+              'byte_order="LittleEndian" header_type="UInt64">',
+              '  <UnstructuredGrid>',
+              '    <Piece NumberOfPoints="%i" NumberOfCells="%i">' % (len(points), len(types)),
+              ]
+    offset = 0
+    for section in ('PointData', 'CellData', 'Points', 'Cells'):
+        header.append('      <%s>' % section)
+        for name, array in sections[section]:
+            array, vtk_type = _vtk_array(array)
+            components = 1 if array.ndim == 1 else array.shape[1]
+            header.append('        <DataArray type="%s" Name=%s NumberOfComponents="%i" '
+                          'format="appended" offset="%i"/>' %
+                          (vtk_type, quoteattr(name), components, offset))
+            arrays.append(array)
+            offset += 8 + array.nbytes
+        header.append('      </%s>' % section)
+    header.extend(['    </Piece>',
+                   '  </UnstructuredGrid>',
+                   '  <AppendedData encoding="raw">',
+                   '   _'])
+
+    with open(filepath, 'wb') as outfile:
+        outfile.write('\n'.join(header).encode('utf-8'))
+        for array in arrays:
+            outfile.write(np.array(array.nbytes, dtype='<u8').tobytes())
+            outfile.write(array.data)
+        outfile.write(b'\n  </AppendedData>\n</VTKFile>\n')
+
+
+class PVDWriter(object):
+    """
+    Writes a time series of a grid as a ParaView data collection:
+    a .pvd file that lists a .vtu file for each time step.
+
+    The .vtu files are written next to the .pvd file, and the .pvd file
+    is rewritten after every step, so it can be opened while the
+    series is still being written.
+    """
+
+    def __init__(self, filepath, grid, datasets=None):
+        """
+        :param filepath: path to the .pvd file
+
+        :param grid: the grid to write
+        :type grid: UGrid object.
+
+        :param datasets=None: the data to write at each step -- see write_vtu().
+                              Can be overridden for each step.
+        """
+        self.filepath = filepath
+        self.grid = grid
+        self.datasets = datasets
+        self.steps = [] # (time, .vtu filename) for each step written
+        dirname, basename = os.path.split(filepath)
+        self._dirname = dirname
+        self._prefix = os.path.splitext(basename)[0]
+        self._write_collection()
+
+    def append(self, t, datasets=None, time_index=None):
+        """
+        write one time step
+
+        :param t: the time of the step (a number)
+
+        :param datasets=None: the data to write: DataSet objects holding the
+                              data for this step, or names of DataSets on
+                              the grid. Defaults to the datasets the writer
+                              was created with.
+
+        :param time_index=None: the index of the step in the grid's
+                                time-varying data, if it is written from there.
+
+        returns the path of the .vtu file written
+        """
+        filename = "%s_%06i.vtu" % (self._prefix, len(self.steps))
+        vtu_path = os.path.join(self._dirname, filename)
+        write_vtu(self.grid, vtu_path,
+                  self.datasets if datasets is None else datasets, time_index)
+        self.steps.append((float(t), filename))
+        self._write_collection()
+        return vtu_path
+
+    def _write_collection(self):
+        lines = ['<?xml version="1.0"?>',
+                 '<VTKFile type="Collection" version="0.1" byte_order="LittleEndian">',
+                 '  <Collection>']
+        for t, filename in self.steps:
+            lines.append('    <DataSet timestep="%r" group="" part="0" file=%s/>' %
+                         (t, quoteattr(filename)))
+        lines.extend(['  </Collection>',
+                      '</VTKFile>',
+                      ''])
+        with open(self.filepath, 'w') as outfile:
+            outfile.write('\n'.join(lines))
+
+    def close(self):
+        # the collection is always up to date -- nothing to do
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
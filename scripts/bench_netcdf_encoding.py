@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""
+bench_netcdf_encoding.py:
+
+Benchmarks UGrid.save_as_netcdf with various compression and chunking
+settings: reports write time, read time and file size for each.
+
+usage: bench_netcdf_encoding.py [num_nodes_per_side] [output_dir]
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import sys
+import time
+import tempfile
+
+import numpy as np
+
+from pyugrid import UGrid, DataSet
+
+
+## the settings to compare -- passed as the encoding to save_as_netcdf
+settings = [('uncompressed', None),
+            ('zlib 1', {'node': {'zlib': True, 'complevel': 1},
+                        'face': {'zlib': True, 'complevel': 1}}),
+            ('zlib 4', {'node': {'zlib': True, 'complevel': 4},
+                        'face': {'zlib': True, 'complevel': 4}}),
+            ('zlib 4, no shuffle', {'node': {'zlib': True, 'complevel': 4, 'shuffle': False},
+                                    'face': {'zlib': True, 'complevel': 4, 'shuffle': False}}),
+            ('zlib 4, 64k chunks', {'node': {'zlib': True, 'complevel': 4, 'chunksizes': (65536,)},
+                                    'face': {'zlib': True, 'complevel': 4, 'chunksizes': (65536,)}}),
+            ('zlib 4, 3 digits', {'node': {'zlib': True, 'complevel': 4},
+                                  'face': {'zlib': True, 'complevel': 4},
+                                  'depth': {'least_significant_digit': 3},
+                                  'u': {'least_significant_digit': 3},
+                                  'v': {'least_significant_digit': 3}}),
+            ]
+
+
+def make_grid(n):
+    """
+    a regular n X n grid of nodes, split into triangles,
+    with smooth-ish data on the nodes and faces
+    """
+    x, y = np.meshgrid(np.linspace(-70, -60, n), np.linspace(40, 50, n))
+    nodes = np.column_stack((x.ravel(), y.ravel()))
+
+    ind = np.arange(n * n).reshape(n, n)
+    ll, lr = ind[:-1, :-1].ravel(), ind[:-1, 1:].ravel()
+    ul, ur = ind[1:, :-1].ravel(), ind[1:, 1:].ravel()
+    faces = np.concatenate((np.column_stack((ll, lr, ul)),
+                            np.column_stack((lr, ur, ul))))
+
+    grid = UGrid(nodes, faces)
+    depth = 100 + 50 * np.sin(nodes[:, 0]) * np.cos(nodes[:, 1])
+    grid.add_data(DataSet('depth', location='node', data=depth,
+                          attributes={'units': 'm'}))
+    centers = nodes[faces].mean(axis=1)
+    grid.add_data(DataSet('u', location='face', data=np.sin(centers[:, 0] * 3),
+                          attributes={'units': 'm/s'}))
+    grid.add_data(DataSet('v', location='face', data=np.cos(centers[:, 1] * 3),
+                          attributes={'units': 'm/s'}))
+    return grid
+
+
+def bench(grid, filename, encoding):
+    start = time.time()
+    grid.save_as_netcdf(filename, encoding=encoding)
+    write_time = time.time() - start
+
+    start = time.time()
+    UGrid.from_ncfile(filename, load_data=True)
+    read_time = time.time() - start
+
+    return write_time, read_time, os.path.getsize(filename)
+
+
+def main(n=1000, output_dir=None):
+    if output_dir is None:
+        output_dir = tempfile.mkdtemp()
+    grid = make_grid(n)
+    print("grid with %i nodes and %i faces\n" % (len(grid.nodes), len(grid.faces)))
+    print("%-22s %10s %10s %12s" % ("setting", "write (s)", "read (s)", "size (MB)"))
+    for name, encoding in settings:
+        filename = os.path.join(output_dir, "bench_%s.nc" % name.replace(' ', '_').replace(',', ''))
+        write_time, read_time, size = bench(grid, filename, encoding)
+        print("%-22s %10.3f %10.3f %12.2f" % (name, write_time, read_time, size / 1e6))
+        os.remove(filename)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 1000,
+         args[1] if len(args) > 1 else None)
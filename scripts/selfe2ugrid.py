@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+"""
+selfe2ugrid.py:
+
+Converts the output of a SELFE run (data format v5 binary files:
+1_elev.61, 2_elev.61, ...) to a UGRID netcdf file, a time step at a time.
+
+usage: selfe2ugrid.py [options] output.nc variable [variable ...]
+
+e.g.: selfe2ugrid.py --datadir outputs --complevel 4 run.nc elev.61 salt.63 hvel.64
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import argparse
+import os
+import sys
+import time
+
+from pyugrid import selfe
+
+
+def count_files(datadir, variable, start):
+    """
+    the number of files in the series, counting up from start until one is missing
+    """
+    num = 0
+    while os.path.exists(os.path.join(datadir, "%i_%s" % (start + num, variable))):
+        num += 1
+    return num
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert SELFE binary output to UGRID netcdf")
+    parser.add_argument('output', help="the netcdf file to write")
+    parser.add_argument('variables', nargs='+',
+                        help="the variables to convert, with their extension: elev.61, salt.63, ...")
+    parser.add_argument('--datadir', default='.', help="the directory with the SELFE output")
+    parser.add_argument('--start', type=int, default=1, help="the number of the first file")
+    parser.add_argument('--files', type=int, default=None,
+                        help="the number of files (default: all those in datadir, from start)")
+    parser.add_argument('--complevel', type=int, default=None,
+                        help="compress the data with zlib at this level (1-9)")
+    parser.add_argument('--chunk-steps', type=int, default=None,
+                        help="chunk the data by this many time steps")
+    parser.add_argument('--time-units', default=None,
+                        help="units of the time variable (default: seconds since the start time in the files)")
+    parser.add_argument('--mesh-name', default='mesh', help="name of the mesh in the netcdf file")
+    args = parser.parse_args(argv)
+
+    num_files = args.files
+    if num_files is None:
+        num_files = count_files(args.datadir, args.variables[0], args.start)
+        if num_files == 0:
+            parser.error("there is no %i_%s in %s" % (args.start, args.variables[0], args.datadir))
+    filenames = dict((variable.split('.')[0],
+                      selfe.series_filenames(args.datadir, variable, num_files, args.start))
+                     for variable in args.variables)
+
+    start = time.time()
+    try:
+        num_steps = selfe.convert_to_netcdf(filenames, args.output,
+                                            mesh_name=args.mesh_name,
+                                            time_units=args.time_units,
+                                            complevel=args.complevel,
+                                            chunk_steps=args.chunk_steps)
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        return 1
+    print("wrote %i time steps from %i files to %s in %.1f seconds" %
+          (num_steps, num_files, args.output, time.time() - start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
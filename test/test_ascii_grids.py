@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+
+"""
+Tests for reading and writing gr3 / fort.14 and 2dm mesh files
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.test_examples import twenty_one_triangles
+
+hgrid = """hgrid.gr3 for a small test
+2 4
+1 0.0 0.0 10.5
+2 1.0 0.0 11.0
+3 1.0 1.0 12.0
+4 0.0 1.0 13.25
+1 3 1 2 3
+2 3 1 3 4
+1 = Number of open boundaries
+2 = Total number of open boundary nodes
+2 = Number of nodes for open boundary 1
+1
+2
+"""
+
+mixed = """mixed triangles and quads
+3 7
+1 0.0 0.0 1.0
+2 1.0 0.0 1.0
+3 2.0 0.0 1.0
+4 0.0 1.0 1.0
+5 1.0 1.0 1.0
+6 2.0 1.0 1.0
+7 1.0 2.0 1.0
+1 4 1 2 5 4
+2 3 2 3 6
+3 3 4 5 7
+"""
+
+mesh2dm = """MESH2D
+MESHNAME "test mesh"
+E4Q 2 1 2 5 4 3
+E3T 1 2 3 6 1
+ND 1 0.0 0.0 5.0
+ND 2 1.0 0.0 5.5
+ND 3 2.0 0.0 6.0
+ND 4 0.0 1.0 6.5
+ND 5 1.0 1.0 7.0
+ND 6 2.0 1.0 7.5
+NS 1 2 -3
+"""
+
+
+def write(tmpdir, name, contents):
+    filename = str(tmpdir.join(name))
+    with open(filename, 'w') as outfile:
+        outfile.write(contents)
+    return filename
+
+
+def test_read_gr3(tmpdir):
+    grid = UGrid.from_gr3(write(tmpdir, 'hgrid.gr3', hgrid))
+
+    assert np.array_equal(grid.nodes, [(0, 0), (1, 0), (1, 1), (0, 1)])
+    assert np.array_equal(grid.faces, [(0, 1, 2), (0, 2, 3)])
+    depth = grid.data['depth']
+    assert depth.location == 'node'
+    assert np.array_equal(depth.data, [10.5, 11.0, 12.0, 13.25])
+    assert depth.attributes['long_name'] == 'hgrid.gr3 for a small test'
+
+
+def test_read_mixed_gr3(tmpdir):
+    grid = UGrid.from_gr3(write(tmpdir, 'mixed.gr3', mixed))
+
+    assert np.array_equal(grid.faces, [(0, 1, 4, 3), (1, 2, 5, -1), (3, 4, 6, -1)])
+
+
+def test_read_dtypes(tmpdir):
+    grid = UGrid.from_gr3(write(tmpdir, 'hgrid.gr3', hgrid), data_name='drag',
+                          index_dtype=np.int64, node_dtype=np.float32)
+
+    assert grid.faces.dtype == np.int64
+    assert grid.nodes.dtype == np.float32
+    assert 'drag' in grid.data
+
+
+def test_bad_gr3(tmpdir):
+    with pytest.raises(ValueError):
+        UGrid.from_gr3(write(tmpdir, 'short.gr3', hgrid.split('1 3 1 2 3')[0]))
+
+
+@pytest.mark.parametrize('node_dtype', [np.float64, np.float32])
+def test_gr3_round_trip(tmpdir, node_dtype):
+    grid = twenty_one_triangles()
+    grid = UGrid(grid.nodes * np.pi, grid.faces, node_dtype=node_dtype)
+    grid.add_data(DataSet('depth', location='node', data=np.linspace(0, 1, 20) / 3))
+    filename = str(tmpdir.join('round_trip.14'))
+
+    grid.save_as_gr3(filename, title='a fort.14 file')
+    result = UGrid.from_gr3(filename, node_dtype=node_dtype)
+
+    assert np.array_equal(result.nodes, grid.nodes)
+    assert np.array_equal(result.faces, grid.faces)
+    assert np.array_equal(result.data['depth'].data, grid.data['depth'].data)
+    assert result.data['depth'].attributes['long_name'] == 'a fort.14 file'
+
+
+def test_mixed_gr3_round_trip(tmpdir):
+    grid = UGrid.from_gr3(write(tmpdir, 'mixed.gr3', mixed))
+    filename = str(tmpdir.join('mixed_out.gr3'))
+
+    grid.save_as_gr3(filename)
+
+    assert np.array_equal(UGrid.from_gr3(filename).faces, grid.faces)
+
+
+def test_read_2dm(tmpdir):
+    grid = UGrid.from_2dm(write(tmpdir, 'mesh.2dm', mesh2dm))
+
+    assert grid.mesh_name == 'test mesh'
+    assert len(grid.nodes) == 6
+    # in element id order, triangles padded
+    assert np.array_equal(grid.faces, [(1, 2, 5, -1), (0, 1, 4, 3)])
+    assert np.array_equal(grid.data['depth'].data, [5.0, 5.5, 6.0, 6.5, 7.0, 7.5])
+    assert np.array_equal(grid.data['material'].data, [1, 3])
+
+
+def test_2dm_node_ids(tmpdir):
+    """
+    nodes out of order, with gaps in the ids
+    """
+    contents = """MESH2D
+E3T 1 30 10 20 1
+ND 20 1.0 0.0 2.0
+ND 10 0.0 0.0 1.0
+ND 30 0.0 1.0 3.0
+"""
+    grid = UGrid.from_2dm(write(tmpdir, 'ids.2dm', contents))
+
+    assert np.array_equal(grid.nodes[grid.faces[0]], [(0, 1), (0, 0), (1, 0)])
+
+
+def test_2dm_round_trip(tmpdir):
+    grid = UGrid.from_2dm(write(tmpdir, 'mesh.2dm', mesh2dm))
+    filename = str(tmpdir.join('mesh_out.2dm'))
+
+    grid.save_as_2dm(filename)
+    result = UGrid.from_2dm(filename)
+
+    assert result.mesh_name == grid.mesh_name
+    assert np.array_equal(result.nodes, grid.nodes)
+    assert np.array_equal(result.faces, grid.faces)
+    assert np.array_equal(result.data['depth'].data, grid.data['depth'].data)
+    assert np.array_equal(result.data['material'].data, grid.data['material'].data)
+
+
+def test_not_2dm(tmpdir):
+    with pytest.raises(ValueError):
+        UGrid.from_2dm(write(tmpdir, 'hgrid.gr3', hgrid))
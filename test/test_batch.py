@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""
+Tests for exporting many grids at once on a process pool
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import numpy as np
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid import batch
+from pyugrid.test_examples import twenty_one_triangles, two_triangles
+
+
+def make_grid(i):
+    grid = twenty_one_triangles()
+    grid.build_face_coordinates()
+    grid.add_data(DataSet('depth', location='node', data=np.arange(20.0) + i,
+                          attributes={'units': 'm'}))
+    return grid
+
+
+@pytest.mark.parametrize('share', ['auto', 'memmap'])
+def test_export(tmpdir, share):
+    jobs = [(make_grid(i), str(tmpdir.join('grid_%i.nc' % i))) for i in range(4)]
+
+    results = batch.export(jobs, workers=2, share=share, spill_dir=str(tmpdir))
+
+    assert [result.filepath for result in results] == [filepath for grid, filepath in jobs]
+    assert all(result.ok for result in results)
+    for i, (grid, filepath) in enumerate(jobs):
+        saved = UGrid.from_ncfile(filepath, load_data=True)
+        assert np.array_equal(saved.faces, grid.faces)
+        assert np.array_equal(saved.face_coordinates, grid.face_coordinates)
+        assert np.array_equal(saved.data['depth'].data, np.arange(20.0) + i)
+        assert saved.data['depth'].attributes == {'units': 'm'}
+    # the spilled arrays are cleaned up
+    assert sorted(os.listdir(str(tmpdir))) == ['grid_%i.nc' % i for i in range(4)]
+
+
+@pytest.mark.parametrize('share', ['auto', 'memmap'])
+def test_export_masked(tmpdir, share):
+    grid = two_triangles()
+    grid.add_data(DataSet('depth', location='node', data=[1.0, 2.0, 3.0, 4.0],
+                          valid=[True, False, True, True]))
+    filepath = str(tmpdir.join('masked.nc'))
+
+    results = batch.export([(grid, filepath)], workers=1, share=share, spill_dir=str(tmpdir))
+
+    assert results[0].ok
+    saved = UGrid.from_ncfile(filepath, load_data=True)
+    assert np.array_equal(saved.data['depth'].valid_mask(), [True, False, True, True])
+
+
+def test_callable_jobs(tmpdir):
+    jobs = [(two_triangles, str(tmpdir.join('two.nc')), {'encoding': {'node': {'zlib': True}}}),
+            (twenty_one_triangles, str(tmpdir.join('twenty_one.nc')))]
+
+    results = batch.export(jobs, workers=2)
+
+    assert all(result.ok for result in results)
+    assert len(UGrid.from_ncfile(str(tmpdir.join('twenty_one.nc'))).faces) == 21
+
+
+@pytest.mark.parametrize('share', ['auto', 'memmap'])
+def test_failures_reported(tmpdir, share):
+    jobs = [(make_grid(0), str(tmpdir.join('good.nc'))),
+            (make_grid(1), str(tmpdir.join('no_such_dir', 'bad.nc'))),
+            (make_grid(2), str(tmpdir.join('also_good.nc'))),
+            ]
+
+    results = batch.export(jobs, workers=3, share=share)
+
+    assert [result.ok for result in results] == [True, False, True]
+    assert 'bad.nc' in results[1].error
+    assert os.path.exists(str(tmpdir.join('also_good.nc')))
+
+
+def test_bad_job():
+    with pytest.raises(ValueError):
+        batch.export([("not a grid", "file.nc")])
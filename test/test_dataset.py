@@ -53,6 +53,64 @@ def test_str():
     print(str(d))
     assert str(d) == "DataSet object: depth, on the nodes, and 4 data points\nAttributes: {}"
 
+def test_slots():
+    d = DataSet('depth', location='node', data=[1.0, 2.0, 3.0, 4.0])
+
+    assert not hasattr(d, '__dict__')
+    with pytest.raises(AttributeError):
+        d.not_a_field = 1
+
+def test_array_not_copied():
+    data = np.arange(4.0)
+    d = DataSet('depth', location='node', data=data)
+
+    assert d.data is data
+    view = data[1:]
+    d.data = view
+    assert d.data is view
+
+def test_from_block():
+    block = np.arange(12.0).reshape(3, 4)
+    data_sets = DataSet.from_block(['a', 'b', 'c'], block, location='face',
+                                   attributes=[{'units': 'm'}, None, {}])
+
+    assert [d.name for d in data_sets] == ['a', 'b', 'c']
+    assert all(d.location == 'face' for d in data_sets)
+    assert data_sets[0].attributes == {'units': 'm'}
+    assert data_sets[1].attributes == {}
+    for i, d in enumerate(data_sets):
+        assert np.shares_memory(d.data, block)
+        assert np.array_equal(d.data, block[i])
+
+    ## changes to the block show up in the DataSets
+    block[1, 2] = -1
+    assert data_sets[1].data[2] == -1
+
+def test_from_block_time():
+    block = np.zeros((2, 5, 4), dtype=np.float32)
+    data_sets = DataSet.from_block(['u', 'v'], block, time=np.arange(5))
+
+    assert data_sets[0].data.shape == (5, 4)
+    assert data_sets[0].time is data_sets[1].time
+
+def test_from_block_valid():
+    block = np.arange(12.0).reshape(3, 4)
+    valid = np.ones((3, 4), dtype=bool)
+    valid[1, 2] = False
+    data_sets = DataSet.from_block(['a', 'b', 'c'], block, valid=valid)
+
+    assert data_sets[0].valid_bits is None
+    assert np.array_equal(data_sets[1].valid_mask(), [True, True, False, True])
+    assert np.isnan(data_sets[1].filled()[2])
+
+def test_from_block_errors():
+    with pytest.raises(ValueError):
+        DataSet.from_block(['a', 'b'], np.zeros(4))
+    with pytest.raises(ValueError):
+        DataSet.from_block(['a', 'b'], np.zeros((3, 4)))
+    with pytest.raises(ValueError):
+        DataSet.from_block(['a', 'b'], np.zeros((2, 4)), attributes=[{}])
+
 def add_attributes():
     d = DataSet('depth', location='node', data=[1.0, 2.0, 3.0, 4.0])
 
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+
+"""
+Tests for grids with index and coordinate dtypes other than the defaults
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import numpy as np
+import netCDF4
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.test_examples import twenty_one_triangles
+
+from .utilities import chdir
+
+files = os.path.join(os.path.split(__file__)[0], 'files')
+file11 = 'ElevenPoints_UGRIDv0.9.nc'
+
+
+def small_grid(**kwargs):
+    full = twenty_one_triangles()
+    grid = UGrid(full.nodes, full.faces, full.edges, full.boundaries, **kwargs)
+    grid.build_face_face_connectivity()
+    return grid
+
+
+def test_defaults():
+    grid = small_grid()
+
+    assert grid.faces.dtype == np.int32
+    assert grid.face_face_connectivity.dtype == np.int32
+    assert grid.nodes.dtype == np.float64
+
+
+@pytest.mark.parametrize(('index_dtype', 'flag_dtype'), [(np.int64, np.int64),
+                                                          (np.int16, np.int16),
+                                                          (np.uint16, np.int32),
+                                                          (np.uint32, np.int64),
+                                                          ])
+def test_index_dtype(index_dtype, flag_dtype):
+    grid = small_grid(index_dtype=index_dtype, node_dtype=np.float32)
+
+    assert grid.faces.dtype == index_dtype
+    assert grid.edges.dtype == index_dtype
+    assert grid.boundaries.dtype == index_dtype
+    assert grid.flag_dtype == flag_dtype
+    assert grid.face_face_connectivity.dtype == flag_dtype
+    assert grid.face_face_connectivity.min() == -1
+    assert grid.nodes.dtype == np.float32
+
+
+def test_no_copy():
+    faces = twenty_one_triangles().faces.astype(np.uint16)
+    grid = UGrid(twenty_one_triangles().nodes, index_dtype=np.uint16)
+
+    grid.faces = faces
+
+    assert grid.faces is faces
+
+
+def test_out_of_range():
+    grid = UGrid(index_dtype=np.uint16)
+
+    with pytest.raises(ValueError):
+        grid.faces = [[0, 1, 70000]]
+    with pytest.raises(ValueError):
+        grid.faces = [[0, 1, -1]]
+
+
+def test_bad_dtypes():
+    with pytest.raises(ValueError):
+        UGrid(index_dtype=np.float32)
+    with pytest.raises(ValueError):
+        UGrid(node_dtype=np.int32)
+
+
+def test_save_and_read(tmpdir):
+    grid = small_grid(index_dtype=np.uint16, node_dtype=np.float32)
+    grid.add_data(DataSet('depth', location='node', data=np.arange(20.0)))
+    filename = str(tmpdir.join('small.nc'))
+
+    grid.save_as_netcdf(filename)
+
+    with netCDF4.Dataset(filename) as nc:
+        assert nc.variables['mesh_face_nodes'].dtype == np.uint16
+        assert nc.variables['mesh_face_links'].dtype == np.int32
+        assert nc.variables['mesh_node_lon'].dtype == np.float32
+
+    result = UGrid.from_ncfile(filename, load_data=True,
+                               index_dtype=np.uint16, node_dtype=np.float32)
+    assert result.faces.dtype == np.uint16
+    assert result.face_face_connectivity.dtype == np.int32
+    assert result.nodes.dtype == np.float32
+    assert np.array_equal(result.faces, grid.faces)
+    assert np.array_equal(result.face_face_connectivity, grid.face_face_connectivity)
+    assert np.array_equal(result.nodes, grid.nodes)
+
+    # and the default dtypes from the same file
+    result = UGrid.from_ncfile(filename)
+    assert result.faces.dtype == np.int32
+    assert np.array_equal(result.faces, grid.faces)
+
+
+def test_read_bbox(tmpdir):
+    grid = small_grid()
+    filename = str(tmpdir.join('small.nc'))
+    grid.save_as_netcdf(filename)
+
+    result = UGrid.from_ncfile(filename, bbox=(4.0, 6.0, 8.0, 10.0), index_dtype=np.uint16)
+
+    assert result.faces.dtype == np.uint16
+    assert result.face_face_connectivity.dtype == np.int32
+
+
+def test_read_flagged_unsigned():
+    """
+    the sample file has flags in its face_face_connectivity, which
+    go into the signed flag_dtype
+    """
+    with chdir(files):
+        grid = UGrid.from_ncfile(file11, index_dtype=np.uint32)
+
+    assert grid.faces.dtype == np.uint32
+    assert grid.face_face_connectivity.dtype == np.int64
+    assert grid.face_face_connectivity.min() == -1
+
+
+def test_read_too_small(tmpdir):
+    grid = small_grid()
+    filename = str(tmpdir.join('small.nc'))
+    grid.save_as_netcdf(filename)
+    with netCDF4.Dataset(filename, 'a') as nc:
+        nc.variables['mesh_face_nodes'][0] = [0, 1, 300]
+
+    with pytest.raises(ValueError):
+        UGrid.from_ncfile(filename, index_dtype=np.uint8)
+
+
+def test_native_keeps_dtypes(tmpdir):
+    grid = small_grid(index_dtype=np.uint16, node_dtype=np.float32)
+    dirname = str(tmpdir.join('grid'))
+
+    grid.save_native(dirname)
+    result = UGrid.from_native(dirname)
+
+    assert result.index_dtype == np.uint16
+    assert result.node_dtype == np.float32
+    assert not result.faces.flags.owndata
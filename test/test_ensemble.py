@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+
+"""
+Tests for the Ensemble class: many members on one shared mesh
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import numpy as np
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.ensemble import Ensemble
+from pyugrid.test_examples import twenty_one_triangles
+
+
+def make_members(num_members=5, seed=2, with_time=True):
+    rng = np.random.RandomState(seed)
+    grids = []
+    for i in range(num_members):
+        grid = twenty_one_triangles()
+        grid.add_data(DataSet('depth', location='node',
+                              data=rng.normal(10, 2, len(grid.nodes)),
+                              attributes={'units': 'm',
+                                          'standard_name': 'sea_floor_depth_below_geoid'}))
+        if with_time:
+            grid.add_data(DataSet('speed', location='face',
+                                  data=rng.uniform(0, 2, (4, len(grid.faces))),
+                                  time=np.arange(4) * 3600.0))
+        grids.append(grid)
+    return grids
+
+
+def test_from_grids():
+    grids = make_members()
+    ensemble = Ensemble.from_grids(grids)
+
+    assert ensemble.members == [0, 1, 2, 3, 4]
+    assert sorted(ensemble.variables) == ['depth', 'speed']
+    assert ensemble['depth'].shape == (5, 20)
+    assert ensemble['speed'].shape == (5, 4, len(grids[0].faces))
+    for i, grid in enumerate(grids):
+        assert np.array_equal(ensemble['depth'][i], grid.data['depth'].data)
+
+
+def test_topology_shared_and_read_only():
+    grids = make_members(2)
+    ensemble = Ensemble.from_grids(grids)
+
+    assert np.shares_memory(ensemble.grid.nodes, grids[0].nodes)
+    assert np.shares_memory(ensemble.grid.faces, grids[0].faces)
+    with pytest.raises(ValueError):
+        ensemble.grid.nodes[0, 0] = 100.0
+
+    member = ensemble.member(1)
+    assert np.shares_memory(member.nodes, ensemble.grid.nodes)
+    assert np.shares_memory(member.data['depth'].data, ensemble['depth'])
+    assert np.array_equal(member.data['depth'].data, grids[1].data['depth'].data)
+    assert member.data['speed'].time is ensemble.variable('speed').time
+
+
+def test_mismatched_mesh():
+    grids = make_members(2)
+    grids[1].nodes = grids[1].nodes + 1.0
+
+    with pytest.raises(ValueError):
+        Ensemble.from_grids(grids)
+
+
+def test_statistics():
+    grids = make_members()
+    ensemble = Ensemble.from_grids(grids, members=['a', 'b', 'c', 'd', 'e'])
+    depths = np.array([grid.data['depth'].data for grid in grids])
+
+    stats = ensemble.statistics('depth', ('mean', 'spread', 'min', 'max'),
+                                thresholds=[10.0], ddof=1)
+
+    assert sorted(stats) == ['max', 'mean', 'min', 'prob_gt_10', 'spread']
+    assert np.allclose(stats['mean'].data, depths.mean(axis=0))
+    assert np.allclose(stats['spread'].data, depths.std(axis=0, ddof=1))
+    assert np.array_equal(stats['min'].data, depths.min(axis=0))
+    assert np.allclose(stats['prob_gt_10'].data, (depths > 10.0).mean(axis=0))
+
+    assert stats['mean'].name == 'depth_mean'
+    assert stats['mean'].location == 'node'
+    assert stats['mean'].attributes['units'] == 'm'
+    assert stats['mean'].attributes['cell_methods'] == 'realization: mean'
+    assert stats['prob_gt_10'].attributes['units'] == '1'
+
+
+def test_statistics_time():
+    grids = make_members()
+    ensemble = Ensemble.from_grids(grids)
+    speeds = np.array([grid.data['speed'].data for grid in grids])
+
+    assert np.allclose(ensemble.mean('speed'), speeds.mean(axis=0))
+    assert np.allclose(ensemble.spread('speed'), speeds.std(axis=0))
+    assert np.allclose(ensemble.exceedance('speed', 1.0), (speeds > 1.0).mean(axis=0))
+    stats = ensemble.statistics('speed')
+    assert np.array_equal(stats['mean'].time, grids[0].data['speed'].time)
+
+
+def test_statistics_nan():
+    grids = make_members(4)
+    ensemble = Ensemble.from_grids(grids)
+    ensemble['depth'][0, 3] = np.nan
+    ensemble['depth'][:, 5] = np.nan
+
+    stats = ensemble.statistics('depth', thresholds=[0.0])
+    assert np.isclose(stats['mean'].data[3], ensemble['depth'][1:, 3].mean())
+    assert stats['prob_gt_0'].data[3] == 1.0
+    assert np.isnan(stats['mean'].data[5])
+    assert np.isnan(stats['prob_gt_0'].data[5])
+
+
+def test_member_data():
+    ensemble = Ensemble.from_grids(make_members(3), members=['a', 'b', 'c'])
+    data_sets = ensemble.member_data('speed')
+
+    assert [ds.name for ds in data_sets] == ['speed_a', 'speed_b', 'speed_c']
+    assert all(np.shares_memory(ds.data, ensemble['speed']) for ds in data_sets)
+    assert data_sets[2].data.shape == (4, 20 + 1)
+
+    with pytest.raises(ValueError):
+        ensemble.member('z')
+
+
+def test_add_variable():
+    grid = twenty_one_triangles()
+    ensemble = Ensemble(grid, ['x', 'y'])
+    block = np.zeros((2, len(grid.nodes)), dtype=np.float32)
+    ensemble.add_variable('zeta', block)
+
+    assert ensemble['zeta'] is block
+    with pytest.raises(ValueError):
+        ensemble.add_variable('wrong', np.zeros((3, len(grid.nodes))))
+    with pytest.raises(ValueError):
+        ensemble.add_variable('wrong', np.zeros((2, 5)))
+    with pytest.raises(ValueError):
+        ensemble.add_variable('wrong', np.zeros((2, len(grid.nodes))), location='edge')
+
+
+def test_from_ncfiles(tmpdir):
+    ## save_as_netcdf doesn't write time series
+    grids = make_members(3, with_time=False)
+    filenames = []
+    for i, grid in enumerate(grids):
+        filename = os.path.join(str(tmpdir), 'member_%i.nc' % i)
+        grid.save_as_netcdf(filename)
+        filenames.append(filename)
+
+    ensemble = Ensemble.from_ncfiles(filenames, members=['a', 'b', 'c'])
+
+    assert ensemble.variables == ['depth']
+    assert np.array_equal(ensemble.grid.nodes, grids[0].nodes)
+    for i, grid in enumerate(grids):
+        assert np.array_equal(ensemble['depth'][i], grid.data['depth'].data)
+    assert ensemble.variable('depth').attributes['units'] == 'm'
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+
+"""
+Tests for the lazy arithmetic on DataSets and UCubes
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import numpy as np
+import pytest
+import netCDF4
+
+from pyugrid import expressions
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.ucube import UCube
+from pyugrid.lazy_array import LazyArray
+from pyugrid.expressions import Expr
+from pyugrid.test_examples import twenty_one_triangles
+
+
+class CountingArray(LazyArray):
+    """
+    a LazyArray that keeps track of how much of it has been read
+    """
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.num_read = 0
+
+    def __getitem__(self, key):
+        data = self.array[key]
+        self.num_read += data.size
+        return data
+
+
+def make_uv(num_times=30, lazy=False):
+    grid = twenty_one_triangles()
+    rng = np.random.RandomState(3)
+    time = np.arange(num_times) * 600.0
+    u = rng.normal(0, 1, (num_times, len(grid.nodes))).astype(np.float32)
+    v = rng.normal(0, 1, (num_times, len(grid.nodes))).astype(np.float32)
+    if lazy:
+        u, v = CountingArray(u), CountingArray(v)
+    grid.add_data(DataSet('u', data=u, time=time, attributes={'units': 'm/s'}))
+    grid.add_data(DataSet('v', data=v, time=time, attributes={'units': 'm/s'}))
+    grid.add_data(DataSet('depth', data=np.linspace(1, 20, len(grid.nodes))))
+    return grid
+
+
+def test_lazy():
+    grid = make_uv(lazy=True)
+    u, v = grid.data['u'], grid.data['v']
+
+    speed = np.sqrt(u ** 2 + v ** 2)
+
+    assert isinstance(speed, Expr)
+    assert speed.shape == (30, 20)
+    assert speed.dtype == np.float32
+    assert speed.location == 'node'
+    assert speed.time is u.time
+    ## nothing read yet
+    assert u.data.num_read == 0
+
+    part = speed[5:7, 3]
+    assert np.allclose(part, np.hypot(u.data.array[5:7, 3], v.data.array[5:7, 3]))
+    ## just the part that was asked for -- u is read once, though used twice
+    assert u.data.num_read == 2
+
+
+def test_operators():
+    grid = make_uv()
+    u, v = grid.data['u'], grid.data['v']
+    a, b = u.data.astype(np.float64), v.data.astype(np.float64)
+
+    assert np.allclose((u - v)[:], a - b)
+    assert np.allclose((2.0 * u / (1 + abs(v)))[:], 2 * a / (1 + np.abs(b)))
+    assert np.allclose((-u % 0.5)[:], (-a) % 0.5)
+    assert np.allclose(np.arctan2(v, u)[:], np.arctan2(b, a))
+    assert np.allclose(np.maximum(u, 0)[:], np.maximum(a, 0))
+    ## numpy arrays on the left
+    assert np.allclose((b + u)[:], a + b)
+    ## reductions aren't lazy
+    assert np.isclose(np.add.reduce(u, axis=None), a.sum(), rtol=1e-5)
+
+
+def test_broadcast():
+    grid = make_uv()
+    depth, u = grid.data['depth'], grid.data['u']
+
+    total = depth + u
+    assert total.shape == (30, 20)
+    assert np.allclose(total[:], depth.data + u.data)
+    assert np.allclose(total[4], depth.data + u.data[4])
+    assert np.allclose(total[[1, 5], 2:4], depth.data[2:4] + u.data[[1, 5], 2:4])
+
+    column = np.arange(30.0).reshape(30, 1)
+    assert np.allclose((u * column)[3:9:2, 7], u.data[3:9:2, 7] * column[3:9:2, 0])
+
+    with pytest.raises(ValueError):
+        u + np.ones(7)
+
+
+def test_location_mismatch():
+    grid = make_uv()
+    on_faces = DataSet('f', location='face', data=np.ones(len(grid.faces)))
+
+    with pytest.raises(ValueError):
+        grid.data['u'] + on_faces
+
+
+def test_str():
+    grid = make_uv()
+    speed = np.sqrt(grid.data['u'] ** 2 + grid.data['v'] ** 2)
+
+    assert str(speed) == "sqrt(((u ** 2) + (v ** 2)))"
+
+
+def test_evaluate_chunked():
+    grid = make_uv(num_times=25)
+    u = grid.data['u']
+    expr = u * 3 + 1
+
+    out = np.zeros((25, 20), dtype=np.float32)
+    result = expr.evaluate(out=out, chunk=4)
+    assert result is out
+    assert np.allclose(out, u.data * 3 + 1)
+
+    blocks = [(start, stop) for start, stop, block in expr.iter_blocks(chunk=10)]
+    assert blocks == [(0, 10), (10, 20), (20, 25)]
+
+    with pytest.raises(ValueError):
+        expr.evaluate(out=np.zeros((3, 20)))
+
+
+def test_to_dataset():
+    grid = make_uv()
+    speed = np.sqrt(grid.data['u'] ** 2 + grid.data['v'] ** 2)
+
+    ds = speed.to_dataset('speed', attributes={'units': 'm/s'}, chunk=7)
+    assert ds.name == 'speed'
+    assert ds.location == 'node'
+    assert np.array_equal(ds.time, grid.data['u'].time)
+    assert np.allclose(ds.data, np.hypot(grid.data['u'].data, grid.data['v'].data))
+    grid.add_data(ds)
+
+    with pytest.raises(ValueError):
+        speed.to_dataset()
+    ## one named operand -- its name
+    assert (grid.data['u'] * 2).to_dataset().name == 'u'
+
+
+def test_lazy_dataset_reduction():
+    grid = make_uv()
+    speed = np.sqrt(grid.data['u'] ** 2 + grid.data['v'] ** 2)
+    ds = DataSet('speed', data=speed, time=speed.time)
+
+    assert ds.data is speed
+    results = ds.reduce_time(['mean', 'max'], chunk=8)
+    expected = np.hypot(grid.data['u'].data, grid.data['v'].data)
+    assert np.allclose(results['mean'].data, expected.mean(axis=0))
+    assert np.allclose(results['max'].data, expected.max(axis=0))
+
+
+def test_ucube():
+    grid = make_uv()
+    u = UCube.from_dataset(grid, 'u')
+    v = UCube.from_dataset(grid, 'v')
+
+    speed = np.sqrt(u * u + v * v)
+    assert speed.location == 'node'
+    assert np.array_equal(speed.time, u.time)
+    assert np.allclose(speed[2:4], np.hypot(u[2:4], v[2:4]))
+
+    subset = u.isel(time=slice(10, 20)) - grid.data['depth']
+    assert subset.shape == (10, 20)
+    assert np.allclose(subset[:], grid.data['u'].data[10:20] - grid.data['depth'].data)
+
+
+def test_to_netcdf(tmpdir):
+    grid = make_uv()
+    speed = np.sqrt(grid.data['u'] ** 2 + grid.data['v'] ** 2)
+    filename = os.path.join(str(tmpdir), 'speed.nc')
+
+    ## save_as_netcdf doesn't write time series -- just the depth
+    mesh = twenty_one_triangles()
+    mesh.add_data(grid.data['depth'])
+    num = speed.to_netcdf(filename, mesh, 'speed', attributes={'units': 'm/s'}, chunk=8)
+
+    assert num == 30
+    with netCDF4.Dataset(filename) as nc:
+        assert np.allclose(nc.variables['speed'][:],
+                           np.hypot(grid.data['u'].data, grid.data['v'].data))
+        assert np.array_equal(nc.variables['time'][:], grid.data['u'].time)
+        assert nc.variables['speed'].units == 'm/s'
+
+    with pytest.raises(ValueError):
+        (grid.data['depth'] * 2).to_netcdf(filename, mesh, 'twice')
+
+
+def test_numpy_reuses_temporaries():
+    a = np.arange(10.0)
+    expr = (Expr(None, (a,)) + 1) * 2 - 3
+    values = dict((leaf_id, a) for leaf_id in expr._leaves())
+    result, temporary = expr._numpy(values)
+    assert temporary
+    assert np.allclose(result, (a + 1) * 2 - 3)
+    ## the leaf isn't written over
+    assert np.array_equal(a, np.arange(10.0))
+
+
+def test_numexpr_matches_numpy():
+    pytest.importorskip('numexpr')
+    grid = make_uv()
+    speed = np.sqrt(grid.data['u'] ** 2 + grid.data['v'] ** 2) * 0.5
+    assert speed._can_numexpr()
+    values = dict((leaf_id, leaf.args[0]) for leaf_id, leaf in speed._leaves().items())
+    assert np.allclose(speed[:], speed._numpy(values)[0], rtol=1e-6)
@@ -12,6 +12,7 @@ designed to be run with pytest
 from __future__ import (absolute_import, division, print_function)
 
 import numpy as np
+import pytest
 
 from pyugrid.ugrid import UGrid, DataSet
 from pyugrid.test_examples import *
@@ -160,6 +161,89 @@ def test_two_triangles_without_edges():
     assert depths.data[0] == 1
     assert depths.attributes['units'] == "unknown"
 
+def grid_with_fields():
+    grid = two_triangles_with_depths()
+    for name, location, standard_name, units in [
+            ('temp', 'node', 'sea_water_temperature', 'degC'),
+            ('temp_face', 'face', 'sea_water_temperature', 'degC'),
+            ('salt', 'node', 'sea_water_salinity', '1e-3'),
+            ]:
+        num = 4 if location == 'node' else 2
+        grid.add_data(DataSet(name, location=location, data=np.zeros(num),
+                              attributes={'standard_name': standard_name,
+                                          'units': units}))
+    return grid
+
+def names(data_sets):
+    return sorted(ds.name for ds in data_sets)
+
+def test_find_with_location():
+    grid = grid_with_fields()
+
+    assert names(grid.find_data_sets('sea_water_temperature')) == ['temp', 'temp_face']
+    assert names(grid.find_data_sets('sea_water_temperature', location='face')) == ['temp_face']
+    assert grid.find_data_sets('sea_water_temperature', location='edge') == set()
+    assert grid.find_data_sets('not_there') == set()
+    assert isinstance(grid.find_data_sets('sea_water_temperature'), set)
+
+def test_query_compound():
+    grid = grid_with_fields()
+
+    assert names(grid.query_data(units='degC', location='node')) == ['temp']
+    assert names(grid.query_data(location='node')) == ['depth', 'salt', 'temp']
+    assert names(grid.query_data(name='salt', units='1e-3')) == ['salt']
+    assert grid.query_data(name='salt', units='degC') == frozenset()
+    ## no criteria -- everything
+    assert len(grid.query_data()) == 4
+
+    ## a single field is a cached frozenset -- nothing new is built
+    assert grid.query_data(units='degC') is grid.query_data(units='degC')
+
+def test_find_result_is_mutable():
+    grid = grid_with_fields()
+
+    found = grid.find_data_sets('sea_water_temperature')
+    found.pop()
+    ## the indexes aren't changed
+    assert names(grid.find_data_sets('sea_water_temperature')) == ['temp', 'temp_face']
+
+def test_query_after_add():
+    grid = grid_with_fields()
+    before = grid.query_data(units='degC')
+
+    grid.add_data(DataSet('temp_2', location='node', data=np.zeros(4),
+                          attributes={'units': 'degC'}))
+    assert names(before) == ['temp', 'temp_face']
+    assert names(grid.query_data(units='degC')) == ['temp', 'temp_2', 'temp_face']
+
+def test_query_bad_field():
+    grid = grid_with_fields()
+
+    with pytest.raises(ValueError):
+        grid.query_data(long_name='temperature')
+
+def test_replace_data_set():
+    grid = grid_with_fields()
+
+    grid.add_data(DataSet('temp', location='node', data=np.zeros(4),
+                          attributes={'standard_name': 'sea_water_potential_temperature'}))
+
+    assert names(grid.find_data_sets('sea_water_temperature')) == ['temp_face']
+    assert names(grid.find_data_sets('sea_water_potential_temperature')) == ['temp']
+    assert names(grid.query_data(units='degC')) == ['temp_face']
+
+def test_reindex():
+    grid = grid_with_fields()
+
+    grid.data['salt'].attributes['standard_name'] = 'sea_water_practical_salinity'
+    ## the indexes are only updated by add_data() or reindex_data()
+    ## (as documented in query_data and find_data_sets)
+    assert names(grid.find_data_sets('sea_water_salinity')) == ['salt']
+
+    grid.reindex_data()
+    assert grid.find_data_sets('sea_water_salinity') == set()
+    assert names(grid.find_data_sets('sea_water_practical_salinity')) == ['salt']
+
 
 if __name__ == "__main__":
     test_two_triangles()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+
+"""
+Tests for iterating through time-varying data a block at a time
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.test_examples import two_triangles
+
+from .test_read_mf import write_hourly_files, expected_eta
+
+
+def two_triangles_with_time():
+    grid = two_triangles()
+    times = np.arange(10) * 3600.0
+    u = np.arange(20.0).reshape(10, 2)
+    v = -u
+    grid.add_data(DataSet('u', location='face', data=u, time=times))
+    grid.add_data(DataSet('v', location='face', data=v, time=times))
+    grid.add_data(DataSet('depth', location='node', data=[1.0, 2.0, 3.0, 4.0]))
+    return grid
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_iter_time(prefetch):
+    grid = two_triangles_with_time()
+
+    blocks = list(grid.iter_time(['u', 'v'], chunk=4, prefetch=prefetch))
+
+    assert len(blocks) == 3
+    assert [len(times) for times, fields in blocks] == [4, 4, 2]
+    times = np.concatenate([times for times, fields in blocks])
+    assert np.array_equal(times, grid.data['u'].time)
+    u = np.concatenate([fields['u'] for times, fields in blocks])
+    assert np.array_equal(u, grid.data['u'].data)
+    assert sorted(blocks[0][1].keys()) == ['u', 'v']
+
+
+def test_iter_time_default_names():
+    grid = two_triangles_with_time()
+
+    times, fields = next(grid.iter_time())
+
+    assert sorted(fields.keys()) == ['u', 'v']
+    assert fields['u'].shape == (1, 2)
+
+
+def test_iter_time_range():
+    grid = two_triangles_with_time()
+
+    blocks = list(grid.iter_time('u', chunk=3, start=2, stop=7))
+
+    assert np.array_equal(np.concatenate([f['u'] for t, f in blocks]),
+                          grid.data['u'].data[2:7])
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_iter_time_missing_values(prefetch):
+    grid = two_triangles_with_time()
+    valid = np.ones((10, 2), dtype=bool)
+    valid[5, 1] = False
+    grid.data['u'].set_valid(valid)
+    grid.data['v'].data = np.ma.masked_greater(grid.data['v'].data, -4)
+
+    blocks = list(grid.iter_time(['u', 'v'], chunk=4, prefetch=prefetch))
+
+    u = np.ma.concatenate([fields['u'] for times, fields in blocks])
+    assert np.array_equal(np.ma.getmaskarray(u), ~valid)
+    assert np.array_equal(u.data, grid.data['u'].data)
+    v = np.ma.concatenate([fields['v'] for times, fields in blocks])
+    assert v.mask[:2].all() and not v.mask[2:].any()
+    # nothing missing: plain arrays
+    assert not isinstance(blocks[2][1]['u'], np.ma.MaskedArray)
+
+
+def test_iter_time_static_data():
+    grid = two_triangles_with_time()
+
+    with pytest.raises(ValueError):
+        list(grid.iter_time(['u', 'depth']))
+
+
+def test_iter_time_from_files(tmpdir):
+    filenames = write_hourly_files(str(tmpdir))
+    grid = UGrid.from_ncfiles(filenames)
+
+    blocks = list(grid.iter_time(['eta'], chunk=4))
+
+    assert np.array_equal(np.concatenate([f['eta'] for t, f in blocks]),
+                          expected_eta())
+    assert np.array_equal(np.concatenate([t for t, f in blocks]), np.arange(6))
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+"""
+Tests for the vectorized point location
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+import pytest
+
+from pyugrid import util
+from pyugrid.ugrid import UGrid
+from pyugrid.util import locate_points, clamp_weights
+from pyugrid.test_examples import twenty_one_triangles
+
+
+def slow_locate(grid, point):
+    for i, face in enumerate(grid.faces):
+        if util.point_in_tri(grid.nodes[face], point):
+            return i
+    return -1
+
+
+@pytest.fixture(params=['tree', 'brute force'])
+def search(request, monkeypatch):
+    if request.param == 'brute force':
+        monkeypatch.setattr(util, 'build_face_tree', lambda nodes, faces: None)
+    return request.param
+
+
+def test_matches_simple_search(search):
+    grid = twenty_one_triangles()
+    rng = np.random.RandomState(42)
+    low, high = grid.nodes.min(axis=0), grid.nodes.max(axis=0)
+    points = low - 1 + rng.rand(200, 2) * (high - low + 2)
+    faces, weights = locate_points(grid.nodes, grid.faces, points, num_candidates=2)
+
+    expected = np.array([slow_locate(grid, p) for p in points])
+    ## points on a shared edge can be in either face
+    found = faces >= 0
+    assert np.array_equal(found, expected >= 0)
+    assert found.any() and not found.all()
+    ## the weights interpolate the coordinates
+    coords = (grid.nodes[grid.faces[faces[found]]] * weights[found][:, :, np.newaxis]).sum(axis=1)
+    assert np.allclose(coords, points[found])
+    assert np.allclose(weights[found].sum(axis=1), 1)
+    assert (weights[~found] == 0).all()
+
+
+def test_vertices(search):
+    grid = twenty_one_triangles()
+    faces, weights = locate_points(grid.nodes, grid.faces, grid.nodes)
+
+    assert (faces >= 0).all()
+    assert np.allclose(weights.max(axis=1), 1)
+
+
+def test_quads(search):
+    nodes = np.array([(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)], dtype=np.float64)
+    faces = np.array([(0, 1, 4, 3), (1, 2, 5, -1)])
+    points = np.array([(0.25, 0.75), (0.75, 0.25), (1.75, 0.5), (1.25, 0.75), (3, 3)])
+    index, weights = locate_points(nodes, faces, points)
+
+    assert np.array_equal(index, [0, 0, 1, -1, -1])
+    assert weights[0, 1] == 0
+    assert np.allclose((nodes[faces[index[:3]]] * weights[:3, :, np.newaxis]).sum(axis=1),
+                       points[:3])
+
+
+def test_clamp_weights():
+    weights = clamp_weights([[0.5, 0.6, -0.1], [0.2, -1e-9, 0.8]])
+
+    assert np.allclose(weights, [[0.5, 0.5, 0.0], [0.2, 0.0, 0.8]])
+
+
+def test_ugrid_locate_faces():
+    grid = twenty_one_triangles()
+    centroids = grid.nodes[grid.faces].mean(axis=1)
+    faces = grid.locate_faces(np.vstack((centroids, [(100.0, 100.0)])))
+
+    assert np.array_equal(faces, list(range(len(grid.faces))) + [-1])
+    faces, weights = grid.locate_faces(centroids[:2], return_weights=True)
+    assert np.allclose(weights, 1.0 / 3)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""
+Tests for saving and loading grids in the native (.npy + manifest) format
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import numpy as np
+import netCDF4
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.test_examples import twenty_one_triangles
+
+from .utilities import chdir
+
+files = os.path.join(os.path.split(__file__)[0], 'files')
+file11 = 'ElevenPoints_UGRIDv0.9.nc'
+
+
+def full_grid():
+    grid = twenty_one_triangles()
+    grid.build_face_face_connectivity()
+    grid.build_edges()
+    grid.build_face_coordinates()
+    grid.add_data(DataSet('depth', location='node', data=np.arange(20.0),
+                          attributes={'units': 'm',
+                                      'valid_range': np.array([0, 100], dtype=np.float32),
+                                      'scale': np.float32(0.5),
+                                      'count': 3,
+                                      }))
+    grid.add_data(DataSet('u', location='face', data=np.arange(42.0).reshape(2, 21),
+                          time=[0.0, 3600.0]))
+    grid.data['u'].set_valid(np.arange(21) != 3, index=1)
+    grid.add_data(DataSet('flag', location='face', data=np.ones(21, dtype=np.int8)))
+    return grid
+
+
+def assert_same(grid, other):
+    assert grid.mesh_name == other.mesh_name
+    for attr in ('nodes', 'faces', 'edges', 'boundaries', 'face_face_connectivity',
+                 'face_coordinates'):
+        assert np.array_equal(getattr(grid, attr), getattr(other, attr))
+    assert sorted(grid.data.keys()) == sorted(other.data.keys())
+    for name, ds in grid.data.items():
+        other_ds = other.data[name]
+        assert ds.location == other_ds.location
+        assert ds.data.dtype == other_ds.data.dtype
+        assert np.array_equal(ds.data, other_ds.data)
+        if ds.valid_bits is None:
+            assert other_ds.valid_bits is None
+        else:
+            assert np.array_equal(ds.valid_mask(), other_ds.valid_mask())
+        assert sorted(ds.attributes) == sorted(other_ds.attributes)
+        for att_name, value in ds.attributes.items():
+            assert np.array_equal(value, other_ds.attributes[att_name])
+            assert type(value) == type(other_ds.attributes[att_name])
+        if ds.time is None:
+            assert other_ds.time is None
+        else:
+            assert np.array_equal(ds.time, other_ds.time)
+
+
+def test_round_trip(tmpdir):
+    grid = full_grid()
+    dirname = str(tmpdir.join('grid'))
+
+    grid.save_native(dirname)
+    loaded = UGrid.from_native(dirname)
+
+    assert_same(grid, loaded)
+    # memory-mapped, not read
+    assert not loaded.nodes.flags.owndata
+    assert not loaded.data['depth'].data.flags.owndata
+    assert not loaded.data['u'].valid_bits.flags.owndata
+    assert not loaded.data['u'].valid_mask()[1, 3]
+    assert not loaded.dirty
+
+
+def test_in_memory(tmpdir):
+    dirname = str(tmpdir.join('grid'))
+    full_grid().save_native(dirname)
+
+    loaded = UGrid.from_native(dirname, mmap_mode=None)
+
+    loaded.nodes[0] = (1.0, 1.0)
+
+
+def test_read_only(tmpdir):
+    dirname = str(tmpdir.join('grid'))
+    full_grid().save_native(dirname)
+
+    loaded = UGrid.from_native(dirname)
+
+    with pytest.raises(ValueError):
+        loaded.nodes[0] = (1.0, 1.0)
+
+
+def test_resave(tmpdir):
+    dirname = str(tmpdir.join('grid'))
+    full_grid().save_native(dirname)
+    full = twenty_one_triangles()
+    grid = UGrid(full.nodes, full.faces)
+    grid.save_native(dirname)
+
+    loaded = UGrid.from_native(dirname)
+
+    assert loaded.edges is None
+    assert loaded.data == {}
+
+
+def test_netcdf_round_trip(tmpdir):
+    """
+    netcdf -> native -> netcdf loses nothing
+    """
+    with chdir(files):
+        grid = UGrid.from_ncfile(file11, load_data=True)
+    dirname = str(tmpdir.join('grid'))
+    filename = str(tmpdir.join('grid.nc'))
+
+    grid.save_native(dirname)
+    UGrid.from_native(dirname).save_as_netcdf(filename)
+    result = UGrid.from_ncfile(filename, load_data=True)
+
+    assert_same(grid, result)
+
+
+def test_not_native(tmpdir):
+    with pytest.raises(ValueError):
+        UGrid.from_native(str(tmpdir))
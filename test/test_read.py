@@ -20,6 +20,8 @@ import netCDF4
 
 from pyugrid import ugrid
 from pyugrid import read_netcdf
+from pyugrid.data_set import DataSet
+from pyugrid.test_examples import two_triangles
 
 UGrid = ugrid.UGrid
 
@@ -253,5 +255,85 @@ def test_read_from_nc_dataset():
     assert grid.faces.shape == (13, 3)
 
 
+def test_read_connectivity_contiguous():
+    """
+    connectivity should come back C-contiguous and in the index dtype
+    """
+    with chdir(files):
+        grid = UGrid.from_ncfile(file11)
+
+    for arr in (grid.faces, grid.face_face_connectivity, grid.boundaries):
+        assert arr.dtype == ugrid.IND_DT
+        assert arr.flags.c_contiguous
+
+
+def test_read_connectivity_multiple_flags(tmpdir):
+    """
+    all the flag values (and the fill value) should become -1
+    """
+    fname = str(tmpdir.join('flags.nc'))
+    with netCDF4.Dataset(fname, 'w') as nc:
+        nc.createDimension('num_face', 4)
+        nc.createDimension('three', 3)
+        var = nc.createVariable('links', np.int32, ('three', 'num_face'),
+                                fill_value=-999)
+        var.start_index = 1
+        var.flag_values = np.array([0, -1], dtype=np.int32)
+        var[:] = np.array([[2, 0, 4, -1],
+                           [3, 4, -1, 1],
+                           [-999, 1, 2, 3]], dtype=np.int32)
+    with netCDF4.Dataset(fname) as nc:
+        links = read_netcdf.read_connectivity(nc.variables['links'], 3)
+        # the Dataset's own masking should not have been changed
+        assert nc.variables['links'].mask
+
+    assert links.flags.c_contiguous
+    assert np.array_equal(links, [[1, 2, -1],
+                                  [-1, 3, 0],
+                                  [3, -1, 1],
+                                  [-1, 0, 2]])
+
+
+def test_inspect_ncfile():
+    """
+    summary of the sample file, without loading it
+    """
+    with chdir(files):
+        summary = read_netcdf.inspect_ncfile(file11)
+
+    assert summary['data_model'] == 'NETCDF3_CLASSIC'
+    assert list(summary['meshes'].keys()) == ['Mesh2']
+    mesh = summary['meshes']['Mesh2']
+    assert mesh['sizes'] == {'node': 11, 'face': 13, 'boundary': 9}
+    assert mesh['num_vertices'] == 3
+    assert mesh['variables']['face_node_connectivity'] == 'Mesh2_face_nodes'
+    assert mesh['variables']['node_coordinates'] == 'Mesh2_node_x Mesh2_node_y'
+    assert sorted(mesh['data'].keys()) == ['boundary', 'node']
+    assert mesh['data']['node'] == ['Mesh2_depth']
+    assert sorted(mesh['data']['boundary']) == ['Mesh2_boundary_count',
+                                                'Mesh2_boundary_types']
+    depth = summary['variables']['Mesh2_depth']
+    assert depth['shape'] == (11,)
+    assert depth['location'] == 'node'
+    assert depth['dimensions'] == ('nMesh2_node',)
+
+
+def test_inspect_ncfile_chunking(tmpdir):
+    """
+    a netcdf4 file has chunking and compression info
+    """
+    fname = str(tmpdir.join('two.nc'))
+    grid = two_triangles()
+    grid.add_data(DataSet('depth', location='node', data=[1.0, 2.0, 3.0, 4.0]))
+    grid.save_as_netcdf(fname)
+
+    summary = read_netcdf.inspect_ncfile(fname)
+
+    assert summary['meshes']['mesh']['sizes'] == {'node': 4, 'face': 2, 'edge': 5}
+    depth = summary['variables']['depth']
+    assert depth['chunking'] == [4]
+    assert depth['filters']['zlib'] is False
+
+
 if __name__ == "__main__":
     test_simple_read()
@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+
+"""
+Tests for reading a subset of a grid, by bounding box, from a netcdf file
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import numpy as np
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid import read_netcdf
+from pyugrid.test_examples import twenty_one_triangles
+
+from .utilities import chdir
+
+files = os.path.join(os.path.split(__file__)[0], 'files')
+file11 = 'ElevenPoints_UGRIDv0.9.nc'
+
+
+@pytest.fixture
+def full_grid_file(tmpdir):
+    grid = twenty_one_triangles()
+    grid.build_face_coordinates()
+    grid.add_data(DataSet('depth', location='node', data=np.arange(20.0)))
+    grid.add_data(DataSet('u', location='face', data=np.arange(21.0) * 10))
+    filename = str(tmpdir.join('21_triangles.nc'))
+    grid.save_as_netcdf(filename)
+    return grid, filename
+
+
+def test_bbox_subset(full_grid_file):
+    full, filename = full_grid_file
+    bbox = (4.0, 6.0, 8.0, 10.0)
+
+    grid = UGrid.from_ncfile(filename, load_data=True, bbox=bbox)
+
+    # faces whose nodes' bounding box overlaps the bbox
+    xy = full.nodes[full.faces]
+    touches = ((xy[:, :, 0].max(axis=1) >= 4) & (xy[:, :, 0].min(axis=1) <= 8) &
+               (xy[:, :, 1].max(axis=1) >= 6) & (xy[:, :, 1].min(axis=1) <= 10))
+    keep_faces = np.flatnonzero(touches)
+    keep_nodes = np.unique(full.faces[keep_faces])
+
+    assert len(grid.faces) == len(keep_faces)
+    assert len(grid.nodes) == len(keep_nodes)
+    assert np.array_equal(grid.nodes, full.nodes[keep_nodes])
+    # same triangles, renumbered
+    assert np.array_equal(grid.nodes[grid.faces], full.nodes[full.faces[keep_faces]])
+    assert np.array_equal(grid.face_coordinates, full.face_coordinates[keep_faces])
+
+    assert np.array_equal(grid.data['depth'].data, full.data['depth'].data[keep_nodes])
+    assert np.array_equal(grid.data['u'].data, full.data['u'].data[keep_faces])
+
+
+def test_bbox_face_face():
+    with chdir(files):
+        grid = UGrid.from_ncfile(file11, bbox=(-45, 20, -30, 35))
+
+    # every neighbor should be a face in the subset, or -1
+    assert grid.face_face_connectivity.shape == grid.faces.shape
+    assert grid.face_face_connectivity.min() >= -1
+    assert grid.face_face_connectivity.max() < len(grid.faces)
+    for i, neighbors in enumerate(grid.face_face_connectivity):
+        for j in neighbors[neighbors >= 0]:
+            assert len(set(grid.faces[i]) & set(grid.faces[j])) == 2
+
+
+def test_bbox_boundaries(full_grid_file):
+    full, filename = full_grid_file
+
+    grid = UGrid.from_ncfile(filename, bbox=(2.0, 0.0, 6.0, 4.0))
+
+    # only boundary segments with both nodes in the subset
+    assert len(grid.boundaries) > 0
+    assert grid.boundaries.min() >= 0
+    assert grid.boundaries.max() < len(grid.nodes)
+    segments = set(map(tuple, full.nodes[full.boundaries].reshape(-1, 4)))
+    for seg in grid.nodes[grid.boundaries].reshape(-1, 4):
+        assert tuple(seg) in segments
+
+
+def test_bbox_everything(full_grid_file):
+    full, filename = full_grid_file
+
+    grid = UGrid.from_ncfile(filename, load_data=True, bbox=(-100, -100, 100, 100))
+
+    assert np.array_equal(grid.nodes, full.nodes)
+    assert np.array_equal(grid.faces, full.faces)
+
+
+def test_bbox_nothing(full_grid_file):
+    full, filename = full_grid_file
+
+    grid = UGrid.from_ncfile(filename, load_data=True, bbox=(100, 100, 200, 200))
+
+    assert len(grid.nodes) == 0
+    assert len(grid.faces) == 0
+    assert len(grid.data['depth'].data) == 0
+
+
+def test_bbox_flagged_file():
+    """
+    the sample file is 1-indexed, in Fortran order, with flags
+    """
+    with chdir(files):
+        full = UGrid.from_ncfile(file11, load_data=True)
+        grid = UGrid.from_ncfile(file11, load_data=True, bbox=(-45, 20, -30, 35))
+
+    assert 0 < len(grid.faces) < len(full.faces)
+    assert grid.face_face_connectivity.min() == -1
+    keep_nodes = [np.flatnonzero((full.nodes == node).all(axis=1))[0] for node in grid.nodes]
+    assert np.array_equal(grid.data['depth'].data, full.data['depth'].data[keep_nodes])
+
+
+def test_contiguous_runs():
+    runs = read_netcdf._contiguous_runs(np.array([0, 1, 2, 50, 51, 9000]), max_gap=100)
+
+    assert [list(run) for run in runs] == [[0, 1, 2, 50, 51], [9000]]
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+Tests for reading a series of netcdf files as one time series
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import numpy as np
+import netCDF4
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid import read_netcdf
+from pyugrid.read_mfnetcdf import MFVariable
+from pyugrid.test_examples import two_triangles
+
+
+def write_hourly_files(dirname, num_files=3, steps_per_file=(2, 3, 1)):
+    """
+    writes a set of files with the two_triangles mesh, a static depth,
+    and a time-varying eta, with eta[t, n] == 10 * t + n
+    """
+    filenames = []
+    t = 0
+    for i in range(num_files):
+        grid = two_triangles()
+        grid.add_data(DataSet('depth', location='node', data=[1.0, 2.0, 3.0, 4.0],
+                              attributes={'units': 'm'}))
+        filename = os.path.join(dirname, 'hour_%02i.nc' % i)
+        grid.save_as_netcdf(filename)
+        with netCDF4.Dataset(filename, 'a') as nc:
+            nc.createDimension('time', None)
+            time = nc.createVariable('time', np.float64, ('time',))
+            time.units = 'hours since 2015-01-01'
+            eta = nc.createVariable('eta', np.float64, ('time', 'mesh_num_node'))
+            eta.location = 'node'
+            eta.mesh = 'mesh'
+            eta.units = 'm'
+            for j in range(steps_per_file[i]):
+                time[j] = t
+                eta[j] = 10 * t + np.arange(4)
+                t += 1
+        filenames.append(filename)
+    return filenames
+
+
+def expected_eta():
+    return 10 * np.arange(6)[:, None] + np.arange(4)
+
+
+def test_from_ncfiles(tmpdir):
+    filenames = write_hourly_files(str(tmpdir))
+
+    grid = UGrid.from_ncfiles(filenames)
+
+    assert grid.nodes.shape == (4, 2)
+    assert grid.faces.shape == (2, 3)
+    assert sorted(grid.data.keys()) == ['depth', 'eta']
+
+    eta = grid.data['eta']
+    assert isinstance(eta.data, MFVariable)
+    assert eta.data.shape == (6, 4)
+    assert np.array_equal(eta.time, np.arange(6))
+    assert eta.attributes['units'] == 'm'
+
+    depth = grid.data['depth']
+    assert depth.time is None
+    assert np.array_equal(depth.data, [1.0, 2.0, 3.0, 4.0])
+
+
+def test_close(tmpdir):
+    filenames = write_hourly_files(str(tmpdir))
+
+    with UGrid.from_ncfiles(filenames) as grid:
+        source = grid.source
+        assert all(nc.isopen() for nc in source.datasets)
+        assert np.array_equal(grid.data['eta'].data[:], expected_eta())
+
+    assert grid.source is None
+    assert not any(nc.isopen() for nc in source.datasets)
+    grid.close() # closing again is OK
+
+
+def test_glob(tmpdir):
+    write_hourly_files(str(tmpdir))
+
+    grid = UGrid.from_ncfiles(os.path.join(str(tmpdir), 'hour_*.nc'))
+
+    assert np.array_equal(np.asarray(grid.data['eta'].data), expected_eta())
+
+
+def test_no_files(tmpdir):
+    with pytest.raises(ValueError):
+        UGrid.from_ncfiles(os.path.join(str(tmpdir), 'nothing_*.nc'))
+
+
+@pytest.mark.parametrize('key', [slice(None),
+                                 slice(1, 5),
+                                 slice(0, 6, 2),
+                                 slice(None, None, -1),
+                                 slice(4, 1, -1),
+                                 slice(5, None, -2),
+                                 [0, 3, 4],
+                                 [5, 0],
+                                 [4, 2, 3],
+                                 [3, 3, 2],
+                                 (slice(1, 4), 2),
+                                 (Ellipsis, 1),
+                                 (slice(3, 3),),
+                                 ])
+def test_indexing(tmpdir, key):
+    filenames = write_hourly_files(str(tmpdir))
+    eta = UGrid.from_ncfiles(filenames).data['eta'].data
+
+    assert np.array_equal(eta[key], expected_eta()[key])
+
+
+def test_reads_increasing(tmpdir):
+    filenames = write_hourly_files(str(tmpdir))
+    eta = UGrid.from_ncfiles(filenames).data['eta'].data
+    read = eta.source.read
+    keys = []
+
+    def record(file_num, var_name, key):
+        keys.append(key[0])
+        return read(file_num, var_name, key)
+    eta.source.read = record
+
+    assert np.array_equal(eta[4:1:-1], expected_eta()[4:1:-1])
+    assert np.array_equal(eta[[4, 2, 3]], expected_eta()[[4, 2, 3]])
+    for key in keys:
+        if isinstance(key, slice):
+            assert key.step is None or key.step > 0
+        else:
+            assert np.all(np.diff(key) > 0)
+
+
+def test_locks(tmpdir):
+    filenames = write_hourly_files(str(tmpdir))
+
+    source = UGrid.from_ncfiles(filenames).source
+    assert len(set(id(lock) for lock in source._locks)) == 3
+    assert read_netcdf.NETCDF_LOCK not in source._locks
+
+    source = UGrid.from_ncfiles(filenames, lock=True).source
+    assert all(lock is read_netcdf.NETCDF_LOCK for lock in source._locks)
+    assert np.array_equal(source.variable('eta')[:], expected_eta())
+
+
+@pytest.mark.parametrize('index', [0, 1, 2, 5, -1, -6])
+def test_single_step(tmpdir, index):
+    filenames = write_hourly_files(str(tmpdir))
+    eta = UGrid.from_ncfiles(filenames).data['eta'].data
+
+    assert np.array_equal(eta[index], expected_eta()[index])
+
+
+def test_out_of_range(tmpdir):
+    filenames = write_hourly_files(str(tmpdir))
+    eta = UGrid.from_ncfiles(filenames).data['eta'].data
+
+    with pytest.raises(IndexError):
+        eta[6]
+
+
+def test_mismatched_files(tmpdir):
+    filenames = write_hourly_files(str(tmpdir))
+    grid = two_triangles()
+    grid.save_as_netcdf(os.path.join(str(tmpdir), 'other.nc'))
+    with netCDF4.Dataset(os.path.join(str(tmpdir), 'other.nc'), 'a') as nc:
+        nc.createDimension('time', None)
+        nc.createVariable('time', np.float64, ('time',))
+        eta = nc.createVariable('eta', np.float64, ('time',))
+        eta.location = 'node'
+        eta.mesh = 'mesh'
+
+    with pytest.raises(ValueError):
+        UGrid.from_ncfiles(filenames + [os.path.join(str(tmpdir), 'other.nc')])
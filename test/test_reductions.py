@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+
+"""
+Tests for the streaming reductions over time
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.ucube import UCube
+from pyugrid.reductions import Accumulator, reduce_time, _map
+from pyugrid.test_examples import twenty_one_triangles
+
+
+def make_data(num_times=50, num_layers=None, seed=1):
+    grid = twenty_one_triangles()
+    rng = np.random.RandomState(seed)
+    shape = (num_times,) + ((num_layers,) if num_layers else ()) + (len(grid.nodes),)
+    data = rng.normal(20, 5, shape)
+    time = np.arange(num_times) * 3600.0
+    return grid, DataSet('salt', data=data, time=time,
+                         attributes={'units': '1e-3', 'standard_name': 'sea_water_salinity'})
+
+
+def test_accumulator_merge():
+    rng = np.random.RandomState(0)
+    data = rng.normal(3, 2, (100, 7)) + np.arange(7)
+    acc = Accumulator((7,))
+    for block in np.array_split(data, [3, 4, 40, 90]):
+        acc.merge(Accumulator.from_block(block))
+
+    assert np.array_equal(acc.count, [100] * 7)
+    assert np.allclose(acc.result('mean'), data.mean(axis=0))
+    assert np.allclose(acc.result('std', ddof=1), data.std(axis=0, ddof=1))
+    assert np.array_equal(acc.result('min'), data.min(axis=0))
+    assert np.array_equal(acc.result('max'), data.max(axis=0))
+
+
+@pytest.mark.parametrize('workers', [1, 4])
+def test_stats(workers):
+    grid, ds = make_data()
+    data = ds.data
+    results = ds.reduce_time(['mean', 'std', 'min', 'max', 'count'], chunk=7, workers=workers)
+
+    assert np.allclose(results['mean'].data, data.mean(axis=0))
+    assert np.allclose(results['std'].data, data.std(axis=0))
+    assert np.array_equal(results['min'].data, data.min(axis=0))
+    assert np.array_equal(results['max'].data, data.max(axis=0))
+    assert np.array_equal(results['count'].data, [50] * len(grid.nodes))
+    mean = results['mean']
+    assert mean.name == 'salt_mean'
+    assert mean.location == 'node'
+    assert mean.time is None
+    assert mean.attributes['cell_methods'] == 'time: mean'
+    assert mean.attributes['units'] == '1e-3'
+    assert mean.attributes['standard_name'] == 'sea_water_salinity'
+    assert 'units' not in results['count'].attributes
+
+
+def test_map_bounds_tasks():
+    started = []
+
+    def function(task):
+        started.append(task)
+        return task
+
+    taken = 0
+    for result in _map(3, function, list(range(20))):
+        assert result == taken
+        taken += 1
+        ## the tasks started, and not yet taken
+        assert len(started) - taken <= 3 + 1
+    assert taken == 20
+
+
+def test_results_can_be_saved(tmpdir):
+    grid, ds = make_data()
+    for result in ds.reduce_time(['mean', 'max'], thresholds=[25]).values():
+        grid.add_data(result)
+    filepath = str(tmpdir.join('stats.nc'))
+    grid.save_as_netcdf(filepath)
+    again = UGrid.from_ncfile(filepath, load_data=True)
+
+    assert np.allclose(again.data['salt_mean'].data, ds.data.mean(axis=0))
+    assert again.data['salt_gt_25'].attributes['long_name'] == 'number of time steps with salt > 25'
+
+
+def test_exceedance():
+    grid, ds = make_data()
+    results = ds.reduce_time([], thresholds=[15, 25.5], chunk=6)
+
+    assert sorted(results) == ['gt_15', 'gt_25.5']
+    assert np.array_equal(results['gt_15'].data, (ds.data > 15).sum(axis=0))
+    assert np.array_equal(results['gt_25.5'].data, (ds.data > 25.5).sum(axis=0))
+
+
+def test_nan_and_masked():
+    grid, ds = make_data()
+    data = ds.data.copy()
+    data[::3, 0] = np.nan
+    data[:, 1] = np.nan
+    results = DataSet('salt', data=data, time=ds.time).reduce_time(['mean', 'min', 'count'],
+                                                                    chunk=8)
+    assert results['count'].data[0] == 33
+    assert np.isclose(results['mean'].data[0], np.nanmean(data[:, 0]))
+    assert np.isnan(results['mean'].data[1])
+    assert np.isnan(results['min'].data[1])
+
+    masked = np.ma.masked_invalid(data)
+    results = DataSet('salt', data=masked, time=ds.time).reduce_time(['mean'])
+    assert np.isclose(results['mean'].data[0], np.nanmean(data[:, 0]))
+
+
+def test_percentiles():
+    grid, ds = make_data(num_times=2000)
+    results = ds.reduce_time([], percentiles=[0, 50, 95, 100], chunk=300, bins=200)
+    data = ds.data
+    spread = data.max(axis=0) - data.min(axis=0)
+
+    assert np.allclose(results['p0'].data, data.min(axis=0))
+    assert np.allclose(results['p100'].data, data.max(axis=0))
+    for q in (50, 95):
+        error = np.abs(results['p%g' % q].data - np.percentile(data, q, axis=0))
+        assert (error <= spread / 200 + 1e-9).all()
+    assert results['p95'].attributes['long_name'] == '95 percentile of salt'
+
+
+def test_constant_percentile():
+    grid = twenty_one_triangles()
+    data = np.ones((10, len(grid.nodes)))
+    results = DataSet('c', data=data, time=np.arange(10)).reduce_time([], percentiles=[50])
+
+    assert np.array_equal(results['p50'].data, data[0])
+
+
+def test_time_bins():
+    grid, ds = make_data(num_times=72)
+    days = np.array([0, 24, 48, 72]) * 3600.0
+    results = ds.reduce_time(['mean', 'max'], thresholds=[20], time_bins=days, chunk=10)
+    daily = ds.data.reshape(3, 24, -1)
+
+    assert results['mean'].data.shape == (3, len(grid.nodes))
+    assert np.array_equal(results['mean'].time, days[:-1])
+    assert np.allclose(results['mean'].data, daily.mean(axis=1))
+    assert np.array_equal(results['max'].data, daily.max(axis=1))
+    assert np.array_equal(results['gt_20'].data, (daily > 20).sum(axis=1))
+
+
+def test_time_bins_can_be_saved(tmpdir):
+    grid, ds = make_data(num_times=72)
+    days = np.array([0, 24, 48, 72]) * 3600.0
+    results = ds.reduce_time(['mean', 'max'], time_bins=days)
+    for result in results.values():
+        grid.add_data(result)
+    filepath = str(tmpdir.join('daily.nc'))
+    grid.save_as_netcdf(filepath)
+    again = UGrid.from_ncfile(filepath, load_data=True)
+
+    assert np.array_equal(again.data['salt_mean'].time, days[:-1])
+    assert np.allclose(again.data['salt_mean'].data, results['mean'].data)
+    assert np.array_equal(again.data['salt_max'].data, results['max'].data)
+
+
+def test_time_bins_leave_out_steps():
+    grid, ds = make_data(num_times=10)
+    results = ds.reduce_time(['count'], time_bins=[3600.0, 3 * 3600.0, 4 * 3600.0])
+
+    assert np.array_equal(results['count'].data[:, 0], [2, 1])
+
+
+def test_layers_and_cube():
+    grid, ds = make_data(num_layers=3)
+    cube = UCube(grid, ds.data, time=ds.time, name='salt')
+    results = cube.isel(level=[0, 2], location=slice(0, 5)).reduce_time(['mean'], chunk=4)
+
+    assert np.allclose(results['mean'].data, ds.data[:, [0, 2], :5].mean(axis=0))
+
+
+def test_bad_arguments():
+    grid, ds = make_data()
+    with pytest.raises(ValueError):
+        ds.reduce_time(['median'])
+    with pytest.raises(ValueError):
+        ds.reduce_time(percentiles=[101])
+    with pytest.raises(ValueError):
+        ds.reduce_time(time_bins=[1.0])
+    with pytest.raises(ValueError):
+        DataSet('depth', data=np.zeros(3)).reduce_time()
@@ -407,6 +407,62 @@ def test_write_everything():
     assert u.attributes['units'] == 'm/s'
 
 
+def test_write_face_face_connectivity():
+    """ the face_face_connectivity gets written, and read back in """
+    fname = 'temp.nc'
+
+    grid = twenty_one_triangles()
+    grid.build_face_face_connectivity()
+
+    grid.save_as_netcdf(fname)
+
+    with netCDF4.Dataset(fname) as ds:
+        assert nc_has_variable(ds, 'mesh_face_links')
+        assert nc_var_has_attr_vals(ds, 'mesh_face_links', {'cf_role': 'face_face_connectivity',
+                                                            'start_index': 0,
+                                                            'flag_values': -1,
+                                                            })
+
+    grid2 = UGrid.from_ncfile(fname)
+    assert np.array_equal(grid2.face_face_connectivity, grid.face_face_connectivity)
+
+
+def test_write_with_encoding():
+    """ compression and chunking, by location and by variable name """
+    fname = 'temp.nc'
+
+    grid = twenty_one_triangles()
+    grid.add_data(DataSet('depth', location='node', data=np.linspace(1, 10, 20)))
+    grid.add_data(DataSet('u', location='face', data=np.linspace(0, 2, 21)))
+
+    grid.save_as_netcdf(fname, encoding={'node': {'zlib': True, 'complevel': 6},
+                                         'face': {'zlib': True, 'shuffle': False,
+                                                  'chunksizes': (5,)},
+                                         'depth': {'complevel': 1,
+                                                   'chunksizes': (8,),
+                                                   'least_significant_digit': 1},
+                                         })
+
+    with netCDF4.Dataset(fname) as ds:
+        filters = ds.variables['mesh_node_lon'].filters()
+        assert filters['zlib'] and filters['complevel'] == 6
+
+        filters = ds.variables['depth'].filters()
+        assert filters['zlib'] and filters['complevel'] == 1
+        assert ds.variables['depth'].chunking() == [8]
+        # quantized to one decimal place
+        assert np.abs(ds.variables['depth'][:] - grid.data['depth'].data).max() <= 0.05
+
+        for name in ('u', 'mesh_face_nodes'):
+            filters = ds.variables[name].filters()
+            assert filters['zlib'] and not filters['shuffle']
+
+        assert ds.variables['mesh_face_nodes'].chunking() == [5, 3]
+
+        # no options for the edges
+        assert not ds.variables['mesh_edge_nodes'].filters()['zlib']
+
+
 if __name__ == "__main__":
     # run the tests:
 
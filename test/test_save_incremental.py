@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""
+Tests for dirty tracking, and saving only what has changed to an existing file
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import numpy as np
+import netCDF4
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.test_examples import twenty_one_triangles
+
+
+@pytest.fixture
+def saved_grid(tmpdir):
+    grid = twenty_one_triangles()
+    grid.add_data(DataSet('depth', location='node', data=np.arange(20.0),
+                          attributes={'units': 'm'}))
+    grid.add_data(DataSet('u', location='face', data=np.arange(21.0)))
+    filename = str(tmpdir.join('21_triangles.nc'))
+    grid.save_as_netcdf(filename)
+    return filename
+
+
+def test_dataset_dirty():
+    ds = DataSet('depth', location='node', data=[1.0, 2.0], attributes={'units': 'm'})
+    assert ds.dirty
+
+    ds.mark_clean()
+    assert not ds.dirty
+
+    ds.attributes['units'] = 'ft'
+    assert ds.attributes_dirty and not ds.data_dirty
+
+    ds.mark_clean()
+    ds.data = [3.0, 4.0]
+    assert ds.data_dirty and not ds.attributes_dirty
+
+    ds.mark_clean()
+    ds.data[0] = 5.0  # in place -- can't be seen
+    assert not ds.dirty
+    ds.mark_dirty()
+    assert ds.dirty
+
+
+def test_loaded_grid_is_clean(saved_grid):
+    grid = UGrid.from_ncfile(saved_grid, load_data=True)
+
+    assert not grid.dirty
+
+    grid.add_data(DataSet('v', location='face', data=np.ones(21)))
+    assert grid.dirty and not grid.mesh_dirty
+
+    grid.nodes = grid.nodes + 1
+    assert grid.mesh_dirty
+
+
+def test_save_new_and_modified(saved_grid):
+    grid = UGrid.from_ncfile(saved_grid, load_data=True)
+    grid.add_data(DataSet('v', location='face', data=np.ones(21), attributes={'units': 'm/s'}))
+    grid.data['depth'].data = np.arange(20.0) * 2
+    grid.data['depth'].attributes['long_name'] = 'depth'
+    del grid.data['depth'].attributes['units']
+
+    grid.save_as_netcdf(saved_grid, mode='a')
+
+    assert not grid.dirty
+    result = UGrid.from_ncfile(saved_grid, load_data=True)
+    assert sorted(result.data.keys()) == ['depth', 'u', 'v']
+    assert np.array_equal(result.data['depth'].data, np.arange(20.0) * 2)
+    assert result.data['depth'].attributes == {'long_name': 'depth'}
+    assert np.array_equal(result.data['v'].data, np.ones(21))
+    assert result.data['v'].attributes == {'units': 'm/s'}
+
+
+def test_only_dirty_written(saved_grid):
+    grid = UGrid.from_ncfile(saved_grid, load_data=True)
+    # change the file behind the grid's back: a clean DataSet won't overwrite it
+    with netCDF4.Dataset(saved_grid, 'a') as nc:
+        nc.variables['u'][:] = -1
+
+    grid.add_data(DataSet('v', location='face', data=np.ones(21)))
+    grid.save_as_netcdf(saved_grid, mode='a')
+
+    result = UGrid.from_ncfile(saved_grid, load_data=True)
+    assert np.all(result.data['u'].data == -1)
+
+
+def test_mesh_mismatch(saved_grid):
+    grid = UGrid.from_ncfile(saved_grid, load_data=True)
+    grid.nodes = grid.nodes + 1.0
+
+    with pytest.raises(ValueError):
+        grid.save_as_netcdf(saved_grid, mode='a')
+
+
+def test_mesh_size_mismatch(saved_grid):
+    grid = UGrid.from_ncfile(saved_grid, bbox=(4.0, 6.0, 8.0, 10.0))
+
+    with pytest.raises(ValueError):
+        grid.save_as_netcdf(saved_grid, mode='a')
+
+
+def test_modified_mesh_that_matches(saved_grid):
+    grid = UGrid.from_ncfile(saved_grid)
+    grid.faces = grid.faces.copy()
+    grid.add_data(DataSet('v', location='face', data=np.ones(21)))
+
+    grid.save_as_netcdf(saved_grid, mode='a')
+
+    assert 'v' in UGrid.from_ncfile(saved_grid, load_data=True).data
+
+
+def test_new_connectivity_saved(saved_grid):
+    grid = UGrid.from_ncfile(saved_grid, load_data=True)
+    assert grid.face_face_connectivity is None
+    grid.build_face_face_connectivity()
+    assert grid.mesh_dirty
+
+    grid.save_as_netcdf(saved_grid, mode='a')
+
+    result = UGrid.from_ncfile(saved_grid)
+    assert np.array_equal(result.face_face_connectivity, grid.face_face_connectivity)
+
+
+def test_connectivity_setters_dirty(saved_grid):
+    grid = UGrid.from_ncfile(saved_grid)
+    grid.face_face_connectivity = -np.ones((21, 3))
+    assert grid.mesh_dirty
+
+    grid.mark_clean()
+    del grid.face_face_connectivity
+    assert grid.mesh_dirty
+
+
+def test_save_time_varying(saved_grid):
+    grid = UGrid.from_ncfile(saved_grid, load_data=True)
+    grid.add_data(DataSet('eta', location='node', data=np.ones((3, 20)), time=[0.0, 1.0, 2.0]))
+    grid.save_as_netcdf(saved_grid, mode='a')
+
+    grid = UGrid.from_ncfile(saved_grid, load_data=True)
+    assert np.array_equal(grid.data['eta'].time, [0.0, 1.0, 2.0])
+    grid.data['eta'].data = np.zeros((3, 20))
+    grid.add_data(DataSet('v', location='face', data=np.ones((3, 21)), time=[0.0, 1.0, 2.0]))
+    grid.save_as_netcdf(saved_grid, mode='a')
+
+    result = UGrid.from_ncfile(saved_grid, load_data=True)
+    assert np.all(result.data['eta'].data == 0)
+    assert result.data['v'].data.shape == (3, 21)
+
+    grid.data['v'].time = np.array([0.0, 1.0, 5.0])
+    grid.data['v'].mark_dirty()
+    with pytest.raises(ValueError):
+        grid.save_as_netcdf(saved_grid, mode='a')
+
+
+def test_wrong_shape(saved_grid):
+    grid = UGrid.from_ncfile(saved_grid, load_data=True)
+    with netCDF4.Dataset(saved_grid, 'a') as nc:
+        nc.createDimension('time', None)
+        var = nc.createVariable('eta', np.float64, ('time', 'mesh_num_node'))
+        var.location = 'node'
+        var.mesh = 'mesh'
+    grid.add_data(DataSet('eta', location='node', data=np.ones(20)))
+
+    with pytest.raises(ValueError):
+        grid.save_as_netcdf(saved_grid, mode='a')
+
+
+def test_bad_mode(saved_grid):
+    with pytest.raises(ValueError):
+        UGrid.from_ncfile(saved_grid).save_as_netcdf(saved_grid, mode='r')
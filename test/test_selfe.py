@@ -0,0 +1,370 @@
+#!/usr/bin/env python
+
+"""
+Tests for reading SELFE v5 binary output
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import numpy as np
+import pytest
+
+from pyugrid.ugrid import UGrid
+from pyugrid.selfe import (SelfeOutput, read_time_series, series_filenames,
+                           convert_to_netcdf)
+
+from .utilities import write_selfe
+
+x = np.array([0.0, 1.0, 1.0, 0.0])
+y = np.array([0.0, 0.0, 1.0, 1.0])
+elements = [(1, 2, 3), (1, 3, 4)]
+depth = np.array([10.0, 11.0, 12.0, 13.0])
+times = np.array([900.0, 1800.0, 2700.0])
+eta = np.arange(12, dtype=np.float32).reshape(3, 4) / 10
+
+
+def write_2d(tmpdir, name='1_elev.61'):
+    filename = str(tmpdir.join(name))
+    values = [step.reshape(4, 1) for step in eta]
+    write_selfe(filename, x, y, elements, depth, times, eta, values)
+    return filename
+
+
+def write_3d(tmpdir, bot_idx=None, name='1_hvel.64', step_times=times):
+    """
+    3 levels, 2 components: value is node * 100 + level * 10 + component
+    """
+    filename = str(tmpdir.join(name))
+    if bot_idx is None:
+        bot_idx = np.ones((4,), dtype=np.int32)
+    column = [[node * 100 + level * 10 + c for level in range(max(b, 1) - 1, 3) for c in range(2)]
+              for node, b in enumerate(bot_idx)]
+    step = np.concatenate(column).reshape(-1, 2)
+    values = [step + 1000 * i for i in range(len(times))]
+    write_selfe(filename, x, y, elements, depth, step_times, eta, values,
+                nlevels=3, bot_idx=bot_idx)
+    return filename
+
+
+def test_grid_from_header(tmpdir):
+    grid = UGrid.from_selfe(write_2d(tmpdir))
+
+    assert np.array_equal(grid.nodes, np.column_stack((x, y)))
+    assert grid.nodes.dtype == np.float64
+    assert np.array_equal(grid.faces, [[0, 1, 2], [0, 2, 3]])
+    assert grid.faces.dtype == np.int32
+    assert np.array_equal(grid.data['depth'].data, depth)
+    assert grid.data['depth'].attributes['units'] == 'm'
+
+
+def test_read_2d(tmpdir):
+    output = SelfeOutput(write_2d(tmpdir))
+
+    assert output.variable_name == 'elev'
+    assert output.flag_dm == 2
+    assert output.num_steps == 3
+    assert output.step_size == 8 + 4 * 4 + 4 * 4
+    assert np.array_equal(output.time, times)
+    assert np.array_equal(output.iteration, [1, 2, 3])
+    assert np.array_equal(output.eta, eta)
+    assert output.data.shape == (3, 4, 1, 1)
+    assert np.array_equal(output.data[:, :, 0, 0], eta)
+
+
+def test_read_3d(tmpdir):
+    output = SelfeOutput(write_3d(tmpdir))
+
+    assert output.flag_sv == 2
+    assert output.grid_size == 12
+    data = output.data
+    assert data.shape == (3, 4, 3, 2)
+    assert data[2, 3, 1, 0] == 2000 + 300 + 10
+    assert data[0, 1, 2, 1] == 100 + 20 + 1
+
+
+def test_views_are_memory_mapped(tmpdir):
+    output = SelfeOutput(write_3d(tmpdir))
+    data = output.data
+
+    ## a strided view of the file -- nothing copied
+    assert isinstance(output.records, np.memmap)
+    assert not data.flags.owndata
+    assert data.strides[0] == output.step_size
+    assert np.may_share_memory(data[:, 2, :, 1], output.records)
+
+
+def test_ragged_3d(tmpdir):
+    output = SelfeOutput(write_3d(tmpdir, bot_idx=[1, 2, 3, 0]))
+
+    assert np.array_equal(output.level_counts, [3, 2, 1, 3])
+    assert output.values.shape == (3, 9, 2)
+    assert output.values[0, 3, 0] == 100 + 10
+    with pytest.raises(ValueError):
+        output.data
+
+
+def test_incomplete_file(tmpdir):
+    filename = write_2d(tmpdir)
+    with open(filename, 'rb+') as outfile:
+        outfile.seek(-5, 2)
+        outfile.truncate()
+    output = SelfeOutput(filename)
+
+    assert output.nsteps == 3
+    assert output.num_steps == 2
+
+
+def test_big_endian(tmpdir):
+    filename = str(tmpdir.join('1_elev.61'))
+    write_selfe(filename, x, y, elements, depth, times, eta,
+                [step.reshape(4, 1) for step in eta], byteorder='>')
+    output = SelfeOutput(filename, byteorder='>')
+
+    assert np.array_equal(output.eta, eta)
+
+
+def test_not_selfe(tmpdir):
+    filename = str(tmpdir.join('junk.61'))
+    with open(filename, 'wb') as outfile:
+        outfile.write(b'not a selfe file' * 10)
+    with pytest.raises(ValueError):
+        SelfeOutput(filename)
+
+
+def test_level_offsets(tmpdir):
+    output = SelfeOutput(write_3d(tmpdir, bot_idx=[1, 2, 3, 0]))
+
+    assert np.array_equal(output.level_offsets, [0, 3, 5, 6, 9])
+    assert np.array_equal(output.value_rows([0, 1, 1, 2, 3], [0, 0, 2, 2, 1]),
+                          [0, -1, 4, 5, 7])
+
+
+def test_file_offsets(tmpdir):
+    filename = write_3d(tmpdir, bot_idx=[1, 2, 3, 0])
+    output = SelfeOutput(filename)
+    offsets = output.file_offsets([[0], [2]], [1, 2, 3], 2, var=1)
+
+    assert offsets.shape == (2, 3)
+    with open(filename, 'rb') as infile:
+        for (step, node), offset in np.ndenumerate(offsets):
+            infile.seek(offset)
+            value = np.frombuffer(infile.read(4), dtype='<f4')[0]
+            assert value == 1000 * [0, 2][step] + 100 * [1, 2, 3][node] + 20 + 1
+    assert output.file_offsets(0, 1, 0) == -1
+
+
+def test_read_profiles(tmpdir):
+    output = SelfeOutput(write_3d(tmpdir, bot_idx=[1, 2, 3, 0]))
+    profiles = output.read_profiles([2, 0], steps=slice(1, 3))
+
+    assert profiles.shape == (2, 2, 3, 2)
+    assert np.isnan(profiles[:, 0, :2]).all()
+    assert np.array_equal(profiles[:, 0, 2, 1], [1221, 2221])
+    assert np.array_equal(profiles[1, 1, :, 0], [2000, 2010, 2020])
+
+    profile = output.read_profiles(1, levels=[2], steps=0)
+    assert profile.shape == (1, 1, 2)
+    assert np.array_equal(profile[0, 0], [120, 121])
+
+
+def test_profiles_match_data(tmpdir):
+    output = SelfeOutput(write_3d(tmpdir))
+
+    assert np.array_equal(output.read_profiles([3, 1]), output.data[:, [3, 1]])
+
+
+def test_bad_indexes(tmpdir):
+    output = SelfeOutput(write_3d(tmpdir))
+
+    with pytest.raises(ValueError):
+        output.value_rows([4], [0])
+    with pytest.raises(ValueError):
+        output.value_rows([0], [3])
+    with pytest.raises(ValueError):
+        output.file_offsets(0, 0, 0, var=2)
+
+
+def test_find_parent_elements(tmpdir):
+    output = SelfeOutput(write_2d(tmpdir))
+    xy = np.array([(0.75, 0.25), (0.25, 0.75), (2.0, 2.0), (0.5, 0.5)])
+    parent, arco, node3 = output.find_parent_elements(xy)
+
+    assert parent[0] == 0 and parent[1] == 1 and parent[2] == -1
+    assert np.array_equal(node3[:2], [[0, 1, 2], [0, 2, 3]])
+    assert np.array_equal(node3[2], [-1, -1, -1])
+    assert np.allclose(arco[0], [0.25, 0.5, 0.25])
+    assert (arco[2] == 0).all()
+    ## interpolating the depth
+    dp = (output.dp[node3[[0, 1, 3]]] * arco[[0, 1, 3]]).sum(axis=1)
+    assert np.allclose(dp, [11.0, 12.0, 11.0])
+
+
+def write_series(tmpdir, num_files=4):
+    for i in range(num_files):
+        filename = str(tmpdir.join('%i_salt.63' % (i + 1)))
+        values = [np.arange(24, dtype=np.float32).reshape(12, 2) + 100 * (3 * i + step)
+                  for step in range(3)]
+        write_selfe(filename, x, y, elements, depth, times + 2700 * i, eta + i, values,
+                    nlevels=3)
+    return series_filenames(str(tmpdir), 'salt.63', num_files)
+
+
+def test_series_filenames():
+    assert series_filenames('run', 'elev.61', 2, start=3) == [os.path.join('run', '3_elev.61'),
+                                                            os.path.join('run', '4_elev.61')]
+
+
+def test_read_time_series(tmpdir):
+    filenames = write_series(tmpdir)
+    series = read_time_series(filenames, nodes=[3, 1], levels=[0, 2], workers=3)
+
+    assert series.valid.all()
+    assert series.errors == {}
+    assert np.array_equal(series.time.ravel(), 900.0 * np.arange(1, 13))
+    assert np.array_equal(series.iteration[1], [4, 5, 6])
+    assert np.allclose(series.eta[2, 1], eta[1, [3, 1]] + 2)
+    assert series.data.shape == (4, 3, 2, 2, 2)
+    ## node 3, level 2, component 1 of the 2nd step of the 4th file
+    assert series.data[3, 1, 0, 1, 1] == 100 * 10 + 3 * 6 + 2 * 2 + 1
+    assert np.array_equal(series.depth, [13.0, 11.0])
+
+
+def test_read_time_series_workers(tmpdir):
+    filenames = write_series(tmpdir)
+    os.remove(filenames[1])
+    with open(filenames[2], 'rb+') as outfile:
+        outfile.seek(-4, 2)
+        outfile.truncate()
+    series = read_time_series(filenames, levels=[0, 2], workers=3, errors='report')
+    expected = read_time_series(filenames, levels=[0, 2], workers=1, errors='report')
+
+    assert series.errors == expected.errors
+    assert sorted(series.errors) == filenames[1:3]
+    assert np.array_equal(series.valid, expected.valid)
+    for attr in ('time', 'iteration', 'eta', 'data', 'depth'):
+        assert np.array_equal(getattr(series, attr), getattr(expected, attr), equal_nan=True)
+
+
+def test_read_time_series_xy(tmpdir):
+    filenames = write_series(tmpdir, 2)
+    series = read_time_series(filenames, xy=[(0.75, 0.25), (5.0, 5.0)], levels=[1])
+    expected = read_time_series(filenames, nodes=[0, 1, 2], levels=[1])
+
+    assert series.eta.shape == (2, 3, 2)
+    assert np.allclose(series.eta[..., 0], np.dot(expected.eta, [0.25, 0.5, 0.25]))
+    assert np.allclose(series.data[:, :, 0], np.tensordot(expected.data, [0.25, 0.5, 0.25],
+                                                          axes=([2], [0])))
+    assert np.allclose(series.depth[0], 11.0)
+    assert np.isnan(series.eta[..., 1]).all()
+
+
+def test_missing_and_bad_files(tmpdir):
+    filenames = write_series(tmpdir)
+    os.remove(filenames[1])
+    with open(filenames[2], 'rb+') as outfile:
+        outfile.seek(-4, 2)
+        outfile.truncate()
+    with pytest.raises(ValueError) as err:
+        read_time_series(filenames)
+    assert filenames[1] in str(err.value) and filenames[2] in str(err.value)
+
+    series = read_time_series(filenames, errors='report')
+    assert sorted(series.errors) == filenames[1:3]
+    assert "2 of 3" in series.errors[filenames[2]]
+    assert np.array_equal(series.valid, [[1, 1, 1], [0, 0, 0], [1, 1, 0], [1, 1, 1]])
+    assert np.isnan(series.data[1]).all()
+    assert np.isnan(series.time[2, 2])
+    assert series.iteration[1, 0] == -1
+
+
+def test_incompatible_file(tmpdir):
+    filenames = write_series(tmpdir, 2)
+    write_2d(tmpdir, '2_salt.63')
+    series = read_time_series(filenames, errors='report')
+
+    assert list(series.errors) == [filenames[1]]
+    assert series.valid[0].all()
+
+
+def test_convert_to_netcdf(tmpdir):
+    filenames = write_series(tmpdir, 2)
+    bot_idx = [1, 2, 3, 0]
+    hvel = []
+    for i in range(2):
+        hvel.append(write_3d(tmpdir, bot_idx=bot_idx, name='%i_hvel.64' % (i + 1),
+                             step_times=times + 2700 * i))
+    filepath = str(tmpdir.join('run.nc'))
+    num = convert_to_netcdf({'salt': filenames, 'hvel': hvel}, filepath,
+                            complevel=4, chunk_steps=2)
+
+    assert num == 6
+    grid = UGrid.from_ncfile(filepath, load_data=True)
+    assert np.array_equal(grid.faces, [[0, 1, 2], [0, 2, 3]])
+    assert np.array_equal(grid.data['depth'].data, depth)
+    assert sorted(grid.data) == ['depth', 'eta', 'hvel_u', 'hvel_v', 'salt_u', 'salt_v']
+    salt = grid.data['salt_u']
+    assert np.array_equal(salt.time, 900.0 * np.arange(1, 7))
+    assert salt.data.shape == (6, 3, 4)
+    ## 4th step (2nd file), node 2, top level
+    assert salt.data[4, 2, 2] == 100 * 4 + 2 * 6 + 2 * 2
+    ## eta is from the first variable: hvel
+    assert np.allclose(grid.data['eta'].data[4], eta[1])
+    hvel_v = grid.data['hvel_v']
+    assert hvel_v.attributes['standard_name'] == 'northward_sea_water_velocity'
+    assert np.isnan(hvel_v.data[:, :2, 2]).all()
+    assert np.array_equal(hvel_v.data[4, :, 3], [1301, 1311, 1321])
+    assert np.array_equal(hvel_v.data[1, 1:, 1], [1111, 1121])
+
+    import netCDF4
+    with netCDF4.Dataset(filepath) as nc:
+        assert nc.variables['time'].units == 'seconds since 2000-01-01'
+        assert nc.variables['salt_u'].filters()['zlib']
+        assert nc.variables['salt_u'].chunking() == [2, 3, 4]
+
+
+def test_convert_single_variable(tmpdir):
+    filenames = [write_2d(tmpdir, '%i_elev.61' % i) for i in (1, 2)]
+    filepath = str(tmpdir.join('elev.nc'))
+    convert_to_netcdf(filenames, filepath, time_units='seconds since 2001-01-01')
+    grid = UGrid.from_ncfile(filepath, load_data=True)
+
+    assert sorted(grid.data) == ['depth', 'elev']
+    assert grid.data['elev'].data.shape == (6, 4)
+    assert np.array_equal(grid.data['elev'].data[3:], eta)
+
+
+def test_convert_checks_files_first(tmpdir):
+    filenames = write_series(tmpdir, 3)
+    os.remove(filenames[1])
+    filepath = str(tmpdir.join('run.nc'))
+    with pytest.raises(ValueError) as err:
+        convert_to_netcdf(filenames, filepath)
+
+    assert filenames[1] in str(err.value)
+    assert not os.path.exists(filepath)
+
+
+def test_convert_checks_times(tmpdir):
+    filenames = write_series(tmpdir, 2)
+    hvel = [write_3d(tmpdir, name='%i_hvel.64' % (i + 1)) for i in range(2)]
+    with pytest.raises(ValueError) as err:
+        convert_to_netcdf({'salt': filenames, 'hvel': hvel}, str(tmpdir.join('run.nc')))
+
+    assert filenames[1] in str(err.value) and 'times' in str(err.value)
+
+
+def test_convert_checks_vertical_layout(tmpdir):
+    filenames = write_series(tmpdir, 2)
+    hvel = [write_3d(tmpdir, bot_idx=bot_idx, name='%i_hvel.64' % (i + 1),
+                     step_times=times + 2700 * i)
+            for i, bot_idx in enumerate(([1, 2, 3, 0], [1, 1, 1, 1]))]
+    filepath = str(tmpdir.join('run.nc'))
+    with pytest.raises(ValueError) as err:
+        convert_to_netcdf({'salt': filenames, 'hvel': hvel}, filepath)
+
+    assert hvel[1] in str(err.value) and filenames[1] not in str(err.value)
+    assert not os.path.exists(filepath)
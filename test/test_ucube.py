@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+"""
+Tests for the UCube lazy data cube
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import numpy as np
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.write_netcdf import TimeSeriesWriter
+from pyugrid.ucube import UCube
+from pyugrid.lazy_array import LazyArray, expand_key
+from pyugrid.test_examples import twenty_one_triangles
+
+
+class CountingArray(LazyArray):
+    """
+    a lazy array that keeps track of how many values have been read
+    -- and, like a netCDF variable, indexes arrays orthogonally
+    """
+    def __init__(self, data):
+        self.data = data
+        self.shape = data.shape
+        self.dtype = data.dtype
+        self.keys = []
+        self.values_read = 0
+
+    def __getitem__(self, key):
+        key = expand_key(key, self.ndim)
+        for index in key:
+            if isinstance(index, np.ndarray):
+                assert (np.diff(index) > 0).all(), "indexes must be sorted and unique"
+        self.keys.append(key)
+        result = self.data
+        for axis, index in enumerate(key):
+            result = result[(slice(None),) * axis + (index,)]
+        self.values_read += result.size
+        return result
+
+
+def make_cube(storage=np.asarray):
+    grid = twenty_one_triangles()
+    num_nodes = len(grid.nodes)
+    data = (np.arange(5)[:, None, None] * 1000 +
+            np.arange(3)[None, :, None] * 100 +
+            np.arange(num_nodes)[None, None, :]).astype(np.float32)
+    time = np.arange(5) * 3600.0
+    return UCube(grid, storage(data), 'node', time=time, levels=[-1.0, -0.5, 0.0],
+                 name='salt', attributes={'units': '1e-3'}), data
+
+
+def test_dims():
+    cube, data = make_cube()
+
+    assert cube.dims == ('time', 'level', 'node')
+    assert cube.shape == data.shape
+    assert cube.dtype == np.float32
+    assert np.array_equal(np.asarray(cube), data)
+
+
+def test_no_time_or_level():
+    grid = twenty_one_triangles()
+    cube = UCube(grid, np.arange(len(grid.nodes)))
+    assert cube.dims == ('node',)
+    assert cube.time is None
+
+    cube = UCube(grid, np.zeros((2, len(grid.nodes))))
+    assert cube.dims == ('level', 'node')
+    with pytest.raises(ValueError):
+        cube.sel_time(0, 1)
+
+
+def test_bad_shapes():
+    grid = twenty_one_triangles()
+    with pytest.raises(ValueError):
+        UCube(grid, np.zeros((3, 5)))
+    with pytest.raises(ValueError):
+        UCube(grid, np.zeros((3, len(grid.nodes))), time=[0, 1])
+    with pytest.raises(ValueError):
+        UCube(grid, np.zeros((len(grid.nodes),)), levels=[0, 1])
+
+
+def test_isel_is_lazy():
+    cube, data = make_cube(CountingArray)
+    storage = cube._storage
+    sub = cube.isel(time=slice(1, 4), level=2, location=[5, 2, 9])
+
+    assert storage.values_read == 0
+    assert sub.shape == (3, 1, 3)
+    assert np.array_equal(sub.time, [3600, 7200, 10800])
+    assert np.array_equal(sub.levels, [0.0])
+    assert np.array_equal(np.asarray(sub), data[1:4, 2:3][:, :, [5, 2, 9]])
+    assert storage.values_read == 9
+
+
+def test_nested_selection():
+    cube, data = make_cube()
+    sub = cube.isel(time=[4, 0, 2]).isel(time=slice(1, None), location=slice(None, None, 2))
+
+    assert np.array_equal(sub.time, [0, 7200])
+    assert np.array_equal(sub[...], data[[0, 2]][:, :, ::2])
+    assert np.array_equal(sub[1, 0], data[2, 0, ::2])
+    assert np.array_equal(sub[:, :, -1], data[[0, 2], :, 18])
+
+
+@pytest.mark.parametrize('storage', [np.asarray, CountingArray])
+def test_getitem(storage):
+    cube, data = make_cube(storage)
+
+    assert cube[2, 1, 7] == data[2, 1, 7]
+    assert np.array_equal(cube[::-1, 1], data[::-1, 1])
+    assert np.array_equal(cube[[3, 1], :, [4, 4, 0]], data[[3, 1]][:, :, [4, 4, 0]])
+    assert np.array_equal(cube[..., 3], data[..., 3])
+
+
+def test_sel_time():
+    cube, data = make_cube()
+    sub = cube.sel_time(3600, 7200)
+
+    assert np.array_equal(sub.time, [3600, 7200])
+    assert np.array_equal(sub[:], data[1:3])
+    assert cube.sel_time(start=10000).shape[0] == 2
+
+
+def test_sel_bbox():
+    cube, data = make_cube()
+    grid = cube.grid
+    bbox = (5, 0, 15, 15)
+    sub = cube.sel_bbox(bbox)
+    x, y = grid.nodes[:, 0], grid.nodes[:, 1]
+    inside = np.flatnonzero((x >= 5) & (x <= 15) & (y >= 0) & (y <= 15))
+
+    assert 0 < len(inside) < len(x)
+    assert np.array_equal(sub.location_indexes, inside)
+    assert np.array_equal(sub.location_coordinates(), grid.nodes[inside])
+    assert np.array_equal(sub[:], data[:, :, inside])
+
+
+def test_face_cube_bbox():
+    grid = twenty_one_triangles()
+    data = np.arange(len(grid.faces), dtype=np.float64)
+    cube = UCube(grid, data, 'face')
+    sub = cube.sel_bbox((-100, -100, 100, 100))
+
+    assert sub.shape == (len(grid.faces),)
+    centroids = grid.nodes[grid.faces].mean(axis=1)
+    assert np.allclose(cube.location_coordinates(), centroids)
+
+
+def test_iter_time():
+    cube, data = make_cube(CountingArray)
+    blocks = list(cube.isel(location=[1, 2]).iter_time(chunk=2))
+
+    assert [len(times) for times, block in blocks] == [2, 2, 1]
+    assert np.array_equal(np.concatenate([block for times, block in blocks]), data[:, :, 1:3])
+    assert cube._storage.values_read == data[:, :, 1:3].size
+
+
+def test_iter_time_default_chunk():
+    cube, data = make_cube()
+
+    blocks = list(cube.iter_time(prefetch=False))
+    assert len(blocks) == 1
+    cube.chunk_steps = 3
+    assert [len(t) for t, b in cube.iter_time()] == [3, 2]
+
+
+def test_dataset_round_trip():
+    cube, data = make_cube()
+    grid = cube.grid
+    ds = cube.to_dataset()
+
+    assert ds.data is cube
+    assert ds.name == 'salt'
+    grid.add_data(ds)
+    again = UCube.from_dataset(grid, 'salt')
+    assert np.array_equal(again[:], data)
+    with pytest.raises(ValueError) as err:
+        cube.isel(location=[1, 2]).to_dataset()
+    assert 'subset' in str(err.value)
+
+
+def test_dataset_location_array():
+    cube, data = make_cube()
+    num_nodes = len(cube.grid.nodes)
+
+    ds = cube.isel(time=[0, 2], location=np.arange(num_nodes)).to_dataset()
+    assert np.array_equal(ds.data[:], data[[0, 2]])
+    with pytest.raises(ValueError) as err:
+        cube.isel(location=np.arange(num_nodes)[::-1]).to_dataset()
+    assert 'subset' in str(err.value)
+
+
+def test_netcdf_variable(tmpdir):
+    cube, data = make_cube()
+    grid = cube.grid
+    filepath = str(tmpdir.join('cube.nc'))
+    with TimeSeriesWriter(filepath, grid, [DataSet('salt', data=data[0])],
+                          encoding={'salt': {'chunksizes': (2,)}}) as writer:
+        for t, step in zip(cube.time, data):
+            writer.append(t, {'salt': step})
+
+    import netCDF4
+    with netCDF4.Dataset(filepath) as nc:
+        var = nc.variables['salt']
+        cube = UCube(grid, var, time=nc.variables['time'][:])
+        assert cube.dims == ('time', 'level', 'node')
+        assert cube.chunk_steps == 2
+        sub = cube.isel(time=[3, 1], location=[8, 3, 3])
+        assert np.array_equal(sub[:], data[[3, 1]][:, :, [8, 3, 3]])
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+
+"""
+Tests for the bit-packed validity masks of DataSets (missing values, dry cells)
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+
+import numpy as np
+import pytest
+import netCDF4
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.ensemble import Ensemble
+from pyugrid.ucube import UCube
+from pyugrid.write_netcdf import TimeSeriesWriter
+from pyugrid.test_examples import two_triangles, twenty_one_triangles
+
+
+def wet_dry(num_times=12, num_nodes=20, seed=4):
+    rng = np.random.RandomState(seed)
+    data = rng.normal(1, 0.5, (num_times, num_nodes))
+    wet = rng.rand(num_times, num_nodes) > 0.3
+    return data, wet
+
+
+def test_no_mask():
+    ds = DataSet('depth', data=[1.0, 2.0, 3.0])
+
+    assert ds.valid_bits is None
+    assert ds.valid_mask() is None
+    assert ds.filled() is ds.data
+
+
+def test_packed():
+    data, wet = wet_dry()
+    ds = DataSet('zeta', data=data, time=np.arange(12), valid=wet)
+
+    ## one bit per value, per time step
+    assert ds.valid_bits.dtype == np.uint8
+    assert ds.valid_bits.shape == (12, 3)
+    assert np.array_equal(ds.valid_mask(), wet)
+    assert np.array_equal(ds.valid_mask(5), wet[5])
+    assert np.array_equal(ds.valid_mask(slice(2, 4)), wet[2:4])
+    ## the data is left alone
+    assert ds.data is data
+
+    filled = ds.filled(-99.0, index=3)
+    assert np.array_equal(filled, np.where(wet[3], data[3], -99.0))
+
+
+def test_set_valid_per_step():
+    data, wet = wet_dry()
+    ds = DataSet('zeta', data=data, time=np.arange(12))
+    ds.mark_clean()
+
+    ds.set_valid(wet[7], index=7)
+    assert ds.data_dirty
+    expected = np.ones_like(wet)
+    expected[7] = wet[7]
+    assert np.array_equal(ds.valid_mask(), expected)
+
+    ## a (location,) mask for all the steps
+    ds.set_valid(wet[0])
+    assert np.array_equal(ds.valid_mask(), np.broadcast_to(wet[0], wet.shape))
+
+    ds.set_valid(None)
+    assert ds.valid_bits is None
+    ## all valid is no mask at all
+    ds.set_valid(np.ones(20, dtype=bool))
+    assert ds.valid_bits is None
+
+
+def test_masked_array():
+    data, wet = wet_dry()
+    masked = np.ma.MaskedArray(data, mask=~wet)
+    ds = DataSet('zeta', data=masked, time=np.arange(12))
+
+    assert type(ds.data) is np.ndarray
+    assert np.array_equal(ds.valid_mask(), wet)
+
+    ## no masked values -- no mask
+    ds.data = np.ma.MaskedArray(data)
+    assert ds.valid_bits is None
+
+    ## in-place changes keep the mask
+    ds.set_valid(wet)
+    ds.data *= 2
+    assert np.array_equal(ds.valid_mask(), wet)
+    ## new data doesn't
+    ds.data = data
+    assert ds.valid_bits is None
+
+
+def test_reductions():
+    data, wet = wet_dry()
+    ds = DataSet('zeta', data=data, time=np.arange(12) * 3600.0, valid=wet)
+
+    results = ds.reduce_time(['mean', 'count', 'max'], thresholds=[1.0],
+                             percentiles=[100], chunk=5)
+    expected = np.where(wet, data, np.nan)
+    assert np.array_equal(results['count'].data, wet.sum(axis=0))
+    assert np.allclose(results['mean'].data, np.nanmean(expected, axis=0))
+    assert np.allclose(results['max'].data, np.nanmax(expected, axis=0))
+    assert np.array_equal(results['gt_1'].data, (wet & (data > 1.0)).sum(axis=0))
+    assert np.allclose(results['p100'].data, np.nanmax(expected, axis=0))
+
+
+def test_ucube():
+    grid = twenty_one_triangles()
+    data, wet = wet_dry()
+    ds = DataSet('zeta', data=data, time=np.arange(12) * 3600.0, valid=wet)
+    cube = UCube.from_dataset(grid, ds)
+
+    block = cube[2:5]
+    assert isinstance(block, np.ma.MaskedArray)
+    assert np.array_equal(np.ma.getmaskarray(block), ~wet[2:5])
+    selected = cube.isel(time=[7, 1], location=[3, 0, 9])[:, 1]
+    assert np.array_equal(np.ma.getmaskarray(selected), ~wet[[7, 1]][:, 0])
+
+    cube_mean = cube.reduce_time(['mean'], chunk=5)['mean'].data
+    assert np.allclose(cube_mean, ds.reduce_time(['mean'])['mean'].data, equal_nan=True)
+    for times, block in cube.iter_time(chunk=5):
+        assert np.array_equal(np.ma.getmaskarray(block), ~wet[(times / 3600).astype(int)])
+
+    again = cube.isel(time=slice(3, 9)).to_dataset()
+    assert np.array_equal(again.valid_mask(), wet[3:9])
+
+
+def test_expression():
+    data, wet = wet_dry()
+    ds = DataSet('zeta', data=data, time=np.arange(12), valid=wet)
+    depth = DataSet('depth', data=np.full(20, 2.0), valid=np.arange(20) != 4)
+    total = ds + depth
+
+    block = total[3:6]
+    expected = ~(wet[3:6] & (np.arange(20) != 4))
+    assert np.array_equal(np.ma.getmaskarray(block), expected)
+    assert np.allclose(block.data, data[3:6] + 2.0)
+
+    result = total.to_dataset('total', chunk=5)
+    assert np.array_equal(result.valid_mask(), wet & (np.arange(20) != 4))
+    assert np.array_equal(result.data, data + 2.0)
+    # all valid: a plain array
+    assert not isinstance((DataSet('x', data=data) * 2)[0], np.ma.MaskedArray)
+
+
+def test_expression_shared_array():
+    # DataSets that share their data but not their masks
+    a = np.arange(4.0)
+    valid = DataSet('a', data=a)
+    masked = DataSet('b', data=a, valid=[1, 0, 1, 1])
+
+    for total in (valid + masked, masked + valid):
+        block = total[:]
+        assert np.array_equal(np.ma.getmaskarray(block), [0, 1, 0, 0])
+        assert np.array_equal(block.data, [0, 2, 4, 6])
+        assert np.array_equal(total.to_dataset('total').valid_mask(), [1, 0, 1, 1])
+
+
+def test_ensemble_statistics():
+    grids = []
+    for i in range(3):
+        grid = twenty_one_triangles()
+        data = np.arange(20.0) + i
+        valid = np.ones(20, dtype=bool)
+        valid[i] = False
+        grid.add_data(DataSet('zeta', data=data, valid=valid))
+        grids.append(grid)
+    ensemble = Ensemble.from_grids(grids)
+
+    stats = ensemble.statistics('zeta', ['mean'], thresholds=[0.5])
+    ## member 0 is missing at node 0: the mean of members 1 and 2
+    assert stats['mean'].data[0] == 1.5
+    assert stats['mean'].data[5] == 6.0
+    assert stats['prob_gt_0.5'].data[0] == 1.0
+
+
+def test_ensemble_members():
+    grids = []
+    for i in range(3):
+        grid = twenty_one_triangles()
+        grid.add_data(DataSet('zeta', data=np.arange(20.0), valid=np.arange(20) != i))
+        grids.append(grid)
+    ensemble = Ensemble.from_grids(grids)
+
+    for i, ds in enumerate(ensemble.member_data('zeta')):
+        assert np.array_equal(ds.valid_mask(), np.arange(20) != i)
+    member = ensemble.member(1)
+    assert np.array_equal(member.data['zeta'].valid_mask(), np.arange(20) != 1)
+
+
+def test_interpolate_nodes():
+    grid = two_triangles()
+    grid.add_data(DataSet('zeta', data=[[1.0, 2.0, 3.0, 4.0],
+                                        [1.0, 2.0, 3.0, 4.0]],
+                          time=[0, 1], valid=[[True, True, True, True],
+                                              [True, False, True, True]]))
+    ## the middle of the first triangle, and a point outside
+    points = [grid.nodes[[0, 1, 2]].mean(axis=0), (-5.0, -5.0)]
+
+    values = grid.interpolate('zeta', points)
+    assert values.shape == (2, 2)
+    assert np.isclose(values[0, 0], 2.0)
+    ## node 1 is dry at the second step: the others' average
+    assert np.isclose(values[1, 0], 2.0)
+    assert np.isnan(values[:, 1]).all()
+
+    ## next to the dry node, in the first triangle -- from the wet ones
+    point = 0.9 * grid.nodes[1] + 0.1 * grid.nodes[[0, 1, 2]].mean(axis=0)
+    step = grid.interpolate(grid.data['zeta'], [point], index=1)
+    assert step.shape == (1,)
+    assert np.isclose(step[0], 2.0)
+
+
+def test_interpolate_all_dry():
+    grid = two_triangles()
+    grid.add_data(DataSet('zeta', data=[1.0, 2.0, 3.0, 4.0],
+                          valid=[False, False, False, True]))
+
+    values = grid.interpolate('zeta', [grid.nodes[[0, 1, 2]].mean(axis=0)])
+    assert np.isnan(values[0])
+
+
+def test_interpolate_faces():
+    grid = two_triangles()
+    grid.add_data(DataSet('speed', location='face', data=[5.0, 7.0], valid=[True, False]))
+    points = [grid.nodes[[0, 1, 2]].mean(axis=0), grid.nodes[[1, 2, 3]].mean(axis=0)]
+
+    values = grid.interpolate('speed', points)
+    assert values[0] == 5.0
+    assert np.isnan(values[1])
+
+    with pytest.raises(ValueError):
+        grid.interpolate('not_there', points)
+
+
+def test_write_read(tmpdir):
+    filename = os.path.join(str(tmpdir), 'masked.nc')
+    grid = two_triangles()
+    grid.add_data(DataSet('depth', data=[1.0, 2.0, 3.0, 4.0], valid=[True, False, True, True]))
+    grid.add_data(DataSet('material', location='face', data=np.array([3, 4], dtype=np.int32),
+                          valid=[False, True]))
+    grid.save_as_netcdf(filename)
+
+    with netCDF4.Dataset(filename) as nc:
+        depth = nc.variables['depth'][:]
+        assert np.array_equal(np.ma.getmaskarray(depth), [False, True, False, False])
+
+    loaded = UGrid.from_ncfile(filename, load_data=True)
+    assert np.array_equal(loaded.data['depth'].valid_mask(), [True, False, True, True])
+    assert loaded.data['depth'].data[0] == 1.0
+    assert np.array_equal(loaded.data['material'].valid_mask(), [False, True])
+    assert loaded.data['material'].data[1] == 4
+
+
+def test_time_series_writer(tmpdir):
+    filename = os.path.join(str(tmpdir), 'wet_dry.nc')
+    data, wet = wet_dry(num_times=4, num_nodes=4)
+    grid = two_triangles()
+    template = DataSet('zeta', data=np.zeros(4))
+
+    with TimeSeriesWriter(filename, grid, [template]) as writer:
+        for i in range(2):
+            writer.append(i, [DataSet('zeta', data=data[i], valid=wet[i])])
+        for i in range(2, 4):
+            writer.append(i, {'zeta': np.ma.MaskedArray(data[i], mask=~wet[i])})
+
+    with netCDF4.Dataset(filename) as nc:
+        zeta = nc.variables['zeta'][:]
+    assert np.array_equal(~np.ma.getmaskarray(zeta), wet)
+    assert np.allclose(zeta[wet], data[wet])
@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+"""
+Tests for appending time steps to a netcdf file with TimeSeriesWriter
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import datetime
+
+import numpy as np
+import netCDF4
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.write_netcdf import TimeSeriesWriter
+from pyugrid.test_examples import two_triangles
+
+
+def make_writer(filename, **kwargs):
+    grid = two_triangles()
+    grid.add_data(DataSet('depth', location='node', data=[1.0, 2.0, 3.0, 4.0]))
+    variables = [DataSet('eta', location='node', attributes={'units': 'm'}),
+                 DataSet('u', location='face', data=np.zeros((2,), dtype=np.float32)),
+                 DataSet('temp', location='node', data=np.zeros((3, 4))),
+                 ]
+    return TimeSeriesWriter(filename, grid, variables, time_units='hours since 2015-01-01',
+                            **kwargs)
+
+
+def records(t):
+    return {'eta': 10 * t + np.arange(4.0),
+            'u': np.array([t, -t], dtype=np.float32),
+            'temp': t + np.arange(12.0).reshape(3, 4),
+            }
+
+
+def test_append(tmpdir):
+    filename = str(tmpdir.join('series.nc'))
+    with make_writer(filename, buffer_steps=2) as writer:
+        for t in range(5):
+            writer.append(t, records(t))
+        assert writer.num_written == 4
+        assert writer.num_times == 5
+
+    grid = UGrid.from_ncfile(filename, load_data=True)
+
+    assert grid.faces.shape == (2, 3)
+    assert np.array_equal(grid.data['depth'].data, [1.0, 2.0, 3.0, 4.0])
+    eta = grid.data['eta']
+    assert np.array_equal(eta.time, np.arange(5))
+    assert np.array_equal(eta.data, [records(t)['eta'] for t in range(5)])
+    assert eta.attributes['units'] == 'm'
+    assert grid.data['u'].data.dtype == np.float32
+    assert grid.data['temp'].data.shape == (5, 3, 4)
+    assert np.array_equal(grid.data['temp'].data[3], records(3)['temp'])
+
+
+def test_flushes(tmpdir):
+    """
+    the buffered steps are in the file before it is closed
+    """
+    filename = str(tmpdir.join('series.nc'))
+    writer = make_writer(filename, buffer_steps=3)
+    for t in range(4):
+        writer.append(t, records(t))
+
+    with netCDF4.Dataset(filename) as nc:
+        assert len(nc.dimensions['time']) == 3
+        assert nc.dimensions['time'].isunlimited()
+        assert nc.variables['temp'].dimensions == ('time', 'mesh_num_layer', 'mesh_num_node')
+        assert nc.variables['temp'].chunking() == [1, 3, 4]
+
+    writer.close()
+    with netCDF4.Dataset(filename) as nc:
+        assert len(nc.dimensions['time']) == 4
+
+
+def test_datetime(tmpdir):
+    filename = str(tmpdir.join('series.nc'))
+    with make_writer(filename) as writer:
+        writer.append(datetime.datetime(2015, 1, 2), records(0))
+
+    with netCDF4.Dataset(filename) as nc:
+        assert nc.variables['time'][0] == 24
+
+
+def test_datasets(tmpdir):
+    filename = str(tmpdir.join('series.nc'))
+    with make_writer(filename) as writer:
+        writer.append(0, [DataSet(name, location='node', data=data)
+                          for name, data in records(1).items()])
+
+    grid = UGrid.from_ncfile(filename, load_data=True)
+    assert np.array_equal(grid.data['eta'].data[0], records(1)['eta'])
+
+
+def test_save_loaded_series(tmpdir):
+    """
+    time-varying data loaded from a file can be saved again
+    """
+    filename = str(tmpdir.join('series.nc'))
+    with make_writer(filename) as writer:
+        for t in range(3):
+            writer.append(t, records(t))
+    grid = UGrid.from_ncfile(filename, load_data=True)
+    grid.data['temp'].set_valid(False, index=(1, 0))
+
+    copy = str(tmpdir.join('copy.nc'))
+    grid.save_as_netcdf(copy)
+    again = UGrid.from_ncfile(copy, load_data=True)
+
+    assert np.array_equal(again.data['depth'].data, [1.0, 2.0, 3.0, 4.0])
+    assert again.data['depth'].time is None
+    for name in ('eta', 'u', 'temp'):
+        assert np.array_equal(again.data[name].time, np.arange(3))
+        assert again.data[name].data.shape == grid.data[name].data.shape
+    assert np.array_equal(again.data['eta'].data, grid.data['eta'].data)
+    assert again.data['u'].data.dtype == np.float32
+    temp = again.data['temp']
+    assert np.array_equal(temp.valid_mask()[1], [[False] * 4, [True] * 4, [True] * 4])
+    assert np.array_equal(temp.data[2], records(2)['temp'])
+    with netCDF4.Dataset(copy) as nc:
+        assert nc.variables['temp'].dimensions == ('time', 'mesh_num_layer', 'mesh_num_node')
+        assert nc.dimensions['time'].isunlimited()
+
+
+def test_save_mismatched_times(tmpdir):
+    grid = two_triangles()
+    grid.add_data(DataSet('eta', location='node', data=np.zeros((3, 4)), time=[0, 1, 2]))
+    grid.add_data(DataSet('u', location='face', data=np.zeros((2, 2)), time=[0, 5]))
+    with pytest.raises(ValueError):
+        grid.save_as_netcdf(str(tmpdir.join('bad.nc')))
+
+    grid = two_triangles()
+    grid.add_data(DataSet('eta', location='node', data=np.zeros((4,)), time=[0]))
+    with pytest.raises(ValueError):
+        grid.save_as_netcdf(str(tmpdir.join('bad.nc')))
+
+
+def test_missing_variable(tmpdir):
+    with make_writer(str(tmpdir.join('series.nc'))) as writer:
+        data = records(0)
+        del data['u']
+        with pytest.raises(ValueError):
+            writer.append(0, data)
+
+
+def test_wrong_shape(tmpdir):
+    with make_writer(str(tmpdir.join('series.nc'))) as writer:
+        data = records(0)
+        data['temp'] = np.zeros((2, 4))
+        with pytest.raises(ValueError):
+            writer.append(0, data)
+        # nothing was buffered
+        assert writer.num_times == 0
+
+
+def test_mismatched_template(tmpdir):
+    with pytest.raises(ValueError):
+        TimeSeriesWriter(str(tmpdir.join('series.nc')), two_triangles(),
+                         [DataSet('eta', location='node', data=np.zeros((3,)))])
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+
+"""
+Tests for writing VTK unstructured grid (.vtu) and collection (.pvd) files
+
+designed to be run with pytest
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+
+from pyugrid.ugrid import UGrid, DataSet
+from pyugrid.write_vtk import PVDWriter
+from pyugrid.test_examples import twenty_one_triangles, two_triangles
+
+
+def read_vtu(filename):
+    """
+    a minimal reader for the appended raw binary .vtu files
+
+    returns {section: {name: array}}
+    """
+    with open(filename, 'rb') as infile:
+        contents = infile.read()
+    start = contents.index(b'<AppendedData')
+    binary = contents[contents.index(b'_', start) + 1:]
+    tree = ET.fromstring(contents[:start] + b'</VTKFile>')
+    assert tree.get('header_type') == 'UInt64'
+    piece = tree.find('UnstructuredGrid/Piece')
+
+    types = {'Float32': '<f4', 'Float64': '<f8', 'Int32': '<i4', 'Int64': '<i8',
+             'UInt8': '<u1', 'UInt16': '<u2', 'Int8': '<i1'}
+    result = {'NumberOfPoints': int(piece.get('NumberOfPoints')),
+              'NumberOfCells': int(piece.get('NumberOfCells'))}
+    for section in piece:
+        arrays = result.setdefault(section.tag, {})
+        for array in section:
+            offset = int(array.get('offset'))
+            nbytes = int(np.frombuffer(binary[offset:offset + 8], dtype='<u8')[0])
+            values = np.frombuffer(binary[offset + 8:offset + 8 + nbytes], dtype=types[array.get('type')])
+            components = int(array.get('NumberOfComponents'))
+            if components > 1:
+                values = values.reshape(-1, components)
+            arrays[array.get('Name')] = values
+    return result
+
+
+def test_save_as_vtu(tmpdir):
+    grid = twenty_one_triangles()
+    grid.add_data(DataSet('depth', location='node', data=np.arange(20.0)))
+    grid.add_data(DataSet('u', location='face', data=np.arange(21, dtype=np.float32)))
+    grid.add_data(DataSet('edge_thing', location='edge', data=np.zeros(len(grid.edges))))
+    filename = str(tmpdir.join('grid.vtu'))
+
+    grid.save_as_vtu(filename)
+
+    vtu = read_vtu(filename)
+    assert vtu['NumberOfPoints'] == 20
+    assert vtu['NumberOfCells'] == 21
+    points = vtu['Points']['Points']
+    assert np.array_equal(points[:, :2], grid.nodes)
+    assert np.all(points[:, 2] == 0)
+    cells = vtu['Cells']
+    assert np.array_equal(cells['connectivity'], grid.faces.ravel())
+    assert np.array_equal(cells['offsets'], np.arange(1, 22) * 3)
+    assert np.all(cells['types'] == 5)
+    assert np.array_equal(vtu['PointData']['depth'], np.arange(20.0))
+    assert vtu['CellData']['u'].dtype == np.float32
+    assert np.array_equal(vtu['CellData']['u'], np.arange(21))
+    assert 'edge_thing' not in vtu['CellData']
+
+
+def test_mixed_faces(tmpdir):
+    nodes = [(0, 0), (1, 0), (2, 0), (0, 1), (1, 1), (2, 1)]
+    faces = [(0, 1, 4, 3), (1, 2, 5, -1)]
+    grid = UGrid(nodes, faces)
+    filename = str(tmpdir.join('mixed.vtu'))
+
+    grid.save_as_vtu(filename)
+
+    cells = read_vtu(filename)['Cells']
+    assert np.array_equal(cells['connectivity'], [0, 1, 4, 3, 1, 2, 5])
+    assert np.array_equal(cells['offsets'], [4, 7])
+    assert np.array_equal(cells['types'], [9, 5])
+
+
+def test_layers(tmpdir):
+    grid = two_triangles()
+    temp = np.arange(12.0).reshape(3, 4)
+    grid.add_data(DataSet('temp', location='node', data=temp))
+    filename = str(tmpdir.join('layers.vtu'))
+
+    grid.save_as_vtu(filename, datasets=['temp'])
+
+    assert np.array_equal(read_vtu(filename)['PointData']['temp'], temp.T)
+
+
+def test_time_index(tmpdir):
+    grid = two_triangles()
+    grid.add_data(DataSet('eta', location='node', data=np.arange(8.0).reshape(2, 4),
+                          time=[0.0, 10.0]))
+    filename = str(tmpdir.join('step.vtu'))
+
+    with pytest.raises(ValueError):
+        grid.save_as_vtu(filename, datasets=['eta'])
+    grid.save_as_vtu(filename, time_index=1)
+
+    assert np.array_equal(read_vtu(filename)['PointData']['eta'], [4.0, 5.0, 6.0, 7.0])
+
+
+def test_missing_values(tmpdir):
+    grid = two_triangles()
+    eta = DataSet('eta', location='node', data=np.arange(8.0).reshape(2, 4), time=[0.0, 10.0])
+    eta.set_valid([True, False, True, True], index=1)
+    grid.add_data(eta)
+    filename = str(tmpdir.join('dry.vtu'))
+
+    grid.save_as_vtu(filename, time_index=1)
+
+    values = read_vtu(filename)['PointData']['eta']
+    assert np.isnan(values[1])
+    assert np.array_equal(values[[0, 2, 3]], [4.0, 6.0, 7.0])
+
+
+def test_pvd_writer(tmpdir):
+    grid = two_triangles()
+    filename = str(tmpdir.join('series.pvd'))
+
+    with PVDWriter(filename, grid) as writer:
+        for t in range(3):
+            writer.append(t * 60, [DataSet('eta', data=np.ones(4) * t)])
+            # the collection is valid after every step
+            collection = ET.parse(filename).getroot().find('Collection')
+            assert len(collection) == t + 1
+
+    steps = ET.parse(filename).getroot().find('Collection')
+    assert [float(step.get('timestep')) for step in steps] == [0, 60, 120]
+    last = read_vtu(os.path.join(str(tmpdir), steps[-1].get('file')))
+    assert np.array_equal(last['PointData']['eta'], [2.0] * 4)
+
+
+def test_save_as_pvd(tmpdir):
+    grid = two_triangles()
+    grid.add_data(DataSet('eta', location='node', data=np.arange(12.0).reshape(3, 4),
+                          time=[0.0, 1.0, 2.0]))
+    grid.add_data(DataSet('depth', location='node', data=[1.0, 2.0, 3.0, 4.0]))
+    filename = str(tmpdir.join('series.pvd'))
+
+    grid.save_as_pvd(filename)
+
+    steps = ET.parse(filename).getroot().find('Collection')
+    assert len(steps) == 3
+    vtu = read_vtu(os.path.join(str(tmpdir), steps[1].get('file')))
+    assert np.array_equal(vtu['PointData']['eta'], [4.0, 5.0, 6.0, 7.0])
+    assert np.array_equal(vtu['PointData']['depth'], [1.0, 2.0, 3.0, 4.0])
+
+
+def test_bad_dataset(tmpdir):
+    grid = twenty_one_triangles()
+    grid.add_data(DataSet('edge_thing', location='edge', data=np.zeros(len(grid.edges))))
+
+    with pytest.raises(ValueError):
+        grid.save_as_vtu(str(tmpdir.join('grid.vtu')), datasets=['edge_thing'])
+    with pytest.raises(ValueError):
+        grid.save_as_vtu(str(tmpdir.join('grid.vtu')), datasets=['not_there'])
@@ -20,4 +20,46 @@ def chdir(dirname=None):
 
 def get_test_file_path(file_path):
     """translates a file path to be relative to the test files directory"""
-    return os.path.join(os.path.dirname(__file__), 'files', file_path)
\ No newline at end of file
+    return os.path.join(os.path.dirname(__file__), 'files', file_path)
+
+def write_selfe(filename, x, y, elements, depth, times, eta, values,
+                nlevels=1, bot_idx=None, byteorder='<'):
+    """
+    write a SELFE v5 binary output file, for testing the reader
+
+    elements are 1-based triangles. values is a list of the (grid_size, ivs)
+    values of each step: 2D if nlevels is 1, 3D otherwise.
+    """
+    import numpy as np
+
+    int_dt = byteorder + 'i4'
+    float_dt = byteorder + 'f4'
+    num_nodes = len(x)
+    if bot_idx is None:
+        bot_idx = np.ones((num_nodes,), dtype=np.int32)
+    ivs = np.asarray(values[0]).shape[-1]
+
+    def string(s):
+        return s.encode('ascii').ljust(48)
+
+    with open(filename, 'wb') as outfile:
+        for s in ('DataFormat v5.0', 'test', '2000-01-01', 'salt', '3D' if nlevels > 1 else '2D'):
+            outfile.write(string(s))
+        outfile.write(np.array([len(times)], dtype=int_dt).tobytes())
+        outfile.write(np.array([900.0], dtype=float_dt).tobytes())
+        outfile.write(np.array([1, ivs, 3 if nlevels > 1 else 2, nlevels, 1], dtype=int_dt).tobytes())
+        outfile.write(np.array([1.0, 100.0, 5.0, 0.5, 1.0], dtype=float_dt).tobytes())
+        outfile.write(np.array([-100.0], dtype=float_dt).tobytes())
+        outfile.write(np.linspace(-1, 0, nlevels - 1).astype(float_dt).tobytes())
+        outfile.write(np.array([num_nodes, len(elements)], dtype=int_dt).tobytes())
+        nodes = np.zeros((num_nodes,), dtype=[('x', float_dt), ('y', float_dt),
+                                              ('dp', float_dt), ('bot_idx', int_dt)])
+        nodes['x'], nodes['y'], nodes['dp'], nodes['bot_idx'] = x, y, depth, bot_idx
+        outfile.write(nodes.tobytes())
+        for element in elements:
+            outfile.write(np.array([len(element)] + list(element), dtype=int_dt).tobytes())
+        for t, step_eta, step_values in zip(times, eta, values):
+            outfile.write(np.array([t], dtype=float_dt).tobytes())
+            outfile.write(np.array([int(t // 900)], dtype=int_dt).tobytes())
+            outfile.write(np.asarray(step_eta, dtype=float_dt).tobytes())
+            outfile.write(np.asarray(step_values, dtype=float_dt).tobytes())